@@ -0,0 +1,56 @@
+"""audience segments
+
+Revision ID: 028a35bbc622
+Revises: e80dd0ae6406
+Create Date: 2026-10-17 13:02:47.551094
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '028a35bbc622'
+down_revision: Union[str, None] = 'e80dd0ae6406'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('segments',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_segments_name'), 'segments', ['name'], unique=True)
+    op.create_table('segment_members',
+    sa.Column('segment_id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['segment_id'], ['segments.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('segment_id', 'user_id')
+    )
+    op.create_table('user_tags',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('tag', sa.String(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('user_id', 'tag')
+    )
+    op.create_index('ix_user_tags_tag_user_id', 'user_tags', ['tag', 'user_id'], unique=False)
+    op.add_column('notifications', sa.Column('audience', sa.JSON(), nullable=True))
+    op.create_index('ix_users_subscribed', 'users', ['id'], unique=False,
+                    postgresql_where=sa.text('receive_notifications = true'),
+                    sqlite_where=sa.text('receive_notifications = 1'))
+
+
+def downgrade() -> None:
+    op.drop_index('ix_users_subscribed', table_name='users')
+    op.drop_column('notifications', 'audience')
+    op.drop_index('ix_user_tags_tag_user_id', table_name='user_tags')
+    op.drop_table('user_tags')
+    op.drop_table('segment_members')
+    op.drop_index(op.f('ix_segments_name'), table_name='segments')
+    op.drop_table('segments')
@@ -0,0 +1,36 @@
+"""priority lanes and scheduling
+
+Revision ID: 5e1c9b7f3a26
+Revises: 86c346e1aafd
+Create Date: 2026-10-17 22:05:12.318604
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5e1c9b7f3a26'
+down_revision: Union[str, None] = '86c346e1aafd'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('scheduled_notifications',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('send_at', sa.DateTime(), nullable=False),
+    sa.Column('payload', sa.JSON(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_scheduled_notifications_send_at'), 'scheduled_notifications', ['send_at'], unique=False)
+    op.add_column('notifications', sa.Column('priority', sa.String(), server_default='normal', nullable=False))
+
+
+def downgrade() -> None:
+    op.drop_column('notifications', 'priority')
+    op.drop_index(op.f('ix_scheduled_notifications_send_at'), table_name='scheduled_notifications')
+    op.drop_table('scheduled_notifications')
@@ -0,0 +1,45 @@
+"""broadcast delivery
+
+Revision ID: 86c346e1aafd
+Revises: a30b2117e75a
+Create Date: 2026-10-17 21:18:40.552961
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '86c346e1aafd'
+down_revision: Union[str, None] = 'a30b2117e75a'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('subscription_periods',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('started_at', sa.DateTime(), nullable=False),
+    sa.Column('ended_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_subscription_periods_user_id'), 'subscription_periods', ['user_id'], unique=False)
+    # Текущие подписчики подписаны с момента миграции: общих рассылок раньше не было
+    op.execute('INSERT INTO subscription_periods (user_id, started_at) '
+               'SELECT id, CURRENT_TIMESTAMP FROM users WHERE receive_notifications = true')
+
+    op.add_column('notifications', sa.Column('delivery', sa.String(), server_default='fanout', nullable=False))
+    op.create_index('ix_notifications_broadcast', 'notifications', ['id'], unique=False,
+                    postgresql_where=sa.text("delivery = 'broadcast'"),
+                    sqlite_where=sa.text("delivery = 'broadcast'"))
+
+
+def downgrade() -> None:
+    op.drop_index('ix_notifications_broadcast', table_name='notifications')
+    op.drop_column('notifications', 'delivery')
+    op.drop_index(op.f('ix_subscription_periods_user_id'), table_name='subscription_periods')
+    op.drop_table('subscription_periods')
@@ -0,0 +1,43 @@
+"""notification pagination
+
+Revision ID: 8978c66a1c2b
+Revises: cfae7a1a0013
+Create Date: 2026-10-17 10:12:31.402118
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8978c66a1c2b'
+down_revision: Union[str, None] = 'cfae7a1a0013'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Раньше таблицу связей создавал create_all при старте приложения, а не миграции
+    if sa.inspect(op.get_bind()).has_table('user_notifications'):
+        op.add_column('user_notifications', sa.Column('read_at', sa.DateTime(), nullable=True))
+    else:
+        op.create_table('user_notifications',
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('notification_id', sa.Integer(), nullable=False),
+        sa.Column('read_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['notification_id'], ['notifications.id'], ),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+        sa.PrimaryKeyConstraint('user_id', 'notification_id')
+        )
+    op.create_index('ix_user_notifications_unread', 'user_notifications',
+                    ['user_id', sa.text('notification_id DESC')], unique=False,
+                    postgresql_where=sa.text('read_at IS NULL'), sqlite_where=sa.text('read_at IS NULL'))
+    op.create_index(op.f('ix_notifications_created_at'), 'notifications', ['created_at'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_notifications_created_at'), table_name='notifications')
+    op.drop_index('ix_user_notifications_unread', table_name='user_notifications')
+    op.drop_column('user_notifications', 'read_at')
@@ -0,0 +1,84 @@
+"""notification retention
+
+Revision ID: a30b2117e75a
+Revises: b7d2e4a91c35
+Create Date: 2026-10-17 20:44:51.207316
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a30b2117e75a'
+down_revision: Union[str, None] = 'b7d2e4a91c35'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Начальная нарезка секций; дальше секции создаёт workers/retention.py по RETENTION_PARTITION_SIZE
+PARTITION_SIZE = 100000
+PARTITIONS_AHEAD = 2
+
+
+def _create_link_table(**kw) -> None:
+    op.create_table('user_notifications',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('notification_id', sa.Integer(), nullable=False),
+    sa.Column('read_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['notification_id'], ['notifications.id'], ),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('user_id', 'notification_id'),
+    **kw
+    )
+
+
+def _create_link_indexes() -> None:
+    op.create_index('ix_user_notifications_unread', 'user_notifications',
+                    ['user_id', sa.text('notification_id DESC')], unique=False,
+                    postgresql_where=sa.text('read_at IS NULL'))
+
+
+def _rename_old_link_table() -> None:
+    op.execute('ALTER TABLE user_notifications RENAME TO user_notifications_old')
+    op.execute('ALTER TABLE user_notifications_old RENAME CONSTRAINT user_notifications_pkey '
+               'TO user_notifications_old_pkey')
+    op.drop_index('ix_user_notifications_unread', table_name='user_notifications_old')
+
+
+def _copy_old_links() -> None:
+    op.execute('INSERT INTO user_notifications (user_id, notification_id, read_at) '
+               'SELECT user_id, notification_id, read_at FROM user_notifications_old')
+    op.drop_table('user_notifications_old')
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    if bind.dialect.name != 'postgresql':
+        op.create_index('ix_user_notifications_notification_id', 'user_notifications',
+                        ['notification_id', 'user_id'], unique=False)
+        return
+
+    # Таблица связей пересоздаётся секционированной по notification_id и заполняется из старой.
+    # Индексы строятся после копирования; на большой базе миграция долгая — выполнять в окно обслуживания.
+    _rename_old_link_table()
+    _create_link_table(postgresql_partition_by='RANGE (notification_id)')
+    op.execute('CREATE TABLE user_notifications_default PARTITION OF user_notifications DEFAULT')
+    max_id = bind.execute(sa.text('SELECT coalesce(max(id), 0) FROM notifications')).scalar()
+    for start in range(0, (max_id // PARTITION_SIZE + 1 + PARTITIONS_AHEAD) * PARTITION_SIZE, PARTITION_SIZE):
+        op.execute(f'CREATE TABLE user_notifications_p{start} PARTITION OF user_notifications '
+                   f'FOR VALUES FROM ({start}) TO ({start + PARTITION_SIZE})')
+    _copy_old_links()
+    _create_link_indexes()
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name != 'postgresql':
+        op.drop_index('ix_user_notifications_notification_id', table_name='user_notifications')
+        return
+
+    _rename_old_link_table()
+    _create_link_table()
+    _copy_old_links()
+    _create_link_indexes()
@@ -0,0 +1,31 @@
+"""delivery channels
+
+Revision ID: b7d2e4a91c35
+Revises: 5b1f0c7d9e42
+Create Date: 2026-10-17 15:02:19.774203
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b7d2e4a91c35'
+down_revision: Union[str, None] = '5b1f0c7d9e42'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('notifications', sa.Column('channels', sa.JSON(), nullable=True))
+    op.add_column('users', sa.Column('webhook_url', sa.String(), nullable=True))
+    op.add_column('notification_shards', sa.Column('delivery_published', sa.Boolean(), server_default=sa.false(),
+                                                   nullable=False))
+
+
+def downgrade() -> None:
+    op.drop_column('notification_shards', 'delivery_published')
+    op.drop_column('users', 'webhook_url')
+    op.drop_column('notifications', 'channels')
@@ -0,0 +1,179 @@
+import hashlib
+import logging
+import re
+import time
+
+import jwt
+from fastapi import Depends, HTTPException, Query
+from fastapi.security import OAuth2PasswordBearer
+from redis.exceptions import RedisError
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette import status
+
+from app.core.cache import TTLCache
+from app.core.config import settings
+from app.core.metrics import aggregated_log, cache_collector
+from app.core.read_your_writes import recent_writes
+from app.core.redis import redis_pool
+from app.crud.user import get_user_by_username
+from app.models.base import AsyncSessionLocal, get_read_db
+from app.schemas.user import CurrentUser
+
+#oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
+oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/v1/auth/token")
+optional_oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/v1/auth/token", auto_error=False)
+
+# Назначение токена потока (claim scope): он принимается только /stream, токен входа — всеми маршрутами, кроме ?token=
+STREAM_TOKEN_SCOPE = "stream"
+TOKEN_QUERY_PARAM = re.compile(r"([?&]token=)[^&\s]+")
+
+
+class RedactTokenFilter(logging.Filter):
+    """Скрывает значение ?token= в записях лога: access-лог uvicorn пишет полный URL запроса."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if isinstance(record.args, tuple):
+            record.args = tuple(TOKEN_QUERY_PARAM.sub(r"\1***", arg) if isinstance(arg, str) else arg
+                                for arg in record.args)
+        return True
+
+
+class RevokedTokens:
+    """
+    Список отозванных токенов (deny-list).
+    Хранится в Redis (sorted set: jti -> exp) и копируется в память процесса не чаще раза в sync_interval,
+    поэтому проверка токена не требует обращения к Redis на каждый запрос.
+    """
+
+    KEY = "revoked_tokens"
+
+    def __init__(self, sync_interval: float):
+        self._sync_interval = sync_interval
+        self._synced_at = float("-inf")
+        self._local: dict[str, float] = {}
+
+    async def revoke(self, jti: str, exp: float) -> bool:
+        """Отзывает токен; False — Redis недоступен и отзыв действует только в этом процессе."""
+        self._local[jti] = exp
+        try:
+            with redis_pool.guard("revoke_token"):
+                # Добавление и чистка истёкших записей — одним обращением
+                pipe = redis_pool.client.pipeline()
+                pipe.zadd(self.KEY, {jti: exp})
+                pipe.zremrangebyscore(self.KEY, "-inf", time.time())
+                await pipe.execute()
+        except RedisError:
+            aggregated_log.event("⚠️ Ошибок при сохранении отозванного токена в Redis", logging.ERROR)
+            return False
+        return True
+
+    async def is_revoked(self, jti: str) -> bool:
+        if time.monotonic() - self._synced_at > self._sync_interval:
+            await self._sync()
+        exp = self._local.get(jti)
+        return exp is not None and exp > time.time()
+
+    async def _sync(self):
+        self._synced_at = time.monotonic()
+        try:
+            with redis_pool.guard("sync_revoked_tokens"):
+                entries = await redis_pool.client.zrangebyscore(self.KEY, time.time(), "+inf", withscores=True)
+        except RedisError:
+            aggregated_log.event("⚠️ Ошибок при чтении отозванных токенов из Redis", logging.ERROR)
+            return
+
+        now = time.time()
+        revoked = {jti: exp for jti, exp in self._local.items() if exp > now}
+        revoked.update(entries)
+        self._local = revoked
+
+
+revoked_tokens = RevokedTokens(settings.TOKEN_DENYLIST_SYNC_INTERVAL)
+
+# token -> (username, jti, scope), живёт не дольше самого токена
+token_cache = TTLCache(settings.TOKEN_CACHE_SIZE, settings.TOKEN_CACHE_TTL)
+# username -> CurrentUser
+user_cache = TTLCache(settings.USER_CACHE_SIZE, settings.USER_CACHE_TTL)
+cache_collector.register("token", token_cache)
+cache_collector.register("user", user_cache)
+
+
+def get_token_id(token: str, payload: dict) -> str:
+    # У старых токенов нет jti — для них идентификатором служит хеш самого токена
+    return payload.get("jti") or hashlib.sha256(token.encode()).hexdigest()
+
+
+def decode_token(token: str) -> dict:
+    try:
+        return jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+    except jwt.ExpiredSignatureError:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Token has expired")
+    except jwt.PyJWTError:
+        aggregated_log.event("❌ Отклонено недействительных токенов", logging.WARNING)
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
+
+
+async def authenticate(token: str, db: AsyncSession, scope: str | None = None) -> CurrentUser:
+    """
+    Проверяет JWT локально и возвращает пользователя; повторные запросы с тем же токеном идут из кеша.
+    scope — назначение токена: None — токен входа, STREAM_TOKEN_SCOPE — токен потока; другие токены отклоняются.
+    """
+    cached = token_cache.get(token)
+    if cached:
+        username, jti, token_scope = cached
+    else:
+        payload = decode_token(token)
+        username = payload.get("sub")
+        if not username:
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
+        jti = get_token_id(token, payload)
+        token_scope = payload.get("scope")
+        token_cache.set(token, (username, jti, token_scope), ttl=payload.get("exp", 0) - time.time())
+
+    if token_scope != scope or await revoked_tokens.is_revoked(jti):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
+
+    user = user_cache.get(username)
+    if user is None:
+        await recent_writes.route(db, username)
+        db_user = await get_user_by_username(db, username)
+        if db_user is None:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
+        user = CurrentUser.model_validate(db_user)
+        user_cache.set(username, user)
+
+    return user
+
+
+async def get_current_user(
+        token: str = Depends(oauth2_scheme),
+        db: AsyncSession = Depends(get_read_db),
+) -> CurrentUser:
+    return await authenticate(token, db)
+
+
+async def get_user_read_db(
+        user: CurrentUser = Depends(get_current_user),
+        db: AsyncSession = Depends(get_read_db),
+) -> AsyncSession:
+    """Сессия чтения данных пользователя: реплика, а после его недавней записи — основная БД."""
+    await recent_writes.route(db, user.username)
+    return db
+
+
+async def get_stream_user(
+        header_token: str | None = Depends(optional_oauth2_scheme),
+        token: str | None = Query(None, description="Токен потока из POST /stream/token "
+                                                    "для клиентов без заголовков (EventSource в браузере)"),
+) -> CurrentUser:
+    """
+    Пользователь для долгих потоков: сессия БД открывается только на время проверки, а не на всё соединение.
+    В заголовке — токен входа; в ?token= — только короткий токен потока: URL попадает в логи сервера и прокси.
+    """
+    if not header_token and not token:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Not authenticated",
+                            headers={"WWW-Authenticate": "Bearer"})
+    async with AsyncSessionLocal() as db:
+        if header_token:
+            return await authenticate(header_token, db)
+        return await authenticate(token, db, scope=STREAM_TOKEN_SCOPE)
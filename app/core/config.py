@@ -1,23 +1,187 @@
 from pydantic_settings import BaseSettings
-from dotenv import load_dotenv
 
 
 class Settings(BaseSettings):
-    load_dotenv()
-
+    # Значения берутся из окружения и файла .env (Config.env_file); os.environ при этом не меняется
     DATABASE_URL: str
     POSTGRES_PASSWORD: str
     POSTGRES_PORT: int
+    # Пул соединений с БД (для SQLite не применяется)
+    DB_POOL_SIZE: int = 10
+    DB_MAX_OVERFLOW: int = 20
+    DB_POOL_TIMEOUT: float = 30.0
+    DB_POOL_RECYCLE: int = 1800
+    DB_POOL_PRE_PING: bool = True
+    # Реплика для чтения (пусто — все запросы идут в основную БД): маршруты чтения отправляют в неё SELECT.
+    # После своей записи пользователь READ_YOUR_WRITES_WINDOW секунд читает из основной БД — окно должно
+    # превышать обычное отставание реплики
+    READ_DATABASE_URL: str = ""
+    READ_YOUR_WRITES_WINDOW: float = 5.0
     REDIS_HOST: str = "localhost"
     REDIS_PORT: int = 6379
     REDIS_DB: int = 0
+    # Пул Redis: соединений на процесс, таймауты (с), проверка простаивающих соединений и предохранитель
+    REDIS_MAX_CONNECTIONS: int = 50
+    REDIS_SOCKET_TIMEOUT: float = 0.5
+    REDIS_CONNECT_TIMEOUT: float = 0.5
+    REDIS_HEALTH_CHECK_INTERVAL: int = 30
+    REDIS_BREAKER_THRESHOLD: int = 5
+    REDIS_BREAKER_RESET_TIMEOUT: float = 10.0
+    RABBITMQ_HOST: str = "localhost"
+    RABBITMQ_PORT: int = 5672
+    RABBITMQ_USER: str = "guest"
+    RABBITMQ_PASSWORD: str = "guest"
+    NOTIFICATION_QUEUE: str = "notification_tasks"
+    NOTIFICATION_SHARD_QUEUE: str = "notification_shards"
+    NOTIFICATION_DEAD_LETTER_QUEUE: str = "notification_tasks.dead"
+    NOTIFICATION_DELIVERY_QUEUE: str = "notification_deliveries"
+    # Формат задач notification_tasks: msgpack — конверты до NOTIFICATION_ENVELOPE_MAX_TASKS задач со снимком
+    # уведомления, json — прежний формат по задаче в сообщении (для отката, пока не обновлены все воркеры)
+    NOTIFICATION_ENVELOPE_FORMAT: str = "msgpack"
+    NOTIFICATION_ENVELOPE_MAX_TASKS: int = 20
+    # Издатель API: размер пула каналов и пауза между попытками подключения
+    RABBITMQ_CHANNEL_POOL_SIZE: int = 4
+    RABBITMQ_RECONNECT_INTERVAL: float = 5.0
+    # Outbox: сообщений в одной пачке публикации и интервал опроса таблицы, если новых записей не было
+    OUTBOX_RELAY_ENABLED: bool = True
+    OUTBOX_BATCH_SIZE: int = 500
+    OUTBOX_POLL_INTERVAL: float = 1.0
+    # Отложенные уведомления: записей scheduled_notifications за одну пачку и интервал опроса наступивших (с)
+    SCHEDULER_ENABLED: bool = True
+    SCHEDULER_BATCH_SIZE: int = 500
+    SCHEDULER_POLL_INTERVAL: float = 1.0
+    # Максимум уведомлений в одном запросе /send_notifications/batch
+    NOTIFICATION_BATCH_MAX_SIZE: int = 1000
     SECRET_KEY: str
     ALGORITHM: str
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
+    # Кеш проверенных токенов и пользователей в памяти процесса, синхронизация списка отозванных токенов
+    TOKEN_CACHE_SIZE: int = 10000
+    TOKEN_CACHE_TTL: float = 300.0
+    USER_CACHE_SIZE: int = 10000
+    USER_CACHE_TTL: float = 60.0
+    # username -> id: пользователи не переименовываются, поэтому запись может жить долго
+    USER_ID_CACHE_SIZE: int = 100000
+    USER_ID_CACHE_TTL: float = 3600.0
+    TOKEN_DENYLIST_SYNC_INTERVAL: float = 5.0
+    # bcrypt: стоимость хеша, потоки пула и сколько операций может ждать в очереди до ответа 503
+    BCRYPT_ROUNDS: int = 12
+    PASSWORD_HASH_WORKERS: int = 4
+    PASSWORD_HASH_QUEUE_LIMIT: int = 32
+
+    # Повторы /send_notifications: TTL ключа Idempotency-Key (с) и окно объединения одинаковых уведомлений (с, 0 — выключено)
+    IDEMPOTENCY_KEY_TTL: int = 86400
+    # Пока уведомление по первому запросу создаётся, ключ живёт IDEMPOTENCY_PENDING_TTL секунд:
+    # если процесс упал между claim и коммитом, повтор пройдёт после этой паузы, а не через сутки
+    IDEMPOTENCY_PENDING_TTL: int = 30
+    NOTIFICATION_COALESCE_WINDOW: int = 0
+
+    # Лимиты запросов (token bucket в Redis): маршрут -> "N/second|minute|hour|day" на отправителя;
+    # исключения для отдельных отправителей — "маршрут:user:имя" или "маршрут:ip:адрес" -> лимит.
+    # При больших лимитах процесс берёт из Redis сразу долю LEASE_FRACTION ёмкости и тратит её LEASE_TTL секунд.
+    RATE_LIMIT_ENABLED: bool = True
+    RATE_LIMITS: dict[str, str] = {
+        "login": "10/minute",
+        "register": "5/minute",
+        "send": "60/minute",
+        "send_batch": "10/minute",
+    }
+    RATE_LIMIT_OVERRIDES: dict[str, str] = {}
+    RATE_LIMIT_LEASE_FRACTION: float = 0.05
+    RATE_LIMIT_LEASE_TTL: float = 1.0
+    RATE_LIMIT_LOCAL_SIZE: int = 100000
+
+    # Кеш входящих в Redis: можно отключить при деплое; размер окна (уведомлений на пользователя) и TTL ключей
+    INBOX_CACHE_ENABLED: bool = True
+    INBOX_CACHE_SIZE: int = 100
+    INBOX_CACHE_TTL: int = 3600
+
+    # Воркер: число процессов-потребителей и неподтверждённых сообщений на очередь в процессе
+    WORKER_PROCESSES: int = 1
+    WORKER_PREFETCH: int = 10
+    # Доли полос normal и low, когда в обеих есть сообщения; high всегда обрабатывается первой
+    NOTIFICATION_PRIORITY_WEIGHTS: dict[str, int] = {"normal": 4, "low": 1}
+    # Порт метрик Prometheus первого процесса воркера (у i-го — порт + i); 0 — не поднимать
+    WORKER_METRICS_PORT: int = 9100
+
+    # Однотипные события горячего пути пишутся в лог одной строкой раз в LOG_AGGREGATE_INTERVAL секунд
+    LOG_AGGREGATE_INTERVAL: float = 10.0
+
+    # Доставка по внешним каналам: получателей в одной задаче, задач в работе на процесс,
+    # паузы перед повторными попытками (с) — по одной отложенной очереди на паузу
+    DELIVERY_BATCH_SIZE: int = 500
+    DELIVERY_PREFETCH: int = 20
+    DELIVERY_RETRY_DELAYS: list[int] = [10, 60, 600]
+    DELIVERY_METRICS_PORT: int = 9200
+    # SMTP: параллельных сессий (переиспользуются), лимит писем в секунду (0 — без лимита)
+    SMTP_HOST: str = "localhost"
+    SMTP_PORT: int = 25
+    SMTP_USER: str = ""
+    SMTP_PASSWORD: str = ""
+    SMTP_USE_TLS: bool = False
+    SMTP_FROM: str = "noreply@example.com"
+    SMTP_CONCURRENCY: int = 10
+    SMTP_RATE_LIMIT: float = 50.0
+    SMTP_TIMEOUT: float = 10.0
+    # Webhook: параллельных запросов (keep-alive соединений), лимит запросов в секунду (0 — без лимита)
+    WEBHOOK_CONCURRENCY: int = 100
+    WEBHOOK_RATE_LIMIT: float = 0.0
+    WEBHOOK_TIMEOUT: float = 5.0
+    # Webhook на loopback, частные и link-local адреса запрещены (SSRF); включать только для локальной разработки
+    WEBHOOK_ALLOW_PRIVATE_ADDRESSES: bool = False
+
+    # Push новых уведомлений (SSE): канал Redis pub/sub, получателей в одном сообщении канала,
+    # очередь событий на подключение, интервал heartbeat (с) и максимум подключений на процесс
+    PUSH_ENABLED: bool = True
+    PUSH_CHANNEL: str = "notifications:push"
+    PUSH_BATCH_SIZE: int = 1000
+    PUSH_QUEUE_SIZE: int = 100
+    PUSH_HEARTBEAT_INTERVAL: float = 15.0
+    PUSH_MAX_CONNECTIONS: int = 50000
+    PUSH_RECONNECT_INTERVAL: float = 5.0
+    # Токен потока для ?token= (EventSource): только для /stream, живёт STREAM_TOKEN_TTL секунд
+    STREAM_TOKEN_TTL: int = 300
+
+    # Хранение истории: уведомления старше RETENTION_DAYS дней (0 — хранить всегда) архивируются и удаляются.
+    # Архив — CSV.gz в RETENTION_ARCHIVE_DIR (пусто — удалять без архива); удаление пачками по RETENTION_BATCH_SIZE,
+    # на PostgreSQL — секциями по RETENTION_PARTITION_SIZE уведомлений, RETENTION_PARTITIONS_AHEAD секций создаются заранее
+    RETENTION_DAYS: int = 180
+    RETENTION_ARCHIVE_DIR: str = "archive"
+    RETENTION_BATCH_SIZE: int = 10000
+    RETENTION_PARTITION_SIZE: int = 100000
+    RETENTION_PARTITIONS_AHEAD: int = 2
+    RETENTION_INTERVAL: float = 3600.0
+
+    # Fan-out: 0 — один INSERT ... SELECT, иначе размер пачки (коммит на каждую пачку)
+    FANOUT_BATCH_SIZE: int = 0
+    # Рассылка делится на части по FANOUT_SHARD_SIZE id пользователей (0 — одна часть)
+    FANOUT_SHARD_SIZE: int = 50000
 
     class Config:
         env_file = ".env"
         env_file_encoding = "utf-8"
 
+    @staticmethod
+    def _async_url(url: str) -> str:
+        # Тот же адрес, но с асинхронным драйвером: asyncpg для Postgres, aiosqlite для SQLite
+        for prefix, async_prefix in (("postgresql+psycopg2://", "postgresql+asyncpg://"),
+                                     ("postgresql://", "postgresql+asyncpg://"),
+                                     ("sqlite://", "sqlite+aiosqlite://")):
+            if url.startswith(prefix):
+                return async_prefix + url[len(prefix):]
+        return url
+
+    @property
+    def ASYNC_DATABASE_URL(self) -> str:
+        return self._async_url(self.DATABASE_URL)
+
+    @property
+    def ASYNC_READ_DATABASE_URL(self) -> str:
+        return self._async_url(self.READ_DATABASE_URL) if self.READ_DATABASE_URL else ""
+
+    @property
+    def RABBITMQ_URL(self) -> str:
+        return f"amqp://{self.RABBITMQ_USER}:{self.RABBITMQ_PASSWORD}@{self.RABBITMQ_HOST}:{self.RABBITMQ_PORT}/"
+
 
 settings = Settings()
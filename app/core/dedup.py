@@ -0,0 +1,156 @@
+import hashlib
+import json
+import logging
+
+from redis.exceptions import RedisError
+
+from app.core.config import settings
+from app.core.metrics import NOTIFICATIONS_DEDUPLICATED, aggregated_log
+from app.core.redis import RedisPool, redis_pool
+from app.schemas.notification import NotificationCreate
+
+# Значение ключа, пока уведомление по первому запросу ещё не создано
+PENDING = "pending"
+# Префикс значения ключа для отложенного уведомления: s:<id записи scheduled_notifications>
+SCHEDULED_PREFIX = "s:"
+# Префикс значения ключа пачки: b:<JSON с ids и scheduled_ids>
+BATCH_PREFIX = "b:"
+
+
+def fingerprint(notifications: list[NotificationCreate]) -> str:
+    """sha256 тела запроса: по нему повтор с тем же ключом отличается от другого запроса."""
+    digest = hashlib.sha256()
+    for notification in notifications:
+        digest.update(notification.model_dump_json().encode())
+        digest.update(b"\n")
+    return digest.hexdigest()
+
+
+class SendClaim:
+    """
+    Результат claim: claimed=False — повтор; у повтора notification_id — уже созданное уведомление,
+    scheduled_id — запланированное, batch — ids и scheduled_ids пачки (все None, если первый запрос ещё выполняется).
+    conflict=True — ключ уже занят запросом с другим телом.
+    """
+
+    def __init__(self, key: str | None, ttl: int, claimed: bool, fingerprint: str = "",
+                 notification_id: int | None = None, scheduled_id: int | None = None, batch: dict | None = None,
+                 conflict: bool = False):
+        self.key = key
+        self.ttl = ttl
+        self.claimed = claimed
+        self.fingerprint = fingerprint
+        self.notification_id = notification_id
+        self.scheduled_id = scheduled_id
+        self.batch = batch
+        self.conflict = conflict
+
+
+class NotificationDeduplicator:
+    """
+    Защита /send_notifications и /send_notifications/batch от повторов в Redis.
+    - idempotency:{principal}:{key} (idempotency_batch:... для пачек) — ключ из заголовка Idempotency-Key
+      в пространстве отправителя, живёт key_ttl секунд;
+    - coalesce:{sha256} — хеш содержимого (заголовок, текст, получатели, каналы), живёт coalesce_window секунд:
+      одинаковые уведомления в пределах окна объединяются в одну рассылку.
+    Значение ключа — "<sha256 тела> <состояние>": повтор ключа с другим телом получает conflict, а не чужой id.
+    Ключ занимается атомарно (SET NX) на pending_ttl секунд, после коммита в него записывается id уведомления
+    и полный TTL: ключ, брошенный упавшим запросом, не блокирует повторы дольше pending_ttl.
+    Если Redis недоступен, запрос проходит без проверки: дубль лучше потерянного уведомления.
+    """
+
+    def __init__(self, pool: RedisPool, key_ttl: int, pending_ttl: int, coalesce_window: int):
+        self._pool = pool
+        self._key_ttl = key_ttl
+        self._pending_ttl = pending_ttl
+        self._coalesce_window = coalesce_window
+
+    def _key(self, digest: str, idempotency_key: str | None, principal: str) -> tuple[str | None, int]:
+        if idempotency_key:
+            return f"idempotency:{principal}:{idempotency_key}", self._key_ttl
+        if self._coalesce_window > 0:
+            return f"coalesce:{digest}", self._coalesce_window
+        return None, 0
+
+    async def claim(self, notification: NotificationCreate, idempotency_key: str | None = None,
+                    principal: str = "") -> SendClaim:
+        digest = fingerprint([notification])
+        key, ttl = self._key(digest, idempotency_key, principal)
+        if key is None:
+            return SendClaim(None, 0, claimed=True)
+        claim = await self._claim(key, ttl, digest)
+        if not claim.claimed and not claim.conflict:
+            NOTIFICATIONS_DEDUPLICATED.labels("idempotency_key" if idempotency_key else "coalesced").inc()
+        return claim
+
+    async def claim_batch(self, batch: list[NotificationCreate], idempotency_key: str | None,
+                          principal: str = "") -> SendClaim:
+        """Пачка защищается только Idempotency-Key: объединять одинаковые пачки по содержимому незачем."""
+        if not idempotency_key:
+            return SendClaim(None, 0, claimed=True)
+        claim = await self._claim(f"idempotency_batch:{principal}:{idempotency_key}", self._key_ttl,
+                                  fingerprint(batch))
+        if not claim.claimed and not claim.conflict:
+            NOTIFICATIONS_DEDUPLICATED.labels("idempotency_key").inc()
+        return claim
+
+    async def _claim(self, key: str, ttl: int, digest: str) -> SendClaim:
+        try:
+            with self._pool.guard("dedup_claim"):
+                # MULTI: занять ключ и прочитать текущее значение одной атомарной операцией
+                pipe = self._pool.client.pipeline(transaction=True)
+                pipe.set(key, f"{digest} {PENDING}", nx=True, ex=min(self._pending_ttl, ttl))
+                pipe.get(key)
+                claimed, value = await pipe.execute()
+        except RedisError:
+            aggregated_log.event("⚠️ Уведомлений отправлено без проверки повторов (Redis недоступен)", logging.ERROR)
+            return SendClaim(None, 0, claimed=True)
+
+        if claimed:
+            return SendClaim(key, ttl, claimed=True, fingerprint=digest)
+        stored_digest, _, state = (value or "").partition(" ")
+        if stored_digest != digest:
+            return SendClaim(key, ttl, claimed=False, conflict=True)
+        if state.startswith(SCHEDULED_PREFIX):
+            return SendClaim(key, ttl, claimed=False, scheduled_id=int(state[len(SCHEDULED_PREFIX):]))
+        if state.startswith(BATCH_PREFIX):
+            return SendClaim(key, ttl, claimed=False, batch=json.loads(state[len(BATCH_PREFIX):]))
+        return SendClaim(key, ttl, claimed=False,
+                         notification_id=int(state) if state and state != PENDING else None)
+
+    async def complete(self, claim: SendClaim, notification_id: int | None = None, scheduled_id: int | None = None):
+        """Записывает в ключ созданное уведомление или, для отложенной отправки, запись scheduled_notifications."""
+        state = notification_id if scheduled_id is None else f"{SCHEDULED_PREFIX}{scheduled_id}"
+        await self._complete(claim, state)
+
+    async def complete_batch(self, claim: SendClaim, ids: list[int | None], scheduled_ids: list[int | None]):
+        """Записывает в ключ ответ на пачку: повтор получит те же ids и scheduled_ids."""
+        await self._complete(claim, BATCH_PREFIX + json.dumps({"ids": ids, "scheduled_ids": scheduled_ids}))
+
+    async def _complete(self, claim: SendClaim, state):
+        if claim.key is None:
+            return
+        try:
+            with self._pool.guard("dedup_complete"):
+                await self._pool.client.set(claim.key, f"{claim.fingerprint} {state}", ex=claim.ttl, xx=True)
+        except RedisError:
+            # Ключ останется со значением pending до истечения pending_ttl: ближайшие повторы всё равно отсекаются
+            aggregated_log.event("⚠️ Ошибок при сохранении id уведомления для повторов", logging.ERROR)
+
+    async def release(self, claim: SendClaim):
+        """Освобождает ключ, если уведомление создать не удалось, — повтор запроса должен пройти."""
+        if claim.key is None:
+            return
+        try:
+            with self._pool.guard("dedup_release"):
+                await self._pool.client.delete(claim.key)
+        except RedisError:
+            aggregated_log.event("⚠️ Ошибок при освобождении ключа повторов", logging.ERROR)
+
+
+notification_deduplicator = NotificationDeduplicator(
+    redis_pool,
+    key_ttl=settings.IDEMPOTENCY_KEY_TTL,
+    pending_ttl=settings.IDEMPOTENCY_PENDING_TTL,
+    coalesce_window=settings.NOTIFICATION_COALESCE_WINDOW,
+)
@@ -0,0 +1,89 @@
+import json
+from datetime import datetime
+
+import msgpack
+
+# Конверт задач очереди notification_tasks: msgpack {"v": версия, "tasks": [задача, ...]}.
+# В версии 1 задача — массив значений TASK_FIELDS в этом порядке (имена полей не повторяются в каждой задаче),
+# последним элементом может идти словарь остальных полей. Новые поля — только с новой версией.
+# Задачи без конверта — JSON-объект одной задачи от прежних издателей — воркер принимает так же.
+ENVELOPE_VERSION = 1
+ENVELOPE_CONTENT_TYPE = "application/msgpack"
+TASK_FIELDS = ("notification_id", "title", "message", "created_at", "audience", "channels", "delivery", "priority")
+
+# Снимок уведомления в задаче: с ним воркер не перечитывает строку notifications.
+# Уведомление после создания не меняется, поэтому снимку можно доверять.
+SNAPSHOT_FIELDS = TASK_FIELDS[1:]
+
+
+class EnvelopeError(ValueError):
+    """Сообщение, которое воркер не сможет разобрать ни при каком повторе."""
+
+
+def notification_task(notification_id: int, created_at: datetime, notification) -> dict:
+    """Задача планирования рассылки со снимком уведомления (NotificationCreate или строка Notification)."""
+    audience = notification.audience
+    if audience is not None and not isinstance(audience, dict):
+        audience = audience.model_dump(exclude_none=True)
+    return {
+        "notification_id": notification_id,
+        "title": notification.title,
+        "message": notification.message,
+        "created_at": created_at.isoformat(),
+        "audience": audience,
+        "channels": notification.channels or None,
+        "delivery": notification.delivery,
+        "priority": notification.priority,
+    }
+
+
+def has_snapshot(task: dict) -> bool:
+    """Снимок есть у задач новых издателей; у задач прежних издателей — только notification_id, title, message."""
+    return task.get("created_at") is not None
+
+
+def encode_tasks(tasks: list[dict], envelope_format: str = "msgpack") -> tuple[bytes, str]:
+    """Тело сообщения и content_type; json — прежний формат, по задаче в сообщении (для отката)."""
+    if envelope_format == "json":
+        [task] = tasks
+        return json.dumps(task).encode(), "application/json"
+    rows = []
+    for task in tasks:
+        row = [task.get(field) for field in TASK_FIELDS]
+        extra = {key: value for key, value in task.items() if key not in TASK_FIELDS}
+        if extra:
+            row.append(extra)
+        rows.append(row)
+    return msgpack.packb({"v": ENVELOPE_VERSION, "tasks": rows}), ENVELOPE_CONTENT_TYPE
+
+
+def pack_tasks(tasks: list[dict], max_tasks: int, envelope_format: str = "msgpack") -> list[tuple[bytes, str]]:
+    """Раскладывает задачи по сообщениям: не больше max_tasks в конверте, в формате json — по одной."""
+    size = 1 if envelope_format == "json" else max(max_tasks, 1)
+    return [encode_tasks(tasks[start:start + size], envelope_format) for start in range(0, len(tasks), size)]
+
+
+def decode_tasks(body: bytes, content_type: str | None) -> list[dict]:
+    """Задачи из тела сообщения: конверт msgpack или JSON одной задачи; без notification_id — EnvelopeError."""
+    try:
+        if content_type != ENVELOPE_CONTENT_TYPE:
+            task = json.loads(body)
+            task["notification_id"]
+            return [task]
+
+        envelope = msgpack.unpackb(body)
+        if envelope.get("v") != ENVELOPE_VERSION:
+            raise EnvelopeError(f"unsupported envelope version {envelope.get('v')!r}")
+        tasks = []
+        for row in envelope["tasks"]:
+            task = dict(zip(TASK_FIELDS, row))
+            if len(row) > len(TASK_FIELDS):
+                task.update(row[-1])
+            if task["notification_id"] is None:
+                raise EnvelopeError("task without notification_id")
+            tasks.append(task)
+        return tasks
+    except EnvelopeError:
+        raise
+    except (ValueError, TypeError, KeyError, AttributeError) as e:
+        raise EnvelopeError(str(e)) from e
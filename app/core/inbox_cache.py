@@ -0,0 +1,288 @@
+import json
+import logging
+import uuid
+from datetime import datetime
+from typing import Iterable
+
+from redis.exceptions import RedisError
+
+from app.core.config import settings
+from app.core.metrics import aggregated_log, cache_collector
+from app.core.redis import RedisPool, redis_pool
+from app.schemas.notification import NotificationOut
+
+# Добавляет уведомление во входящие пользователя, только если они уже закешированы.
+# Хранится size+1 элемент: служебный элемент "0" (score 0) вытесняется первым, поэтому
+# его наличие означает, что в кеше лежит вся история пользователя.
+# Если кеш сейчас заполняется из БД, id запоминается и в inbox_pending: заполнение допишет его,
+# даже если чтение из БД было раньше коммита связей.
+PUSH_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    redis.call('ZADD', KEYS[1], ARGV[1], ARGV[1])
+    redis.call('ZREMRANGEBYRANK', KEYS[1], 0, -tonumber(ARGV[2]) - 2)
+    redis.call('EXPIRE', KEYS[1], ARGV[3])
+end
+if redis.call('EXISTS', KEYS[2]) == 1 then
+    redis.call('SADD', KEYS[3], ARGV[1])
+    redis.call('EXPIRE', KEYS[3], ARGV[4])
+end
+"""
+
+# Записывает входящие, прочитанные из БД, если заполнение не устарело: метка inbox_filling всё ещё
+# хранит токен этого заполнения (её не перезаписало более позднее заполнение и не удалил invalidate).
+# Уведомления, дописанные воркером во время чтения из БД, сливаются с прочитанными.
+FILL_SCRIPT = """
+if redis.call('GET', KEYS[3]) ~= ARGV[1] then
+    return 0
+end
+redis.call('DEL', KEYS[1], KEYS[2])
+local n = tonumber(ARGV[4])
+for i = 5, 4 + n do
+    redis.call('ZADD', KEYS[1], ARGV[i], ARGV[i])
+end
+for _, id in ipairs(redis.call('SMEMBERS', KEYS[4])) do
+    redis.call('ZADD', KEYS[1], id, id)
+end
+redis.call('ZREMRANGEBYRANK', KEYS[1], 0, -tonumber(ARGV[2]) - 2)
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+redis.call('HSET', KEYS[2], unpack(ARGV, 5 + n))
+redis.call('EXPIRE', KEYS[2], ARGV[3])
+redis.call('DEL', KEYS[3], KEYS[4])
+return 1
+"""
+
+COMPLETE_MARKER = "0"
+# Поля в inbox_read:{user_id}: последняя общая рассылка на момент заполнения и начало подписки
+HORIZON_FIELD = "_b"
+SUBSCRIBED_FIELD = "_s"
+# Сколько секунд заполнение кеша может читать из БД, прежде чем его метка истечёт
+FILL_TIMEOUT = 30
+
+
+class InboxCache:
+    """
+    Кеш входящих пользователя в Redis.
+    - inbox:{user_id} — sorted set последних id уведомлений (не больше size);
+    - inbox_read:{user_id} — hash id -> read_at для прочитанных из этого окна;
+    - notification:{id} — тело уведомления, общее для всех получателей;
+    - inbox_broadcasts — id последних size общих рассылок: они не дописываются в кеш каждого получателя,
+      а сливаются с его входящими при чтении (если вышли после заполнения кеша и пользователь был подписан);
+    - inbox_filling:{user_id}, inbox_pending:{user_id} — токен идущего заполнения и id, дописанные во время него.
+    Все ключи, кроме inbox_broadcasts, живут ttl секунд. Воркер дописывает новые уведомления при fan-out
+    (синхронный клиент), API читает отсюда первую и ближайшие страницы и идёт в БД при промахе (асинхронный клиент).
+    """
+
+    def __init__(self, pool: RedisPool, enabled: bool, size: int, ttl: int):
+        self._pool = pool
+        self.enabled = enabled
+        self._size = size
+        self._ttl = ttl
+        self._push = None
+        self._fill = None
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _inbox_key(user_id: int) -> str:
+        return f"inbox:{user_id}"
+
+    @staticmethod
+    def _read_key(user_id: int) -> str:
+        return f"inbox_read:{user_id}"
+
+    @staticmethod
+    def _filling_key(user_id: int) -> str:
+        return f"inbox_filling:{user_id}"
+
+    @staticmethod
+    def _pending_key(user_id: int) -> str:
+        return f"inbox_pending:{user_id}"
+
+    @staticmethod
+    def _body_key(notification_id: int) -> str:
+        return f"notification:{notification_id}"
+
+    BROADCASTS_KEY = "inbox_broadcasts"
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    def _body(self, notification) -> str:
+        return json.dumps({
+            "id": notification.id,
+            "title": notification.title,
+            "message": notification.message,
+            "created_at": notification.created_at.isoformat(),
+        })
+
+    def push(self, notification, user_ids: Iterable[int], batch_size: int = 1000):
+        """Write-through из воркера: дописывает уведомление в закешированные входящие получателей."""
+        if not self.enabled:
+            return
+        try:
+            with self._pool.guard("inbox_push"):
+                client = self._pool.sync_client
+                if self._push is None:
+                    self._push = client.register_script(PUSH_SCRIPT)
+                client.set(self._body_key(notification.id), self._body(notification), ex=self._ttl)
+                pipe = client.pipeline(transaction=False)
+                for count, user_id in enumerate(user_ids, start=1):
+                    self._push(keys=[self._inbox_key(user_id), self._filling_key(user_id), self._pending_key(user_id)],
+                               args=[notification.id, self._size, self._ttl, FILL_TIMEOUT], client=pipe)
+                    if count % batch_size == 0:
+                        pipe.execute()
+                pipe.execute()
+        except RedisError:
+            aggregated_log.event("⚠️ Ошибок при обновлении кеша входящих в Redis", logging.ERROR)
+
+    def add_broadcast(self, notification):
+        """Из воркера: новая общая рассылка — одна запись, кеши получателей не сбрасываются."""
+        if not self.enabled:
+            return
+        try:
+            with self._pool.guard("inbox_broadcast"):
+                pipe = self._pool.sync_client.pipeline(transaction=False)
+                pipe.set(self._body_key(notification.id), self._body(notification), ex=self._ttl)
+                pipe.zadd(self.BROADCASTS_KEY, {str(notification.id): notification.id})
+                pipe.zremrangebyrank(self.BROADCASTS_KEY, 0, -self._size - 1)
+                pipe.execute()
+        except RedisError:
+            aggregated_log.event("⚠️ Ошибок при обновлении кеша входящих в Redis", logging.ERROR)
+
+    async def begin_fill(self, user_id: int) -> tuple[str, int] | None:
+        """
+        Начинает заполнение кеша; вызывается до чтения из БД. Возвращает (токен, последняя общая рассылка)
+        для fill или None, если кеш выключен или Redis недоступен.
+        """
+        if not self.enabled:
+            return None
+        token = uuid.uuid4().hex
+        try:
+            with self._pool.guard("inbox_begin_fill"):
+                pipe = self._pool.client.pipeline(transaction=False)
+                pipe.set(self._filling_key(user_id), token, ex=FILL_TIMEOUT)
+                pipe.delete(self._pending_key(user_id))
+                pipe.zrange(self.BROADCASTS_KEY, -1, -1)
+                _, _, latest = await pipe.execute()
+        except RedisError:
+            aggregated_log.event("⚠️ Ошибок при заполнении кеша входящих в Redis", logging.ERROR)
+            return None
+        return token, int(latest[0]) if latest else 0
+
+    async def fill(self, user_id: int, items: list[NotificationOut], ticket: tuple[str, int] | None,
+                   subscribed_since: datetime | None):
+        """
+        Кладёт в кеш первые size+1 уведомлений пользователя, прочитанные из БД после begin_fill.
+        subscribed_since — начало текущей подписки (None — не подписан): по нему при чтении отбираются
+        общие рассылки, вышедшие после заполнения.
+        """
+        if not self.enabled or ticket is None:
+            return
+        token, horizon = ticket
+        inbox = [str(item.id) for item in items[:self._size]]
+        if len(items) <= self._size:
+            inbox.append(COMPLETE_MARKER)
+        read = {str(item.id): item.read_at.isoformat() for item in items[:self._size] if item.read_at}
+        read[HORIZON_FIELD] = horizon
+        read[SUBSCRIBED_FIELD] = subscribed_since.isoformat() if subscribed_since else ""
+
+        try:
+            with self._pool.guard("inbox_fill"):
+                client = self._pool.client
+                if self._fill is None:
+                    self._fill = client.register_script(FILL_SCRIPT)
+                pipe = client.pipeline(transaction=False)
+                for item in items[:self._size]:
+                    pipe.set(self._body_key(item.id), self._body(item), ex=self._ttl)
+                keys = [self._inbox_key(user_id), self._read_key(user_id), self._filling_key(user_id),
+                        self._pending_key(user_id)]
+                args = [token, self._size, self._ttl, len(inbox), *inbox,
+                        *(value for field_value in read.items() for value in field_value)]
+                await self._fill(keys=keys, args=args, client=pipe)
+                filled = (await pipe.execute())[-1]
+        except RedisError:
+            aggregated_log.event("⚠️ Ошибок при заполнении кеша входящих в Redis", logging.ERROR)
+            return
+        if not filled:
+            # Кеш сбросили или начали заполнять заново, пока читалась БД: эти данные могли устареть
+            aggregated_log.event("🔁 Заполнений кеша входящих отменено")
+
+    async def get(self, user_id: int, limit: int, before_id: int | None = None) -> list[NotificationOut] | None:
+        """
+        Страница из кеша; None — промах (нет кеша или страница выходит за закешированное окно).
+        Общие рассылки, вышедшие после заполнения кеша, добавляются из inbox_broadcasts, если пользователь
+        был подписан при их создании.
+        """
+        if not self.enabled:
+            return None
+        try:
+            with self._pool.guard("inbox_get"):
+                pipe = self._pool.client.pipeline(transaction=False)
+                pipe.exists(self._inbox_key(user_id))
+                pipe.zrevrangebyscore(self._inbox_key(user_id), f"({before_id}" if before_id else "+inf", "(0",
+                                      start=0, num=limit)
+                pipe.zscore(self._inbox_key(user_id), COMPLETE_MARKER)
+                pipe.hgetall(self._read_key(user_id))
+                pipe.zrange(self.BROADCASTS_KEY, 0, -1)
+                exists, ids, complete, read, broadcasts = await pipe.execute()
+
+                # Кеш прежнего формата (без отметки общих рассылок) — промах
+                if not exists or (len(ids) < limit and complete is None) or HORIZON_FIELD not in read:
+                    self.misses += 1
+                    return None
+
+                horizon = int(read[HORIZON_FIELD])
+                broadcasts = [int(b) for b in broadcasts]
+                # После заполнения вышло больше size рассылок, часть уже вытеснена из inbox_broadcasts
+                if len(broadcasts) >= self._size and broadcasts[0] > horizon:
+                    self.misses += 1
+                    return None
+                newer = [b for b in broadcasts if b > horizon and (before_id is None or b < before_id)]
+                if not read[SUBSCRIBED_FIELD]:
+                    newer = []
+
+                ids = list(dict.fromkeys([*map(int, ids), *newer]))
+                bodies = await self._pool.client.mget([self._body_key(i) for i in ids]) if ids else []
+        except RedisError:
+            aggregated_log.event("⚠️ Ошибок при чтении кеша входящих из Redis", logging.ERROR)
+            self.misses += 1
+            return None
+
+        if any(body is None for body in bodies):
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        subscribed_since = datetime.fromisoformat(read[SUBSCRIBED_FIELD]) if newer else None
+        items = []
+        for body in bodies:
+            item = NotificationOut(**json.loads(body))
+            if str(item.id) in read:
+                item.read_at = datetime.fromisoformat(read[str(item.id)])
+            elif item.id in newer and item.created_at < subscribed_since:
+                # Рассылка создана до начала подписки: в ленте её нет
+                continue
+            items.append(item)
+        items.sort(key=lambda item: item.id, reverse=True)
+        return items[:limit]
+
+    async def invalidate(self, user_id: int):
+        if not self.enabled:
+            return
+        try:
+            with self._pool.guard("inbox_invalidate"):
+                # Метка заполнения тоже удаляется: идущее заполнение могло прочитать из БД данные до изменения
+                await self._pool.client.delete(self._inbox_key(user_id), self._read_key(user_id),
+                                               self._filling_key(user_id), self._pending_key(user_id))
+        except RedisError:
+            aggregated_log.event("⚠️ Ошибок при сбросе кеша входящих в Redis", logging.ERROR)
+
+
+inbox_cache = InboxCache(
+    redis_pool,
+    enabled=settings.INBOX_CACHE_ENABLED,
+    size=settings.INBOX_CACHE_SIZE,
+    ttl=settings.INBOX_CACHE_TTL,
+)
+cache_collector.register("inbox", inbox_cache)
@@ -0,0 +1,140 @@
+import logging
+import time
+from collections import Counter as EventCounter
+
+from prometheus_client import Counter, Gauge, Histogram, REGISTRY
+from prometheus_client.core import CounterMetricFamily
+from sqlalchemy import event
+
+from app.core.config import settings
+
+# Границы корзин: от долей миллисекунды (кеш, Redis) до десятков секунд (fan-out, bcrypt под нагрузкой)
+LATENCY_BUCKETS = (.0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10, 30, 60)
+
+REQUEST_LATENCY = Histogram("http_request_duration_seconds", "Время обработки HTTP-запроса",
+                            ["method", "route", "status"], buckets=LATENCY_BUCKETS)
+DB_QUERY_LATENCY = Histogram("db_query_duration_seconds", "Время выполнения SQL-запроса",
+                             ["operation"], buckets=LATENCY_BUCKETS)
+DB_REPLICA_READS = Counter("db_replica_reads", "SELECT сессий чтения, отправленные в реплику")
+DB_READ_SESSIONS_PINNED = Counter("db_read_sessions_pinned", "Сессии чтения, переведённые на основную БД: "
+                                                             "после записи пользователя или для заполнения кеша")
+REDIS_LATENCY = Histogram("redis_call_duration_seconds", "Время обращения к Redis",
+                          ["operation"], buckets=LATENCY_BUCKETS)
+REDIS_CIRCUIT_OPEN = Gauge("redis_circuit_open", "1 — обращения к Redis приостановлены предохранителем")
+RABBITMQ_PUBLISH_LATENCY = Histogram("rabbitmq_publish_duration_seconds",
+                                     "Время публикации пачки в RabbitMQ до подтверждения брокера",
+                                     ["queue"], buckets=LATENCY_BUCKETS)
+PASSWORD_HASH_LATENCY = Histogram("password_hash_duration_seconds", "Время bcrypt-операции",
+                                  buckets=LATENCY_BUCKETS)
+PASSWORD_HASH_QUEUE_WAIT = Histogram("password_hash_queue_wait_seconds", "Ожидание свободного потока bcrypt",
+                                     buckets=LATENCY_BUCKETS)
+PASSWORD_HASH_REJECTED = Counter("password_hash_rejected", "Запросы, отклонённые из-за заполненной очереди bcrypt")
+RATE_LIMITED = Counter("rate_limited_requests", "Запросы, отклонённые лимитом (429)", ["route"])
+OUTBOX_PUBLISHED = Counter("outbox_published", "Сообщения, отправленные из outbox в RabbitMQ")
+OUTBOX_ERRORS = Counter("outbox_errors", "Ошибки пересылки outbox")
+OUTBOX_LAG = Gauge("outbox_lag_seconds", "Возраст самой старой записи outbox в последней пачке")
+SCHEDULED_DISPATCHED = Counter("scheduled_notifications_dispatched", "Отложенные уведомления, отправленные в срок")
+SCHEDULER_ERRORS = Counter("scheduler_errors", "Ошибки планировщика отложенных уведомлений")
+SCHEDULER_LAG = Gauge("scheduler_lag_seconds", "Опоздание самого раннего отложенного уведомления в последней пачке")
+NOTIFICATIONS_DEDUPLICATED = Counter("notifications_deduplicated", "Повторные отправки, не создавшие новой рассылки",
+                                     ["reason"])
+FANOUT_ROWS = Counter("fanout_rows", "Созданные связи пользователь-уведомление")
+FANOUT_LATENCY = Histogram("fanout_shard_duration_seconds", "Время обработки одной части рассылки",
+                           buckets=LATENCY_BUCKETS)
+RETENTION_PURGED = Counter("retention_purged_rows", "Строки, удалённые задачей хранения", ["table"])
+DELIVERY_ATTEMPTS = Counter("delivery_attempts", "Попытки доставки по внешним каналам", ["channel", "result"])
+DELIVERY_LATENCY = Histogram("delivery_duration_seconds", "Время одной отправки по внешнему каналу",
+                             ["channel"], buckets=LATENCY_BUCKETS)
+PUSH_CONNECTIONS = Gauge("push_connections", "Открытые потоки push-событий")
+PUSH_DROPPED = Counter("push_dropped_connections", "Потоки, закрытые из-за переполнения очереди медленного клиента")
+CONSUMER_LAG = Histogram("queue_consumer_lag_seconds", "Время от публикации сообщения до начала обработки",
+                         ["queue"], buckets=LATENCY_BUCKETS)
+
+
+class CacheCollector:
+    """Отдаёт счётчики hits/misses зарегистрированных кешей в момент сбора метрик, не трогая горячий путь."""
+
+    def __init__(self):
+        self._caches = {}
+
+    def register(self, name: str, cache):
+        self._caches[name] = cache
+
+    def collect(self):
+        requests = CounterMetricFamily("cache_requests", "Обращения к кешам", labels=["cache", "result"])
+        for name, cache in self._caches.items():
+            requests.add_metric([name, "hit"], cache.hits)
+            requests.add_metric([name, "miss"], cache.misses)
+        yield requests
+
+
+cache_collector = CacheCollector()
+REGISTRY.register(cache_collector)
+
+
+def instrument_engine(engine):
+    """Замеряет время каждого SQL-запроса движка (для AsyncEngine передаётся engine.sync_engine)."""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started_at", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info["query_started_at"].pop()
+        operation = statement.lstrip().split(None, 1)[0].upper()
+        DB_QUERY_LATENCY.labels(operation).observe(time.perf_counter() - started)
+
+
+class MetricsMiddleware:
+    """ASGI-middleware: гистограмма времени ответа по шаблону маршрута (а не по конкретному URL)."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status_code = 500
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = scope.get("route")
+            REQUEST_LATENCY.labels(scope["method"], getattr(route, "path", "unmatched"), status_code) \
+                .observe(time.perf_counter() - started)
+
+
+class AggregatedLog:
+    """
+    Сводный лог однотипных событий: вместо строки на каждый запрос — одна строка
+    с количеством за interval секунд. Подробности по отдельным событиям — в метриках.
+    Накопленное пишется при первом событии после истечения интервала.
+    """
+
+    def __init__(self, interval: float):
+        self._interval = interval
+        self._counts = EventCounter()
+        self._flushed_at = time.monotonic()
+
+    def event(self, message: str, level: int = logging.INFO):
+        self._counts[(level, message)] += 1
+        now = time.monotonic()
+        if now - self._flushed_at >= self._interval:
+            elapsed = now - self._flushed_at
+            self._flushed_at = now
+            counts, self._counts = self._counts, EventCounter()
+            for (event_level, event_message), count in counts.items():
+                logging.log(event_level, f"{event_message}: {count} за {elapsed:.0f} с")
+
+
+aggregated_log = AggregatedLog(settings.LOG_AGGREGATE_INTERVAL)
@@ -0,0 +1,103 @@
+import asyncio
+import logging
+from collections import defaultdict
+from datetime import datetime
+
+from sqlalchemy import select, delete
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.metrics import OUTBOX_PUBLISHED, OUTBOX_ERRORS, OUTBOX_LAG
+from app.core.rabbitmq import NotificationPublisher, notification_publisher
+from app.models.base import AsyncSessionLocal
+from app.models.outbox import OutboxMessage
+
+
+def add_outbox_messages(db: AsyncSession, messages: list[dict], routing_key: str | None = None):
+    """Добавляет сообщения в outbox текущей транзакции; в RabbitMQ они попадут только после её коммита."""
+    routing_key = routing_key or settings.NOTIFICATION_QUEUE
+    db.add_all(OutboxMessage(routing_key=routing_key, payload=message) for message in messages)
+
+
+class OutboxRelay:
+    """
+    Фоновая пересылка outbox в RabbitMQ.
+    - Забирает записи пачками по batch_size в порядке id, публикует с подтверждениями и удаляет одним DELETE.
+    - На PostgreSQL строки берутся FOR UPDATE SKIP LOCKED, поэтому несколько процессов API не шлют одно и то же.
+    - Если таблица пуста, ждёт notify() после коммита или poll_interval секунд.
+    Доставка at-least-once: при сбое между публикацией и удалением пачка уйдёт повторно, воркер это переносит.
+    """
+
+    def __init__(self, publisher: NotificationPublisher, batch_size: int, poll_interval: float):
+        self._publisher = publisher
+        self._batch_size = batch_size
+        self._poll_interval = poll_interval
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task | None = None
+
+    def notify(self):
+        """Будит relay сразу после коммита, не дожидаясь следующего опроса."""
+        self._wakeup.set()
+
+    async def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                relayed = await self.relay_batch()
+            except Exception as e:
+                OUTBOX_ERRORS.inc()
+                relayed = 0
+                logging.error(f"❌ Ошибка при пересылке outbox в RabbitMQ: {e}")
+
+            # Полная пачка — в таблице, скорее всего, есть ещё записи, забираем сразу
+            if relayed < self._batch_size:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self._poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+
+    async def relay_batch(self) -> int:
+        """Публикует одну пачку из outbox и возвращает её размер."""
+        async with AsyncSessionLocal() as db:
+            query = select(OutboxMessage).order_by(OutboxMessage.id).limit(self._batch_size)
+            if db.get_bind().dialect.name == "postgresql":
+                query = query.with_for_update(skip_locked=True)
+            rows = (await db.execute(query)).scalars().all()
+
+            if not rows:
+                OUTBOX_LAG.set(0)
+                return 0
+            lag = (datetime.utcnow() - rows[0].created_at).total_seconds()
+            OUTBOX_LAG.set(lag)
+            # Пока брокер недоступен, не держим строки заблокированными: записи дождутся в таблице
+            if not self._publisher.ready:
+                return 0
+
+            by_routing_key = defaultdict(list)
+            for row in rows:
+                by_routing_key[row.routing_key].append(row.payload)
+            for routing_key, payloads in by_routing_key.items():
+                await self._publisher.publish(payloads, routing_key=routing_key)
+
+            await db.execute(delete(OutboxMessage).where(OutboxMessage.id.in_([row.id for row in rows])))
+            await db.commit()
+
+        OUTBOX_PUBLISHED.inc(len(rows))
+        logging.info(f"✅ Из outbox в RabbitMQ отправлено сообщений: {len(rows)}, задержка {lag:.2f} с")
+        return len(rows)
+
+
+outbox_relay = OutboxRelay(
+    notification_publisher,
+    batch_size=settings.OUTBOX_BATCH_SIZE,
+    poll_interval=settings.OUTBOX_POLL_INTERVAL,
+)
@@ -0,0 +1,186 @@
+import asyncio
+import json
+import logging
+from collections import defaultdict
+
+from redis.exceptions import RedisError
+
+from app.core.auth import user_cache
+from app.core.config import settings
+from app.core.metrics import PUSH_CONNECTIONS, PUSH_DROPPED, aggregated_log
+from app.core.redis import RedisPool, redis_pool
+
+
+def notification_event(notification) -> dict:
+    return {
+        "id": notification.id,
+        "title": notification.title,
+        "message": notification.message,
+        "created_at": notification.created_at.isoformat(),
+    }
+
+
+def publish_notification(notification, user_ids: list[int]):
+    """
+    Из воркера: публикует новое уведомление в канал push пачками по PUSH_BATCH_SIZE получателей.
+    Каждый узел API получает все пачки и отправляет событие только своим подключённым клиентам.
+    """
+    if not settings.PUSH_ENABLED or not user_ids:
+        return
+    event = notification_event(notification)
+    try:
+        with redis_pool.guard("push_publish"):
+            pipe = redis_pool.sync_client.pipeline(transaction=False)
+            for start in range(0, len(user_ids), settings.PUSH_BATCH_SIZE):
+                pipe.publish(settings.PUSH_CHANNEL, json.dumps({
+                    "notification": event,
+                    "user_ids": user_ids[start:start + settings.PUSH_BATCH_SIZE],
+                }))
+            pipe.execute()
+    except RedisError:
+        aggregated_log.event("⚠️ Ошибок при публикации push-событий в Redis", logging.ERROR)
+
+
+def publish_broadcast(notification):
+    """Из воркера: общая рассылка — одно сообщение без списка получателей, его получают все подписчики."""
+    if not settings.PUSH_ENABLED:
+        return
+    try:
+        with redis_pool.guard("push_publish"):
+            redis_pool.sync_client.publish(settings.PUSH_CHANNEL, json.dumps({
+                "notification": notification_event(notification),
+                "user_ids": None,
+            }))
+    except RedisError:
+        aggregated_log.event("⚠️ Ошибок при публикации push-событий в Redis", logging.ERROR)
+
+
+async def publish_subscription(user_id: int, username: str, subscribed: bool):
+    """
+    Из API: переключение подписки — всем узлам API через канал push. Узлы обновляют подключённые потоки
+    пользователя и убирают его из user_cache, иначе до истечения USER_CACHE_TTL видели бы старый флаг.
+    """
+    try:
+        with redis_pool.guard("push_publish"):
+            await redis_pool.client.publish(settings.PUSH_CHANNEL, json.dumps({
+                "subscription": {"user_id": user_id, "username": username, "subscribed": subscribed},
+            }))
+    except RedisError:
+        aggregated_log.event("⚠️ Ошибок при публикации смены подписки в Redis", logging.ERROR)
+
+
+class Subscriber:
+    """Одно подключение клиента: ограниченная очередь событий; переполнение — признак медленного клиента."""
+
+    def __init__(self, user_id: int, queue_size: int, subscribed: bool = True):
+        self.user_id = user_id
+        # Подписка: при подключении — из профиля, дальше обновляется событиями смены подписки
+        self.subscribed = subscribed
+        self.queue: asyncio.Queue[dict] = asyncio.Queue(maxsize=queue_size)
+        self.overflowed = False
+
+
+class PushHub:
+    """
+    Подключённые к узлу API клиенты и слушатель канала push в Redis.
+    - Подписка — только объект в словаре user_id -> подписчики, без задач и сокетов Redis на клиента.
+    - Медленному клиенту, чья очередь переполнилась, события больше не кладутся: поток закрывается
+      с событием reset, и клиент дочитывает пропущенное через /notifications.
+    - Тот же канал несёт смену подписки: отписавшийся пользователь перестаёт получать события на всех узлах.
+      Поэтому слушатель работает и с PUSH_ENABLED=false — тогда в канале только смены подписки.
+    """
+
+    def __init__(self, pool: RedisPool, queue_size: int, max_connections: int):
+        self._pool = pool
+        self._queue_size = queue_size
+        self._max_connections = max_connections
+        self._subscribers: dict[int, set[Subscriber]] = defaultdict(set)
+        self._count = 0
+        self._task: asyncio.Task | None = None
+
+    @property
+    def has_capacity(self) -> bool:
+        return self._count < self._max_connections
+
+    def subscribe(self, user_id: int, subscribed: bool = True) -> Subscriber:
+        subscriber = Subscriber(user_id, self._queue_size, subscribed)
+        self._subscribers[user_id].add(subscriber)
+        self._count += 1
+        PUSH_CONNECTIONS.inc()
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        subscribers = self._subscribers.get(subscriber.user_id)
+        if subscribers is None or subscriber not in subscribers:
+            return
+        subscribers.discard(subscriber)
+        if not subscribers:
+            del self._subscribers[subscriber.user_id]
+        self._count -= 1
+        PUSH_CONNECTIONS.dec()
+
+    def dispatch(self, event: dict, user_ids: list[int] | None):
+        """user_ids=None — общая рассылка для всех подключённых подписчиков."""
+        # Перебираем меньшее из двух множеств: получателей пачки или подключённых пользователей
+        if user_ids is None:
+            recipients = list(self._subscribers)
+        elif len(user_ids) > len(self._subscribers):
+            recipients = self._subscribers.keys() & set(user_ids)
+        else:
+            recipients = [user_id for user_id in user_ids if user_id in self._subscribers]
+
+        for user_id in recipients:
+            for subscriber in self._subscribers[user_id]:
+                if subscriber.overflowed or not subscriber.subscribed:
+                    continue
+                try:
+                    subscriber.queue.put_nowait(event)
+                except asyncio.QueueFull:
+                    subscriber.overflowed = True
+                    PUSH_DROPPED.inc()
+
+    def update_subscription(self, user_id: int, username: str, subscribed: bool):
+        """Подписка пользователя изменилась на этом или другом узле API."""
+        user_cache.pop(username)
+        for subscriber in self._subscribers.get(user_id, ()):
+            subscriber.subscribed = subscribed
+
+    async def start(self):
+        self._task = asyncio.create_task(self._listen())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _listen(self):
+        while True:
+            try:
+                with self._pool.guard("push_subscribe"):
+                    pubsub = self._pool.client.pubsub(ignore_subscribe_messages=True)
+                    await pubsub.subscribe(settings.PUSH_CHANNEL)
+                try:
+                    logging.info("✅ Подписка на push-события Redis")
+                    while True:
+                        # Ожидание с таймаутом: соединение не упирается в socket_timeout пула и проверяется health check
+                        message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                        if message is None:
+                            continue
+                        try:
+                            payload = json.loads(message["data"])
+                            if "subscription" in payload:
+                                change = payload["subscription"]
+                                self.update_subscription(change["user_id"], change["username"], change["subscribed"])
+                            else:
+                                self.dispatch(payload["notification"], payload["user_ids"])
+                        except (ValueError, KeyError, TypeError):
+                            aggregated_log.event("⚠️ Пропущено некорректных push-событий", logging.ERROR)
+                finally:
+                    await pubsub.aclose()
+            except (RedisError, OSError) as e:
+                logging.error(f"❌ Подписка на push-события Redis прервана: {e}")
+                await asyncio.sleep(settings.PUSH_RECONNECT_INTERVAL)
+
+
+push_hub = PushHub(redis_pool, queue_size=settings.PUSH_QUEUE_SIZE, max_connections=settings.PUSH_MAX_CONNECTIONS)
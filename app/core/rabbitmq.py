@@ -0,0 +1,128 @@
+import asyncio
+import logging
+import time
+from typing import TYPE_CHECKING
+
+from app.core.config import settings
+from app.core.envelope import pack_tasks
+from app.core.metrics import RABBITMQ_PUBLISH_LATENCY
+
+if TYPE_CHECKING:
+    import aio_pika
+    from aio_pika.pool import Pool
+
+# Параметры очереди задач должны совпадать у API и воркера, иначе RabbitMQ отклонит повторное объявление.
+# Сообщения, отклонённые воркером без повтора, уходят в dead-letter очередь.
+NOTIFICATION_QUEUE_ARGUMENTS = {
+    "x-dead-letter-exchange": "",
+    "x-dead-letter-routing-key": settings.NOTIFICATION_DEAD_LETTER_QUEUE,
+}
+
+# Полосы приоритета: у normal прежние имена очередей, у остальных — с суффиксом полосы
+NOTIFICATION_PRIORITIES = ("high", "normal", "low")
+
+
+def lane_queue(queue: str, priority: str) -> str:
+    """Очередь полосы priority для базовой очереди: notification_tasks -> notification_tasks.high."""
+    return queue if priority == "normal" else f"{queue}.{priority}"
+
+
+class NotificationPublisher:
+    """
+    Долгоживущий издатель задач в RabbitMQ для API.
+    - Одно robust-соединение на процесс (переподключается само), пул каналов с publisher confirms.
+    - Очереди всех полос приоритета объявляются один раз при подключении.
+    - publish раскладывает пачку задач по конвертам (app/core/envelope.py), отправляет их конвейером
+      и ждёт подтверждений брокера для всей пачки.
+    """
+
+    def __init__(self, url: str, queue_name: str, pool_size: int, reconnect_interval: float,
+                 envelope_format: str = "msgpack", max_tasks: int = 1):
+        self._url = url
+        self._queue_name = queue_name
+        self._envelope_format = envelope_format
+        self._max_tasks = max_tasks
+        self._pool_size = pool_size
+        self._reconnect_interval = reconnect_interval
+        self._connection: "aio_pika.abc.AbstractRobustConnection | None" = None
+        self._channels: "Pool | None" = None
+        self._ready = asyncio.Event()
+        self._task: asyncio.Task | None = None
+
+    @property
+    def ready(self) -> bool:
+        return self._ready.is_set()
+
+    async def start(self):
+        """Запускает подключение в фоне, не дожидаясь доступности брокера."""
+        self._task = asyncio.create_task(self._connect())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+        if self._channels:
+            await self._channels.close()
+        if self._connection:
+            await self._connection.close()
+        self._ready.clear()
+
+    async def _open_channel(self) -> "aio_pika.abc.AbstractChannel":
+        return await self._connection.channel(publisher_confirms=True)
+
+    async def _connect(self):
+        # aio_pika импортируется здесь, в фоновой задаче: импорт клиента AMQP не входит во время старта API
+        import aio_pika
+        from aio_pika.exceptions import AMQPError
+        from aio_pika.pool import Pool
+
+        while not self._ready.is_set():
+            try:
+                self._connection = await aio_pika.connect_robust(self._url)
+                self._channels = Pool(self._open_channel, max_size=self._pool_size)
+                async with self._channels.acquire() as channel:
+                    await channel.declare_queue(settings.NOTIFICATION_DEAD_LETTER_QUEUE, durable=True)
+                    for priority in NOTIFICATION_PRIORITIES:
+                        await channel.declare_queue(lane_queue(self._queue_name, priority), durable=True,
+                                                    arguments=NOTIFICATION_QUEUE_ARGUMENTS)
+                self._ready.set()
+                logging.info("✅ Подключение к RabbitMQ успешно!")
+            except (AMQPError, OSError) as e:
+                logging.error(f"❌ Ошибка подключения к RabbitMQ: {e}")
+                await asyncio.sleep(self._reconnect_interval)
+
+    async def publish(self, messages: list[dict], routing_key: str | None = None):
+        """Публикует пачку задач и ждёт подтверждений; при ошибке брокера бросает исключение."""
+        await self._ready.wait()
+        routing_key = routing_key or self._queue_name
+        # Срочная полоса — по задаче в сообщении: воркер обрабатывает начатый конверт целиком,
+        # и срочная задача не должна ждать остальные задачи своего конверта
+        max_tasks = 1 if routing_key == lane_queue(self._queue_name, "high") else self._max_tasks
+        envelopes = pack_tasks(messages, max_tasks, self._envelope_format)
+        import aio_pika  # уже загружен в _connect: publish вызывается только после подключения
+
+        async with self._channels.acquire() as channel:
+            # Публикации идут конвейером, подтверждения брокера ждём для всей пачки разом.
+            # timestamp нужен воркеру, чтобы считать задержку сообщения в очереди.
+            with RABBITMQ_PUBLISH_LATENCY.labels(routing_key).time():
+                await asyncio.gather(*(
+                    channel.default_exchange.publish(
+                        aio_pika.Message(body=body, content_type=content_type,
+                                         delivery_mode=aio_pika.DeliveryMode.PERSISTENT,
+                                         timestamp=time.time()),
+                        routing_key=routing_key,
+                    )
+                    for body, content_type in envelopes
+                ))
+
+
+notification_publisher = NotificationPublisher(
+    url=settings.RABBITMQ_URL,
+    queue_name=settings.NOTIFICATION_QUEUE,
+    pool_size=settings.RABBITMQ_CHANNEL_POOL_SIZE,
+    reconnect_interval=settings.RABBITMQ_RECONNECT_INTERVAL,
+    envelope_format=settings.NOTIFICATION_ENVELOPE_FORMAT,
+    max_tasks=settings.NOTIFICATION_ENVELOPE_MAX_TASKS,
+)
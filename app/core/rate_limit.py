@@ -0,0 +1,182 @@
+import logging
+import math
+import time
+from dataclasses import dataclass
+
+import jwt
+from fastapi import HTTPException, Request, Response
+from redis.exceptions import RedisError
+from starlette import status
+
+from app.core.auth import token_cache
+from app.core.cache import TTLCache
+from app.core.config import settings
+from app.core.metrics import RATE_LIMITED, aggregated_log
+from app.core.redis import RedisPool, redis_pool
+
+# Token bucket: пополняет корзину по прошедшему времени и выдаёт до ARGV[4] токенов.
+# Возвращает {выдано, остаток}; остаток — строкой, иначе Redis округлит дробное число.
+TOKEN_BUCKET_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local requested = tonumber(ARGV[4])
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or capacity
+local ts = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+local granted = math.min(requested, math.floor(tokens))
+tokens = tokens - granted
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', now)
+redis.call('PEXPIRE', KEYS[1], math.ceil((capacity - tokens) / rate) + 1000)
+return {granted, tostring(tokens)}
+"""
+
+PERIODS = {"second": 1, "minute": 60, "hour": 3600, "day": 86400}
+
+
+@dataclass(frozen=True)
+class Rate:
+    """Лимит «capacity запросов за period секунд»: корзина на capacity токенов, пополняется равномерно."""
+    capacity: int
+    period: float
+
+    @classmethod
+    def parse(cls, value: str) -> "Rate":
+        """Разбирает строку вида "10/minute"."""
+        count, _, period = value.partition("/")
+        return cls(int(count), PERIODS[period.strip()])
+
+    @property
+    def per_ms(self) -> float:
+        return self.capacity / self.period / 1000
+
+
+@dataclass
+class RateLimitResult:
+    allowed: bool
+    rate: Rate
+    remaining: int
+    retry_after: float = 0.0
+
+    def headers(self) -> dict[str, str]:
+        # RateLimit-Reset — через сколько секунд корзина наполнится полностью
+        reset = (self.rate.capacity - self.remaining) / self.rate.capacity * self.rate.period
+        headers = {
+            "RateLimit-Limit": str(self.rate.capacity),
+            "RateLimit-Remaining": str(self.remaining),
+            "RateLimit-Reset": str(math.ceil(reset)),
+        }
+        if not self.allowed:
+            headers["Retry-After"] = str(math.ceil(self.retry_after))
+        return headers
+
+
+class RateLimiter:
+    """
+    Лимиты запросов по маршруту и отправителю: token bucket в Redis (атомарный Lua-скрипт), общий для всех процессов.
+    Локальная проверка в памяти процесса избавляет от обращения к Redis на каждый запрос:
+    - после отказа отправитель получает 429 локально, пока не истечёт Retry-After;
+    - при больших лимитах токены берутся из Redis пачкой (lease_fraction от ёмкости) и расходуются локально
+      в течение lease_ttl секунд; неизрасходованные за это время сгорают.
+    Если Redis недоступен, запросы пропускаются.
+    """
+
+    def __init__(self, pool: RedisPool, limits: dict[str, str], overrides: dict[str, str],
+                 lease_fraction: float, lease_ttl: float, local_size: int):
+        self._pool = pool
+        self._limits = {route: Rate.parse(value) for route, value in limits.items()}
+        self._overrides = {key: Rate.parse(value) for key, value in overrides.items()}
+        self._lease_fraction = lease_fraction
+        self._lease_ttl = lease_ttl
+        # ключ корзины -> [локальные токены, остаток в Redis]; ключ корзины -> время окончания блокировки
+        self._leases = TTLCache(local_size, lease_ttl)
+        longest = max((rate.period for rate in [*self._limits.values(), *self._overrides.values()]), default=1)
+        self._blocked = TTLCache(local_size, longest)
+        self._script = None
+
+    def rate_for(self, route: str, principal: str) -> Rate | None:
+        return self._overrides.get(f"{route}:{principal}", self._limits.get(route))
+
+    async def hit(self, route: str, principal: str) -> RateLimitResult | None:
+        rate = self.rate_for(route, principal)
+        if rate is None:
+            return None
+        key = f"ratelimit:{route}:{principal}"
+
+        blocked_until = self._blocked.get(key)
+        if blocked_until is not None:
+            return RateLimitResult(False, rate, 0, blocked_until - time.monotonic())
+
+        lease = self._leases.get(key)
+        if lease and lease[0] > 0:
+            lease[0] -= 1
+            return RateLimitResult(True, rate, lease[0] + lease[1])
+
+        requested = max(1, int(rate.capacity * self._lease_fraction))
+        try:
+            with self._pool.guard("rate_limit"):
+                if self._script is None:
+                    self._script = self._pool.client.register_script(TOKEN_BUCKET_SCRIPT)
+                granted, tokens = await self._script(
+                    keys=[key], args=[rate.capacity, rate.per_ms, int(time.time() * 1000), requested],
+                )
+        except RedisError:
+            aggregated_log.event("⚠️ Запросов пропущено без проверки лимита (Redis недоступен)", logging.ERROR)
+            return None
+
+        granted, tokens = int(granted), float(tokens)
+        if not granted:
+            retry_after = (1 - tokens) / rate.per_ms / 1000
+            self._blocked.set(key, time.monotonic() + retry_after, ttl=retry_after)
+            RATE_LIMITED.labels(route).inc()
+            return RateLimitResult(False, rate, 0, retry_after)
+
+        remaining = int(tokens)
+        if granted > 1:
+            self._leases.set(key, [granted - 1, remaining])
+        return RateLimitResult(True, rate, remaining + granted - 1)
+
+
+rate_limiter = RateLimiter(
+    redis_pool,
+    limits=settings.RATE_LIMITS,
+    overrides=settings.RATE_LIMIT_OVERRIDES,
+    lease_fraction=settings.RATE_LIMIT_LEASE_FRACTION,
+    lease_ttl=settings.RATE_LIMIT_LEASE_TTL,
+    local_size=settings.RATE_LIMIT_LOCAL_SIZE,
+)
+
+
+def get_principal(request: Request) -> str:
+    """Отправитель: пользователь из JWT (без проверки отзыва — она в самом маршруте), иначе IP клиента."""
+    authorization = request.headers.get("authorization", "")
+    if authorization.lower().startswith("bearer "):
+        token = authorization[7:]
+        cached = token_cache.get(token)
+        if cached:
+            return f"user:{cached[0]}"
+        try:
+            username = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM]).get("sub")
+        except jwt.PyJWTError:
+            username = None
+        if username:
+            return f"user:{username}"
+    return f"ip:{request.client.host if request.client else 'unknown'}"
+
+
+def rate_limit(route: str):
+    """Зависимость маршрута: 429 с Retry-After при превышении лимита, заголовки RateLimit-* в ответе."""
+
+    async def check_rate_limit(request: Request, response: Response):
+        if not settings.RATE_LIMIT_ENABLED:
+            return
+        result = await rate_limiter.hit(route, get_principal(request))
+        if result is None:
+            return
+        if not result.allowed:
+            raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail="Too many requests",
+                                headers=result.headers())
+        response.headers.update(result.headers())
+
+    return check_rate_limit
@@ -0,0 +1,56 @@
+import logging
+
+from redis.exceptions import RedisError
+
+from app.core.cache import TTLCache
+from app.core.config import settings
+from app.core.metrics import aggregated_log
+from app.core.redis import RedisPool, redis_pool
+from app.models.base import has_read_replica, use_primary
+
+
+class RecentWrites:
+    """
+    Пользователи, недавно изменившие свои данные (read-your-writes при чтении из реплики).
+    - После записи пользователь window секунд читает из основной БД: реплика могла ещё не получить его изменения.
+    - Отметка хранится в Redis (ключ с TTL), чтобы её видели все процессы API, и в памяти процесса —
+      отметки этого процесса проверяются без обращения к Redis.
+    - Если Redis недоступен, чтения идут в основную БД: как без реплики, но без устаревших данных.
+    - Без READ_DATABASE_URL ничего не отмечается и не проверяется.
+    """
+
+    PREFIX = "recent_write:"
+
+    def __init__(self, pool: RedisPool, window: float, maxsize: int):
+        self._pool = pool
+        self._window = window
+        self._local = TTLCache(maxsize, window)
+
+    async def mark(self, username: str):
+        if not has_read_replica():
+            return
+        self._local.set(username, True)
+        try:
+            with self._pool.guard("mark_recent_write"):
+                await self._pool.client.set(self.PREFIX + username, 1, px=int(self._window * 1000))
+        except RedisError:
+            aggregated_log.event("⚠️ Ошибок при сохранении отметки записи в Redis", logging.ERROR)
+
+    async def is_recent(self, username: str) -> bool:
+        if not has_read_replica():
+            return False
+        if self._local.get(username):
+            return True
+        try:
+            with self._pool.guard("check_recent_write"):
+                return bool(await self._pool.client.exists(self.PREFIX + username))
+        except RedisError:
+            return True
+
+    async def route(self, db, username: str):
+        """Переводит сессию чтения на основную БД, если пользователь недавно записывал."""
+        if db.info.get("replica") and await self.is_recent(username):
+            use_primary(db)
+
+
+recent_writes = RecentWrites(redis_pool, settings.READ_YOUR_WRITES_WINDOW, settings.USER_CACHE_SIZE)
@@ -0,0 +1,116 @@
+import logging
+import time
+from contextlib import contextmanager
+
+import redis
+import redis.asyncio
+from redis.exceptions import RedisError
+
+from app.core.config import settings
+from app.core.metrics import REDIS_LATENCY, REDIS_CIRCUIT_OPEN
+
+
+class RedisUnavailable(RedisError):
+    """Redis отключён предохранителем или ещё не подключён — запрос к нему не отправлялся."""
+
+
+class CircuitBreaker:
+    """
+    Предохранитель: после failure_threshold ошибок подряд перестаёт обращаться к Redis на reset_timeout секунд.
+    По истечении паузы пропускает запросы снова; первая же ошибка размыкает его ещё на reset_timeout.
+    """
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self._failure_threshold = failure_threshold
+        self._reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at: float | None = None
+
+    @property
+    def is_open(self) -> bool:
+        return self._opened_at is not None and time.monotonic() - self._opened_at < self._reset_timeout
+
+    def record_success(self):
+        if self._opened_at is not None:
+            logging.info("✅ Redis снова доступен")
+            REDIS_CIRCUIT_OPEN.set(0)
+        self._failures = 0
+        self._opened_at = None
+
+    def record_failure(self):
+        self._failures += 1
+        if self._failures >= self._failure_threshold and not self.is_open:
+            logging.error(f"🚨 Redis недоступен, обращения приостановлены на {self._reset_timeout} с")
+            REDIS_CIRCUIT_OPEN.set(1)
+            self._opened_at = time.monotonic()
+
+
+class RedisPool:
+    """
+    Общий пул соединений с Redis из Settings.
+    - Асинхронный клиент для API создаётся в lifespan (start/close), без ping при старте.
+    - Синхронный клиент для воркера создаётся при первом обращении.
+    - Все обращения идут через guard(): замер времени и предохранитель от деградировавшего Redis.
+    """
+
+    def __init__(self):
+        self._breaker = CircuitBreaker(settings.REDIS_BREAKER_THRESHOLD, settings.REDIS_BREAKER_RESET_TIMEOUT)
+        self._client: redis.asyncio.Redis | None = None
+        self._sync_client: redis.Redis | None = None
+
+    def _pool_options(self) -> dict:
+        return dict(
+            host=settings.REDIS_HOST,
+            port=settings.REDIS_PORT,
+            db=settings.REDIS_DB,
+            max_connections=settings.REDIS_MAX_CONNECTIONS,
+            socket_timeout=settings.REDIS_SOCKET_TIMEOUT,
+            socket_connect_timeout=settings.REDIS_CONNECT_TIMEOUT,
+            health_check_interval=settings.REDIS_HEALTH_CHECK_INTERVAL,
+            decode_responses=True,
+        )
+
+    async def start(self):
+        self._client = redis.asyncio.Redis(connection_pool=redis.asyncio.ConnectionPool(**self._pool_options()))
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    @property
+    def available(self) -> bool:
+        return not self._breaker.is_open
+
+    @property
+    def client(self) -> redis.asyncio.Redis:
+        if self._client is None:
+            raise RedisUnavailable("Пул Redis не запущен")
+        return self._client
+
+    @property
+    def sync_client(self) -> redis.Redis:
+        if self._sync_client is None:
+            self._sync_client = redis.Redis(connection_pool=redis.ConnectionPool(**self._pool_options()))
+        return self._sync_client
+
+    @contextmanager
+    def guard(self, operation: str):
+        """Оборачивает обращение к Redis; при разомкнутом предохранителе сразу бросает RedisUnavailable."""
+        if self._breaker.is_open:
+            raise RedisUnavailable("Обращения к Redis приостановлены")
+        started = time.perf_counter()
+        try:
+            yield
+        except RedisUnavailable:
+            raise
+        except RedisError:
+            self._breaker.record_failure()
+            raise
+        else:
+            self._breaker.record_success()
+        finally:
+            REDIS_LATENCY.labels(operation).observe(time.perf_counter() - started)
+
+
+redis_pool = RedisPool()
@@ -0,0 +1,85 @@
+import asyncio
+import logging
+from datetime import datetime
+
+from sqlalchemy import select, delete
+
+from app.core.config import settings
+from app.core.metrics import SCHEDULED_DISPATCHED, SCHEDULER_ERRORS, SCHEDULER_LAG
+from app.core.outbox import OutboxRelay, outbox_relay
+from app.crud.notification import add_notifications
+from app.models.base import AsyncSessionLocal
+from app.models.notification import ScheduledNotification
+from app.schemas.notification import NotificationCreate
+
+
+class NotificationScheduler:
+    """
+    Фоновая отправка отложенных уведомлений.
+    - Опрашивает scheduled_notifications по индексу send_at: наступившие записи забираются пачками по batch_size
+      в порядке send_at, на PostgreSQL — FOR UPDATE SKIP LOCKED, поэтому несколько процессов API не создают дублей.
+    - В одной транзакции создаёт из пачки уведомления с задачами в outbox и удаляет записи, затем будит relay.
+    - Если наступивших записей нет, ждёт poll_interval секунд: это и есть точность send_at.
+    Ожидание одной выборкой на пачку вместо таймера на каждое сообщение: миллион отложенных уведомлений
+    стоит строк в таблице, а не задач в памяти процесса.
+    """
+
+    def __init__(self, relay: OutboxRelay, batch_size: int, poll_interval: float):
+        self._relay = relay
+        self._batch_size = batch_size
+        self._poll_interval = poll_interval
+        self._task: asyncio.Task | None = None
+
+    async def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                dispatched = await self.dispatch_batch()
+            except Exception as e:
+                SCHEDULER_ERRORS.inc()
+                dispatched = 0
+                logging.error(f"❌ Ошибка при отправке отложенных уведомлений: {e}")
+
+            # Полная пачка — наступивших записей, скорее всего, больше, забираем сразу
+            if dispatched < self._batch_size:
+                await asyncio.sleep(self._poll_interval)
+
+    async def dispatch_batch(self) -> int:
+        """Создаёт уведомления из одной пачки наступивших записей и возвращает её размер."""
+        now = datetime.utcnow()
+        async with AsyncSessionLocal() as db:
+            query = (select(ScheduledNotification).where(ScheduledNotification.send_at <= now)
+                     .order_by(ScheduledNotification.send_at).limit(self._batch_size))
+            if db.get_bind().dialect.name == "postgresql":
+                query = query.with_for_update(skip_locked=True)
+            rows = (await db.execute(query)).scalars().all()
+
+            if not rows:
+                SCHEDULER_LAG.set(0)
+                return 0
+            lag = (now - rows[0].send_at).total_seconds()
+            SCHEDULER_LAG.set(lag)
+
+            await add_notifications(db, [NotificationCreate.model_validate(row.payload) for row in rows])
+            await db.execute(delete(ScheduledNotification).where(ScheduledNotification.id.in_([row.id for row in rows])))
+            await db.commit()
+
+        self._relay.notify()
+        SCHEDULED_DISPATCHED.inc(len(rows))
+        logging.info(f"🕒 Отложенных уведомлений отправлено: {len(rows)}, опоздание {lag:.2f} с")
+        return len(rows)
+
+
+notification_scheduler = NotificationScheduler(
+    outbox_relay,
+    batch_size=settings.SCHEDULER_BATCH_SIZE,
+    poll_interval=settings.SCHEDULER_POLL_INTERVAL,
+)
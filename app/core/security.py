@@ -1,18 +1,82 @@
-from passlib.context import CryptContext
+import asyncio
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from functools import cache
+
+import jwt
+from fastapi import HTTPException
 from datetime import datetime, timedelta
-from jose import jwt
 from app.core.config import settings
+from app.core.metrics import PASSWORD_HASH_LATENCY, PASSWORD_HASH_QUEUE_WAIT, PASSWORD_HASH_REJECTED
+
+@cache
+def pwd_context():
+    """Контекст passlib создаётся при первой операции с паролем: импорт passlib и bcrypt не входит во время старта."""
+    from passlib.context import CryptContext
+
+    # min/max совпадают с default: хеши с другой стоимостью перехешируются при входе
+    return CryptContext(
+        schemes=["bcrypt"],
+        deprecated="auto",
+        bcrypt__default_rounds=settings.BCRYPT_ROUNDS,
+        bcrypt__min_rounds=settings.BCRYPT_ROUNDS,
+        bcrypt__max_rounds=settings.BCRYPT_ROUNDS,
+    )
+
+
+class PasswordHasher:
+    """
+    Ограниченный пул потоков для bcrypt (bcrypt отпускает GIL, поэтому потоки работают параллельно).
+    Если заняты все потоки и очередь, сразу отвечает 503 вместо зависания запроса.
+    """
+
+    def __init__(self, workers: int, queue_limit: int):
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="password-hasher")
+        self._capacity = workers + queue_limit
+        self._pending = 0
+
+    async def run(self, fn, *args):
+        # _pending меняется только в потоке event loop, блокировка не нужна
+        if self._pending >= self._capacity:
+            PASSWORD_HASH_REJECTED.inc()
+            raise HTTPException(status_code=503, detail="Сервер перегружен, повторите позже",
+                                headers={"Retry-After": "1"})
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+        submitted = time.perf_counter()
+
+        def job():
+            started = time.perf_counter()
+            PASSWORD_HASH_QUEUE_WAIT.observe(started - submitted)
+            try:
+                return fn(*args)
+            finally:
+                PASSWORD_HASH_LATENCY.observe(time.perf_counter() - started)
+
+        self._pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, job)
+        finally:
+            self._pending -= 1
+
+
+password_hasher = PasswordHasher(settings.PASSWORD_HASH_WORKERS, settings.PASSWORD_HASH_QUEUE_LIMIT)
 
 def hash_password(password: str):
-    return pwd_context.hash(password)
+    return pwd_context().hash(password)
 
 def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+    return pwd_context().verify(plain_password, hashed_password)
+
+async def hash_password_async(password: str) -> str:
+    return await password_hasher.run(pwd_context().hash, password)
+
+async def verify_and_update_password(plain_password, hashed_password) -> tuple[bool, str | None]:
+    """Проверяет пароль в пуле; второй элемент — новый хеш, если стоимость bcrypt устарела."""
+    return await password_hasher.run(pwd_context().verify_and_update, plain_password, hashed_password)
 
 def create_access_token(data: dict, expires_delta: timedelta | None = None):
     to_encode = data.copy()
     expire = datetime.utcnow() + (expires_delta or timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES))
-    to_encode.update({"exp": expire})
+    to_encode.update({"exp": expire, "jti": uuid.uuid4().hex})
     return jwt.encode(to_encode, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
@@ -0,0 +1,41 @@
+import asyncio
+import ipaddress
+import socket
+from urllib.parse import urlsplit
+
+from app.core.config import settings
+
+
+class UnsafeWebhookURL(ValueError):
+    """Адрес webhook ведёт во внутреннюю сеть: loopback, частные, link-local и другие не публичные адреса."""
+
+
+def is_public_address(address: str) -> bool:
+    ip = ipaddress.ip_address(address.split("%", 1)[0])
+    # ::ffff:127.0.0.1 — тот же loopback, проверяем вложенный IPv4
+    if ip.version == 6 and ip.ipv4_mapped:
+        ip = ip.ipv4_mapped
+    return ip.is_global and not ip.is_multicast
+
+
+async def check_webhook_url(url: str) -> str | None:
+    """
+    Проверяет, что все адреса хоста webhook публичные (защита от SSRF): при сохранении адреса
+    и перед каждой отправкой — имя могло начать разрешаться в другой адрес.
+    Возвращает проверенный адрес: отправка подключается к нему, не разрешая имя ещё раз (DNS rebinding).
+    UnsafeWebhookURL — адрес запрещён, OSError — имя не разрешилось (при отправке стоит повторить).
+    WEBHOOK_ALLOW_PRIVATE_ADDRESSES отключает проверку (локальная разработка, бенчмарки) и возвращает None.
+    """
+    if settings.WEBHOOK_ALLOW_PRIVATE_ADDRESSES:
+        return None
+    parts = urlsplit(url)
+    if not parts.hostname:
+        raise UnsafeWebhookURL("Webhook URL has no host")
+    try:
+        addresses = [str(ipaddress.ip_address(parts.hostname))]
+    except ValueError:
+        infos = await asyncio.get_running_loop().getaddrinfo(parts.hostname, parts.port, type=socket.SOCK_STREAM)
+        addresses = [sockaddr[0] for *_, sockaddr in infos]
+    if not addresses or not all(is_public_address(address) for address in addresses):
+        raise UnsafeWebhookURL("Webhook URL must point to a public address")
+    return addresses[0].split("%", 1)[0]
@@ -1,8 +1,245 @@
-from fastapi import HTTPException
-from app.routers.auth import redis_client
-
-def get_user_id_from_redis(token: str):
-    username = redis_client.get(token)  # Получаем username из Redis по токену
-    if username is None:
-        raise HTTPException(status_code=401, detail="Invalid or expired token.")
-    return username.decode('utf-8')  # Возвращаем строку, если username найден в Redis
\ No newline at end of file
+from collections import defaultdict
+from datetime import datetime
+
+from sqlalchemy import select, insert, update, func, and_, or_, exists, null
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.inbox_cache import inbox_cache
+from app.core.config import settings
+from app.core.envelope import notification_task
+from app.core.outbox import add_outbox_messages
+from app.core.rabbitmq import lane_queue
+from app.crud.user import get_subscription_periods
+from app.models.base import insert_ignore, use_primary
+from app.models.notification import Notification, NotificationShard, ScheduledNotification, user_notifications
+from app.schemas.notification import NotificationCreate, NotificationOut, NotificationPage, DeliveryProgress
+
+async def add_notifications(db: AsyncSession, notifications: list[NotificationCreate]) -> list[int]:
+    """
+    Вставляет уведомления одним INSERT ... RETURNING id, а задачи для воркера со снимком уведомления —
+    в outbox текущей транзакции, каждую в очередь своей полосы приоритета. Коммит — за вызывающим.
+    """
+    if not notifications:
+        return []
+    result = await db.execute(
+        insert(Notification).returning(Notification.id, Notification.created_at, sort_by_parameter_order=True),
+        [
+            {"title": n.title, "message": n.message,
+             "audience": n.audience.model_dump(exclude_none=True) if n.audience else None,
+             "channels": n.channels or None, "delivery": n.delivery, "priority": n.priority}
+            for n in notifications
+        ],
+    )
+    rows = result.all()
+    by_priority = defaultdict(list)
+    for (notification_id, created_at), n in zip(rows, notifications):
+        by_priority[n.priority].append(notification_task(notification_id, created_at, n))
+    for priority, messages in by_priority.items():
+        add_outbox_messages(db, messages, routing_key=lane_queue(settings.NOTIFICATION_QUEUE, priority))
+    return [notification_id for notification_id, _ in rows]
+
+async def schedule_notifications(db: AsyncSession, notifications: list[NotificationCreate]) -> list[int]:
+    """Откладывает уведомления до send_at: по строке scheduled_notifications на каждое. Коммит — за вызывающим."""
+    if not notifications:
+        return []
+    result = await db.execute(
+        insert(ScheduledNotification).returning(ScheduledNotification.id, sort_by_parameter_order=True),
+        [{"send_at": n.send_at, "payload": n.model_dump(mode="json", exclude={"send_at"})} for n in notifications],
+    )
+    return list(result.scalars().all())
+
+async def create_notifications(db: AsyncSession, notifications: list[NotificationCreate]
+                               ) -> tuple[list[int | None], list[int | None]]:
+    """
+    Создаёт уведомления и задачи для воркера в одной транзакции: уведомление без задачи (и наоборот) не появится.
+    Уведомления с send_at в будущем откладываются в scheduled_notifications.
+    Возвращает (ids, scheduled_ids) в порядке входного списка; на месте уведомления другого вида — None.
+    """
+    now = datetime.utcnow()
+    is_scheduled = [n.send_at is not None and n.send_at > now for n in notifications]
+    created = iter(await add_notifications(db, [n for n, s in zip(notifications, is_scheduled) if not s]))
+    scheduled = iter(await schedule_notifications(db, [n for n, s in zip(notifications, is_scheduled) if s]))
+    await db.commit()
+    ids = [None if s else next(created) for s in is_scheduled]
+    scheduled_ids = [next(scheduled) if s else None for s in is_scheduled]
+    return ids, scheduled_ids
+
+def _linked_notifications(user_id: int):
+    """Уведомления, связанные с пользователем в user_notifications (адресные и уже прочитанные рассылки)."""
+    return (
+        select(Notification.id, Notification.title, Notification.message, Notification.created_at,
+               user_notifications.c.read_at)
+        .join(user_notifications, user_notifications.c.notification_id == Notification.id)
+        .where(user_notifications.c.user_id == user_id)
+    )
+
+def _visible_broadcasts(user_id: int, periods: list[tuple]):
+    """
+    Общие рассылки, созданные, пока пользователь был подписан, и ещё не получившие связь с ним.
+    Связь появляется только при прочтении, поэтому такие рассылки всегда непрочитанные.
+    """
+    already_linked = exists().where(and_(
+        user_notifications.c.user_id == user_id,
+        user_notifications.c.notification_id == Notification.id,
+    ))
+    subscribed = or_(*(
+        and_(Notification.created_at >= started_at, Notification.created_at < ended_at)
+        if ended_at is not None else Notification.created_at >= started_at
+        for started_at, ended_at in periods
+    ))
+    return (
+        select(Notification.id, Notification.title, Notification.message, Notification.created_at,
+               null().label("read_at"))
+        .where(Notification.delivery == "broadcast", subscribed, ~already_linked)
+    )
+
+async def get_notifications_page(
+        db: AsyncSession,
+        user_id: int,
+        limit: int,
+        before_id: int | None = None,
+        after_created_at: datetime | None = None,
+        unread_only: bool = False,
+        periods: list[tuple] | None = None,
+):
+    """
+    Страница уведомлений пользователя от новых к старым (keyset-пагинация).
+    Все условия — границы по (user_id, notification_id), поэтому страница читается
+    диапазоном индекса за одинаковое время при любой длине истории.
+    Общие рассылки (fan-out при чтении) читаются вторым запросом по частичному индексу и сливаются по id.
+    periods — уже прочитанные периоды подписки пользователя.
+    """
+    targeted = _linked_notifications(user_id).order_by(user_notifications.c.notification_id.desc()).limit(limit)
+    queries = [(targeted, user_notifications.c.notification_id)]
+    if periods is None:
+        periods = await get_subscription_periods(db, user_id)
+    if periods:
+        broadcasts = _visible_broadcasts(user_id, periods).order_by(Notification.id.desc()).limit(limit)
+        queries.append((broadcasts, Notification.id))
+
+    rows = []
+    for query, id_column in queries:
+        if before_id is not None:
+            query = query.where(id_column < before_id)
+        if after_created_at is not None:
+            # id растут вместе с created_at: переводим время в нижнюю границу id по индексу created_at
+            first_id = select(func.min(Notification.id)).where(Notification.created_at > after_created_at)
+            query = query.where(id_column >= first_id.scalar_subquery())
+        if unread_only and id_column is user_notifications.c.notification_id:
+            query = query.where(user_notifications.c.read_at.is_(None))
+        rows.extend((await db.execute(query)).all())
+
+    rows.sort(key=lambda row: row.id, reverse=True)
+    items = [
+        NotificationOut(id=row.id, title=row.title, message=row.message,
+                        created_at=row.created_at, read_at=row.read_at)
+        for row in rows[:limit]
+    ]
+    next_before_id = items[-1].id if len(items) == limit else None
+    return NotificationPage(items=items, next_before_id=next_before_id)
+
+async def get_all_notifications(db: AsyncSession, user_id: int) -> list[NotificationOut]:
+    """
+    Все уведомления пользователя без пагинации (устаревший POST /notifications), от новых к старым:
+    связи из user_notifications и общие рассылки, которые пользователь видит в ленте.
+    """
+    rows = list((await db.execute(_linked_notifications(user_id))).all())
+    periods = await get_subscription_periods(db, user_id)
+    if periods:
+        rows.extend((await db.execute(_visible_broadcasts(user_id, periods))).all())
+    rows.sort(key=lambda row: row.id, reverse=True)
+    return [
+        NotificationOut(id=row.id, title=row.title, message=row.message,
+                        created_at=row.created_at, read_at=row.read_at)
+        for row in rows
+    ]
+
+async def get_cached_notifications_page(
+        db: AsyncSession,
+        user_id: int,
+        limit: int,
+        before_id: int | None = None,
+        after_created_at: datetime | None = None,
+        unread_only: bool = False,
+):
+    """Страница уведомлений через кеш входящих в Redis; фильтры и дальние страницы читаются из БД."""
+    if not inbox_cache.enabled or after_created_at is not None or unread_only or limit > inbox_cache.size:
+        return await get_notifications_page(db, user_id, limit, before_id, after_created_at, unread_only)
+
+    items = await inbox_cache.get(user_id, limit, before_id)
+    if items is None:
+        # Дальние страницы за пределами окна кеша читаются из БД без перезаполнения кеша
+        if before_id is not None:
+            return await get_notifications_page(db, user_id, limit, before_id)
+
+        # Промах первой страницы: прогреваем кеш последними size+1 уведомлениями одним запросом.
+        # Заполнение начинается до чтения из БД: уведомления, дописанные воркером в это время, не потеряются.
+        # Кеш заполняется только из основной БД: отстающая реплика закрепила бы в нём устаревшую ленту
+        ticket = await inbox_cache.begin_fill(user_id)
+        use_primary(db)
+        periods = await get_subscription_periods(db, user_id)
+        latest = (await get_notifications_page(db, user_id, inbox_cache.size + 1, periods=periods)).items
+        subscribed_since = next((started_at for started_at, ended_at in periods if ended_at is None), None)
+        await inbox_cache.fill(user_id, latest, ticket, subscribed_since)
+        items = latest[:limit]
+
+    next_before_id = items[-1].id if len(items) == limit else None
+    return NotificationPage(items=items, next_before_id=next_before_id)
+
+async def mark_notification_read(db: AsyncSession, user_id: int, notification_id: int) -> bool:
+    result = await db.execute(
+        update(user_notifications)
+        .where(user_notifications.c.user_id == user_id,
+               user_notifications.c.notification_id == notification_id,
+               user_notifications.c.read_at.is_(None))
+        .values(read_at=func.now())
+    )
+    updated = result.rowcount > 0
+    if not updated:
+        # Общая рассылка: связь создаётся только сейчас, уже с отметкой о прочтении
+        periods = await get_subscription_periods(db, user_id)
+        if periods:
+            visible = _visible_broadcasts(user_id, periods).where(Notification.id == notification_id)
+            if (await db.execute(visible)).first() is not None:
+                result = await db.execute(
+                    insert_ignore(user_notifications, db.get_bind().dialect.name)
+                    .values(user_id=user_id, notification_id=notification_id, read_at=func.now())
+                )
+                updated = result.rowcount > 0
+    await db.commit()
+    await inbox_cache.invalidate(user_id)
+    return updated
+
+def _seconds_since(column, dialect: str):
+    """
+    Секунды от column до текущего времени БД. created_at заполняет func.now() в часовом поясе сессии БД,
+    поэтому и «сейчас» берётся в БД, а не из datetime.utcnow() процесса.
+    """
+    if dialect == "sqlite":
+        return (func.julianday(func.now()) - func.julianday(column)) * 86400
+    return func.extract("epoch", func.now() - column)
+
+async def get_delivery_progress(db: AsyncSession, notification_id: int) -> DeliveryProgress:
+    started_at = func.min(NotificationShard.created_at)
+    total, done, linked, started_at, last_done_at, elapsed = (await db.execute(
+        select(
+            func.count(),
+            func.count(NotificationShard.done_at),
+            func.coalesce(func.sum(NotificationShard.linked), 0),
+            started_at,
+            func.max(NotificationShard.done_at),
+            _seconds_since(started_at, db.get_bind().dialect.name),
+        ).where(NotificationShard.notification_id == notification_id)
+    )).one()
+
+    finished_at = last_done_at if total and done == total else None
+    eta_seconds = None
+    if elapsed is not None and done and done < total:
+        elapsed = float(elapsed)
+        eta_seconds = round(elapsed / done * (total - done), 1)
+    elif total and done == total:
+        eta_seconds = 0.0
+
+    return DeliveryProgress(notification_id=notification_id, shards_total=total, shards_done=done,
+                            users_linked=linked, started_at=started_at, finished_at=finished_at,
+                            eta_seconds=eta_seconds)
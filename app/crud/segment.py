@@ -0,0 +1,43 @@
+from sqlalchemy import select, delete
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.models import User
+from app.models.base import insert_ignore
+from app.models.segment import Segment, segment_members, user_tags
+
+async def get_segment_by_name(db: AsyncSession, name: str):
+    result = await db.execute(select(Segment).where(Segment.name == name))
+    return result.scalars().first()
+
+async def get_missing_user_ids(db: AsyncSession, user_ids: list[int]) -> list[int]:
+    result = await db.execute(select(User.id).where(User.id.in_(set(user_ids))))
+    return sorted(set(user_ids) - set(result.scalars().all()))
+
+async def create_segment(db: AsyncSession, name: str, user_ids: list[int]):
+    db_segment = Segment(name=name)
+    db.add(db_segment)
+    await db.flush()
+    if user_ids:
+        await db.execute(insert_ignore(segment_members, db.get_bind().dialect.name),
+                         [{"segment_id": db_segment.id, "user_id": user_id} for user_id in set(user_ids)])
+    await db.commit()
+    await db.refresh(db_segment)
+    return db_segment
+
+async def add_segment_members(db: AsyncSession, segment_id: int, user_ids: list[int]):
+    await db.execute(insert_ignore(segment_members, db.get_bind().dialect.name),
+                     [{"segment_id": segment_id, "user_id": user_id} for user_id in set(user_ids)])
+    await db.commit()
+
+async def remove_segment_members(db: AsyncSession, segment_id: int, user_ids: list[int]):
+    await db.execute(delete(segment_members).where(segment_members.c.segment_id == segment_id,
+                                                   segment_members.c.user_id.in_(user_ids)))
+    await db.commit()
+
+async def add_user_tags(db: AsyncSession, user_ids: list[int], tags: list[str]):
+    await db.execute(insert_ignore(user_tags, db.get_bind().dialect.name),
+                     [{"user_id": user_id, "tag": tag} for user_id in set(user_ids) for tag in set(tags)])
+    await db.commit()
+
+async def remove_user_tags(db: AsyncSession, user_ids: list[int], tags: list[str]):
+    await db.execute(delete(user_tags).where(user_tags.c.user_id.in_(user_ids), user_tags.c.tag.in_(tags)))
+    await db.commit()
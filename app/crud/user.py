@@ -1,16 +1,60 @@
-from sqlalchemy.orm import Session
-from app.models.user import User
+from sqlalchemy import select, update, func
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.models.user import User, SubscriptionPeriod
 from app.schemas.user import UserCreate
-from app.core.security import hash_password
+from app.core.cache import TTLCache
+from app.core.config import settings
+from app.core.metrics import cache_collector
+from app.core.security import hash_password_async
 
-def get_user_by_username(db: Session, username: str):
-    return db.query(User).filter(User.username == username).first()
+# username -> id; отсутствующие имена не кешируются, чтобы только что зарегистрированный пользователь был виден сразу
+user_id_cache = TTLCache(settings.USER_ID_CACHE_SIZE, settings.USER_ID_CACHE_TTL)
+cache_collector.register("user_id", user_id_cache)
 
-def create_user(db: Session, user: UserCreate):
-    hashed_password = hash_password(user.password)
-    db_user = User(username=user.username, hashed_password=hashed_password)
+async def get_user_by_username(db: AsyncSession, username: str):
+    result = await db.execute(select(User).where(User.username == username))
+    return result.scalars().first()
+
+async def get_user_id(db: AsyncSession, username: str) -> int | None:
+    """id пользователя по имени: из кеша процесса, при промахе — одна колонка по индексу username."""
+    user_id = user_id_cache.get(username)
+    if user_id is None:
+        user_id = (await db.execute(select(User.id).where(User.username == username))).scalar()
+        if user_id is not None:
+            user_id_cache.set(username, user_id)
+    return user_id
+
+async def create_user(db: AsyncSession, user: UserCreate):
+    hashed_password = await hash_password_async(user.password)
+    db_user = User(username=user.username, email=user.email, hashed_password=hashed_password)
     db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    await db.flush()
+    # Новый пользователь подписан: с этого момента ему видны общие рассылки
+    await record_subscription(db, db_user.id, subscribed=True)
+    await db.commit()
+    await db.refresh(db_user)
+    user_id_cache.set(db_user.username, db_user.id)
     return db_user
 
+async def update_password_hash(db: AsyncSession, db_user: User, hashed_password: str):
+    db_user.hashed_password = hashed_password
+    await db.commit()
+
+async def record_subscription(db: AsyncSession, user_id: int, subscribed: bool):
+    """Открывает или закрывает период подписки пользователя (без коммита)."""
+    if subscribed:
+        db.add(SubscriptionPeriod(user_id=user_id))
+    else:
+        await db.execute(
+            update(SubscriptionPeriod)
+            .where(SubscriptionPeriod.user_id == user_id, SubscriptionPeriod.ended_at.is_(None))
+            .values(ended_at=func.now())
+        )
+
+async def get_subscription_periods(db: AsyncSession, user_id: int) -> list[tuple]:
+    """Периоды подписки пользователя: [(started_at, ended_at | None)]."""
+    result = await db.execute(
+        select(SubscriptionPeriod.started_at, SubscriptionPeriod.ended_at)
+        .where(SubscriptionPeriod.user_id == user_id)
+    )
+    return [tuple(row) for row in result.all()]
@@ -1,2 +1,4 @@
-from app.models.user import User
-from app.models.notification import Notification
+from app.models.user import User, SubscriptionPeriod
+from app.models.notification import Notification, NotificationShard, ScheduledNotification
+from app.models.segment import Segment
+from app.models.outbox import OutboxMessage
@@ -1,16 +1,156 @@
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine, async_sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
-from sqlalchemy import create_engine
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy import Engine, Select, create_engine, insert
 from app.core.config import settings
+from app.core.metrics import DB_READ_SESSIONS_PINNED, DB_REPLICA_READS, instrument_engine
 
-engine = create_engine(settings.DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+def _pool_options(url: str) -> dict:
+    options = {"pool_pre_ping": settings.DB_POOL_PRE_PING}
+    if not url.startswith("sqlite"):
+        options.update(
+            pool_size=settings.DB_POOL_SIZE,
+            max_overflow=settings.DB_MAX_OVERFLOW,
+            pool_timeout=settings.DB_POOL_TIMEOUT,
+            pool_recycle=settings.DB_POOL_RECYCLE,
+        )
+    return options
+
+
+# Движки создаются при первом обращении, а не при импорте: импорт модуля не загружает драйвер БД
+# и не требует доступной базы. API закрывает пулы в lifespan (dispose_engines), воркеры — при выходе.
+_engines: dict[str, Engine | AsyncEngine] = {}
+
+
+def get_engine() -> Engine:
+    """Синхронный движок — для воркера и миграций."""
+    if "sync" not in _engines:
+        _engines["sync"] = create_engine(settings.DATABASE_URL, **_pool_options(settings.DATABASE_URL))
+        instrument_engine(_engines["sync"])
+    return _engines["sync"]
+
+
+def get_async_engine() -> AsyncEngine:
+    """Асинхронный движок — для эндпоинтов API, чтобы запросы к БД не блокировали event loop."""
+    if "async" not in _engines:
+        _engines["async"] = create_async_engine(settings.ASYNC_DATABASE_URL,
+                                                **_pool_options(settings.ASYNC_DATABASE_URL))
+        instrument_engine(_engines["async"].sync_engine)
+    return _engines["async"]
+
+
+def has_read_replica() -> bool:
+    return bool(settings.READ_DATABASE_URL)
+
+
+def get_async_read_engine() -> AsyncEngine:
+    """Движок реплики для маршрутов чтения; без READ_DATABASE_URL — основной движок."""
+    if not has_read_replica():
+        return get_async_engine()
+    if "async_read" not in _engines:
+        _engines["async_read"] = create_async_engine(settings.ASYNC_READ_DATABASE_URL,
+                                                     **_pool_options(settings.ASYNC_READ_DATABASE_URL))
+        instrument_engine(_engines["async_read"].sync_engine)
+    return _engines["async_read"]
+
+
+async def dispose_engines():
+    """Закрывает пулы соединений созданных движков; следующее обращение создаст движки заново."""
+    engines = list(_engines.values())
+    _engines.clear()
+    for engine in engines:
+        if isinstance(engine, AsyncEngine):
+            await engine.dispose()
+        else:
+            engine.dispose()
+
+
+class SyncSession(Session):
+    """Сессия воркера: движок берётся при первом запросе, а не при создании фабрики сессий."""
+
+    def get_bind(self, mapper=None, **kw):
+        return self.bind or get_engine()
+
+
+def _is_read(clause) -> bool:
+    return isinstance(clause, Select) and clause._for_update_arg is None
+
+
+class AsyncBindSession(Session):
+    """
+    Синхронная часть AsyncSession: движок API берётся при первом запросе.
+    Сессия чтения (info["replica"], см. get_read_db) отправляет SELECT без FOR UPDATE в реплику,
+    всё остальное — в основную БД. После первой записи сессия до конца читает из основной БД,
+    чтобы в одном запросе API были видны собственные изменения.
+    """
+
+    def get_bind(self, mapper=None, clause=None, **kw):
+        if self.bind:
+            return self.bind
+        if self.info.get("replica"):
+            if self._flushing or (clause is not None and not _is_read(clause)):
+                self.info["replica"] = False
+            elif clause is not None:
+                DB_REPLICA_READS.inc()
+                return get_async_read_engine().sync_engine
+        return get_async_engine().sync_engine
+
+
+SessionLocal = sessionmaker(class_=SyncSession, autocommit=False, autoflush=False)
+AsyncSessionLocal = async_sessionmaker(sync_session_class=AsyncBindSession, autoflush=False, expire_on_commit=False)
+
+
+def __getattr__(name: str):
+    # Прежние имена модуля: from app.models.base import engine создаёт движок в момент импорта имени
+    if name == "engine":
+        return get_engine()
+    if name == "async_engine":
+        return get_async_engine()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 Base = declarative_base()
 
+def create_sqlite_schema() -> bool:
+    """
+    Локальная разработка на SQLite: миграции Alembic рассчитаны на PostgreSQL (ALTER ограничений,
+    секционирование), поэтому таблицы SQLite создаются по моделям; существующие create_all пропускает.
+    Для других БД ничего не делает и возвращает False — схемой управляет Alembic.
+    """
+    if not settings.DATABASE_URL.startswith("sqlite"):
+        return False
+    import app.models  # noqa: F401 — все модели должны попасть в metadata
+    Base.metadata.create_all(get_engine())
+    return True
+
+def insert_ignore(table, dialect: str):
+    """INSERT, который пропускает строки с уже существующим первичным ключом."""
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as pg_insert
+        return pg_insert(table).on_conflict_do_nothing()
+    if dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+        return sqlite_insert(table).on_conflict_do_nothing()
+    return insert(table)
+
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
         db.close()
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+async def get_read_db():
+    """Сессия маршрутов чтения: SELECT идут в реплику (READ_DATABASE_URL), запись — в основную БД."""
+    async with AsyncSessionLocal(info={"replica": has_read_replica()}) as db:
+        yield db
+
+def use_primary(db):
+    """Дальнейшие запросы сессии чтения идут в основную БД (read-your-writes, заполнение кешей)."""
+    if db.info.get("replica"):
+        db.info["replica"] = False
+        DB_READ_SESSIONS_PINNED.inc()
@@ -1,4 +1,4 @@
-from sqlalchemy import Table, Column, Integer, ForeignKey, String, DateTime
+from sqlalchemy import DDL, Table, Column, Integer, ForeignKey, String, DateTime, Index, JSON, Boolean, event, false
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from app.models.base import Base
@@ -9,7 +9,35 @@ user_notifications = Table(
     Base.metadata,
     Column("user_id", Integer, ForeignKey("users.id"), primary_key=True),
     Column("notification_id", Integer, ForeignKey("notifications.id"), primary_key=True),
+    Column("read_at", DateTime, nullable=True),  # NULL — уведомление не прочитано
+    # На PostgreSQL таблица секционирована по диапазонам notification_id: id растут вместе с created_at,
+    # поэтому каждая секция — отрезок времени, и устаревшая история удаляется DROP секции целиком.
+    # Секции создаёт заранее задача хранения (workers/retention.py), DEFAULT принимает строки вне секций.
+    postgresql_partition_by="RANGE (notification_id)",
 )
+event.listen(
+    user_notifications,
+    "after_create",
+    DDL("CREATE TABLE user_notifications_default PARTITION OF user_notifications DEFAULT")
+    .execute_if(dialect="postgresql"),
+)
+
+# Лента пользователя читается страницами от новых к старым по первичному ключу (user_id, notification_id):
+# B-дерево читается в обратном порядке, отдельный индекс по (user_id, notification_id DESC) не нужен
+# Только непрочитанные — частичный индекс, не растёт вместе с прочитанной историей
+Index(
+    "ix_user_notifications_unread",
+    user_notifications.c.user_id,
+    user_notifications.c.notification_id.desc(),
+    postgresql_where=user_notifications.c.read_at.is_(None),
+    sqlite_where=user_notifications.c.read_at.is_(None),
+)
+# Для удаления устаревших связей пачками по порядку notification_id; на PostgreSQL не нужен — там удаляются секции
+Index(
+    "ix_user_notifications_notification_id",
+    user_notifications.c.notification_id,
+    user_notifications.c.user_id,
+).ddl_if(callable_=lambda ddl, target, bind, dialect, **kw: dialect.name != "postgresql")
 
 class Notification(Base):
     __tablename__ = "notifications"
@@ -17,6 +45,47 @@ class Notification(Base):
     id = Column(Integer, primary_key=True)
     title = Column(String)
     message = Column(String)
-    created_at = Column(DateTime, default=func.now())
+    created_at = Column(DateTime, default=func.now(), index=True)
+    # Аудитория: {"user_ids": [...], "segment": "...", "tags": [...]}; NULL — все подписчики
+    audience = Column(JSON(none_as_null=True), nullable=True)
+    # Внешние каналы доставки: ["email", "webhook"]; NULL — только лента в приложении
+    channels = Column(JSON(none_as_null=True), nullable=True)
+    # fanout — связь с каждым получателем создаётся при рассылке; broadcast — уведомление для всех подписчиков
+    # хранится одной строкой и подмешивается в ленту при чтении, связь создаётся только при прочтении
+    delivery = Column(String, nullable=False, default="fanout", server_default="fanout")
+    # Полоса приоритета: в её очереди уходят задача планирования и части рассылки
+    priority = Column(String, nullable=False, default="normal", server_default="normal")
 
     users = relationship("User", secondary=user_notifications, back_populates="notifications")
+
+    __table_args__ = (
+        # Общие рассылки читаются для каждой ленты: частичный индекс только по ним
+        Index("ix_notifications_broadcast", "id",
+              postgresql_where=delivery == "broadcast", sqlite_where=delivery == "broadcast"),
+    )
+
+class ScheduledNotification(Base):
+    """
+    Отложенное уведомление: до send_at хранится здесь, а не в notifications, — в ленты и рассылку не попадает.
+    Планировщик API забирает наступившие записи пачками по индексу send_at и создаёт из них обычные уведомления.
+    """
+    __tablename__ = "scheduled_notifications"
+
+    id = Column(Integer, primary_key=True)
+    send_at = Column(DateTime, nullable=False, index=True)  # UTC
+    payload = Column(JSON, nullable=False)  # NotificationCreate без send_at
+    created_at = Column(DateTime, default=func.now())
+
+class NotificationShard(Base):
+    """Часть рассылки: диапазон users.id [start_user_id, end_user_id], обрабатываемый одним воркером."""
+    __tablename__ = "notification_shards"
+
+    notification_id = Column(Integer, ForeignKey("notifications.id"), primary_key=True)
+    shard_no = Column(Integer, primary_key=True)
+    start_user_id = Column(Integer, nullable=False)
+    end_user_id = Column(Integer, nullable=False)
+    linked = Column(Integer, nullable=False, default=0)  # Сколько связей создано этой частью
+    created_at = Column(DateTime, default=func.now())
+    done_at = Column(DateTime, nullable=True)
+    # Задачи доставки (и объявление общей рассылки) опубликованы: повторная доставка части их не повторяет
+    delivery_published = Column(Boolean, nullable=False, default=False, server_default=false())
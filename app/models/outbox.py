@@ -0,0 +1,14 @@
+from datetime import datetime
+
+from sqlalchemy import Column, Integer, String, DateTime, JSON
+from app.models.base import Base
+
+class OutboxMessage(Base):
+    """Сообщение для RabbitMQ, записанное в одной транзакции с данными; удаляется после публикации."""
+    __tablename__ = "outbox"
+
+    id = Column(Integer, primary_key=True)
+    routing_key = Column(String, nullable=False)
+    payload = Column(JSON, nullable=False)
+    # Время в UTC со стороны приложения: по нему relay считает задержку публикации
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
@@ -0,0 +1,29 @@
+from sqlalchemy import Table, Column, Integer, ForeignKey, String, DateTime, Index
+from sqlalchemy.sql import func
+from app.models.base import Base
+
+# Участники именованного сегмента; (segment_id, user_id) — диапазонное чтение id участников
+segment_members = Table(
+    "segment_members",
+    Base.metadata,
+    Column("segment_id", Integer, ForeignKey("segments.id", ondelete="CASCADE"), primary_key=True),
+    Column("user_id", Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True),
+)
+
+# Теги (атрибуты) пользователей
+user_tags = Table(
+    "user_tags",
+    Base.metadata,
+    Column("user_id", Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True),
+    Column("tag", String, primary_key=True),
+)
+
+# Поиск пользователей по тегу: (tag, user_id)
+Index("ix_user_tags_tag_user_id", user_tags.c.tag, user_tags.c.user_id)
+
+class Segment(Base):
+    __tablename__ = "segments"
+
+    id = Column(Integer, primary_key=True)
+    name = Column(String, unique=True, index=True, nullable=False)
+    created_at = Column(DateTime, default=func.now())
@@ -1,5 +1,6 @@
-from sqlalchemy import Column, Integer, String, Boolean
+from sqlalchemy import Column, Integer, String, Boolean, Index, ForeignKey, DateTime
 from sqlalchemy.orm import relationship
+from sqlalchemy.sql import func
 from app.models.base import Base
 from app.models.notification import user_notifications  # Импортируем связь
 
@@ -11,5 +12,24 @@ class User(Base):
     hashed_password = Column(String)
     email = Column(String, unique=True, index=True)
     receive_notifications = Column(Boolean, default=True)
+    webhook_url = Column(String, nullable=True)  # Адрес для доставки уведомлений через webhook
 
     notifications = relationship("Notification", secondary=user_notifications, back_populates="users")
+
+    __table_args__ = (
+        # Частичный индекс по подписчикам: рассылка читает только их id, не касаясь остальных строк
+        Index("ix_users_subscribed", "id",
+              postgresql_where=receive_notifications == True, sqlite_where=receive_notifications == True),
+    )
+
+class SubscriptionPeriod(Base):
+    """
+    Период, когда пользователь был подписан на уведомления: [started_at, ended_at), ended_at NULL — подписан сейчас.
+    По периодам при чтении определяется, какие общие рассылки (delivery="broadcast") пользователь должен видеть.
+    """
+    __tablename__ = "subscription_periods"
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
+    started_at = Column(DateTime, nullable=False, default=func.now())
+    ended_at = Column(DateTime, nullable=True)
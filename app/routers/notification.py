@@ -1,124 +1,303 @@
+import asyncio
 import json
+from datetime import datetime, timedelta
 
-import jwt
-import pika
-from fastapi import APIRouter, Depends, HTTPException, Header
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Header, Query, Request
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import StreamingResponse
+from pydantic import TypeAdapter, ValidationError
+from sqlalchemy import update, not_
+from sqlalchemy.ext.asyncio import AsyncSession
 from starlette import status
 
+from app.core.auth import STREAM_TOKEN_SCOPE, get_current_user, get_stream_user, get_user_read_db
 from app.core.config import settings
-from app.crud.user import get_user_by_username
-from app.crud.notification import get_user_id_from_redis
+from app.core.dedup import notification_deduplicator
+from app.core.inbox_cache import inbox_cache
+from app.core.metrics import aggregated_log
+from app.core.outbox import outbox_relay
+from app.core.push import publish_subscription, push_hub
+from app.core.rate_limit import get_principal, rate_limit
+from app.core.read_your_writes import recent_writes
+from app.core.security import create_access_token
+from app.crud.user import get_user_by_username, record_subscription
+from app.crud.notification import get_cached_notifications_page, mark_notification_read, \
+    get_delivery_progress, create_notifications, get_all_notifications
 from app.models import User
-from app.models.base import get_db
-from app.models.notification import Notification, user_notifications
-from app.routers.auth import oauth2_scheme
-from app.schemas.notification import NotificationCreate, NotificationOut
+from app.models.base import get_async_db, get_read_db
+from app.schemas.notification import NotificationCreate, NotificationOut, NotificationPage, DeliveryProgress, \
+    NotificationBatchOut
+from app.schemas.user import CurrentUser
 import logging
 
 router = APIRouter()
 
+notification_batch_adapter = TypeAdapter(list[NotificationCreate])
+
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 
-def get_rabbitmq_connection():
-    try:
-        connection = pika.BlockingConnection(pika.ConnectionParameters(host="localhost"))
-        logging.info(f"✅ Подключение к RabbitMQ успешно!")
-        return connection
-    except Exception as e:
-        logging.error(f"❌ Ошибка подключения к RabbitMQ: {e}")
-        return None
-
-@router.post("/send_notifications", summary="Отправка уведомлений пользователям")
-async def send_notifications(notification: NotificationCreate, db: Session = Depends(get_db)):
+@router.post("/send_notifications", summary="Отправка уведомлений пользователям",
+             dependencies=[Depends(rate_limit("send"))])
+async def send_notifications(
+    notification: NotificationCreate,
+    request: Request,
+    idempotency_key: str | None = Header(None, max_length=255, description="Ключ повтора: запросы с тем же ключом "
+                                                                           "создают одно уведомление"),
+    db: AsyncSession = Depends(get_async_db),
+):
     """
     **Отправка уведомлений пользователям**
     - Создаёт уведомление в БД.
-    - Отправляет сообщение через RabbitMQ для дальнейшей обработки.
+    - В той же транзакции записывает задачу в outbox, откуда она уходит в RabbitMQ в фоне,
+      в очередь полосы priority: high обрабатывается воркером раньше накопившихся рассылок.
+    - С send_at в будущем уведомление откладывается и создаётся планировщиком в срок; ответ содержит scheduled_id.
+    - Повтор с тем же Idempotency-Key (или такое же уведомление в окне NOTIFICATION_COALESCE_WINDOW)
+      не создаёт новой рассылки и возвращает id первого уведомления (или scheduled_id отложенного) с duplicate=true.
+    - Idempotency-Key действует в пределах отправителя; тот же ключ с другим телом запроса — 422.
     """
-    # Создаём уведомление в БД
-    db_notification = Notification(title=notification.title, message=notification.message)
-    db.add(db_notification)
-    db.commit()
-    db.refresh(db_notification)
+    claim = await notification_deduplicator.claim(notification, idempotency_key, get_principal(request))
+    if claim.conflict:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                            detail="Idempotency-Key уже использован с другим телом запроса")
+    if not claim.claimed:
+        if claim.scheduled_id is not None:
+            return {"message": "Уведомление уже запланировано", "scheduled_id": claim.scheduled_id,
+                    "duplicate": True}
+        return {"message": "Уведомление уже поставлено в очередь для отправки",
+                "notification_id": claim.notification_id, "duplicate": True}
 
-    # Создаём подключение к RabbitMQ
-    connection = get_rabbitmq_connection()
-    if not connection:
-        raise HTTPException(status_code=500, detail="Ошибка подключения к RabbitMQ")
+    try:
+        # Уведомление и задача фиксируются одной транзакцией, relay опубликует задачу после коммита
+        [notification_id], [scheduled_id] = await create_notifications(db, [notification])
+    except BaseException:
+        # В том числе CancelledError (остановка сервера, отменённый запрос): иначе повтор считался бы дублем
+        await notification_deduplicator.release(claim)
+        raise
 
-    channel = connection.channel()
-    channel.queue_declare(queue="notification_tasks")
+    if scheduled_id is not None:
+        # Повтор получит scheduled_id: уведомление создаст планировщик в срок
+        await notification_deduplicator.complete(claim, scheduled_id=scheduled_id)
+        aggregated_log.event("🕒 Уведомлений отложено до send_at")
+        return {"message": "Уведомление запланировано", "scheduled_id": scheduled_id,
+                "send_at": notification.send_at, "duplicate": False}
 
-    # Формируем сообщение для отправки в очередь
-    message = {
-        "notification_id": db_notification.id,
-        "title": notification.title,
-        "message": notification.message,
-    }
+    await notification_deduplicator.complete(claim, notification_id)
+    outbox_relay.notify()
+    aggregated_log.event("✅ Задач на отправку уведомлений добавлено в outbox")
 
-    # Отправляем сообщение в очередь для обработки
-    channel.basic_publish(exchange="", routing_key="notification_tasks", body=json.dumps(message))
-    logging.info(f"✅ Задача по отправке уведомления добавлена в очередь RabbitMQ")
+    return {"message": "Уведомление поставлено в очередь для отправки",
+            "notification_id": notification_id, "duplicate": False}
 
-    connection.close()
 
-    return {"message": "Уведомление поставлено в очередь для отправки"}
+async def read_notification_batch(request: Request) -> list[NotificationCreate]:
+    """Читает пачку уведомлений: JSON-массив или NDJSON (по одному объекту в строке, можно потоком)."""
+    max_size = settings.NOTIFICATION_BATCH_MAX_SIZE
+    try:
+        if request.headers.get("content-type", "").startswith("application/x-ndjson"):
+            batch, tail = [], b""
+            async for chunk in request.stream():
+                *lines, tail = (tail + chunk).split(b"\n")
+                batch.extend(NotificationCreate.model_validate_json(line) for line in lines if line.strip())
+                if len(batch) > max_size:
+                    break
+            if tail.strip():
+                batch.append(NotificationCreate.model_validate_json(tail))
+        else:
+            batch = notification_batch_adapter.validate_json(await request.body())
+    except ValidationError as e:
+        raise RequestValidationError(e.errors(include_url=False))
 
+    if len(batch) > max_size:
+        raise HTTPException(status_code=413, detail=f"Не больше {max_size} уведомлений в одном запросе")
+    return batch
 
-@router.post("/notifications", response_model=list[NotificationOut])
-async def get_user_notifications(
-    token: str = Depends(oauth2_scheme),  # Получаем токен из заголовка Authorization
-    db: Session = Depends(get_db),     # Подключение к базе данных
+
+@router.post(
+    "/send_notifications/batch",
+    response_model=NotificationBatchOut,
+    summary="Пакетная отправка уведомлений",
+    dependencies=[Depends(rate_limit("send_batch"))],
+    openapi_extra={"requestBody": {"required": True, "content": {
+        "application/json": {"schema": {"type": "array", "items": NotificationCreate.model_json_schema()}},
+        "application/x-ndjson": {"schema": NotificationCreate.model_json_schema()},
+    }}},
+)
+async def send_notifications_batch(
+    request: Request,
+    idempotency_key: str | None = Header(None, max_length=255, description="Ключ повтора: запросы с тем же ключом "
+                                                                           "создают уведомления один раз"),
+    db: AsyncSession = Depends(get_async_db),
 ):
+    """
+    **Пакетная отправка уведомлений**
+    - Принимает JSON-массив или NDJSON-поток уведомлений.
+    - Создаёт все уведомления одним INSERT ... RETURNING и одним коммитом.
+    - В той же транзакции записывает задачи в outbox, откуда они уходят в RabbitMQ пачками в фоне.
+    - Отложенные (send_at в будущем) записываются в scheduled_notifications.
+    - Возвращает id уведомлений (для отложенных — scheduled_ids) в порядке входных данных.
+    - Повтор с тем же Idempotency-Key возвращает ответ первого запроса с duplicate=true
+      (пустые ids, если первый запрос ещё выполняется); тот же ключ с другой пачкой — 422.
+    """
+    batch = await read_notification_batch(request)
+    if not batch:
+        return {"ids": [], "scheduled_ids": []}
+
+    claim = await notification_deduplicator.claim_batch(batch, idempotency_key, get_principal(request))
+    if claim.conflict:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                            detail="Idempotency-Key уже использован с другим телом запроса")
+    if not claim.claimed:
+        return {**(claim.batch or {"ids": [], "scheduled_ids": []}), "duplicate": True}
+
     try:
-        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=["HS256"])
-        username = payload.get("sub")
+        ids, scheduled_ids = await create_notifications(db, batch)
+    except BaseException:
+        await notification_deduplicator.release(claim)
+        raise
+    await notification_deduplicator.complete_batch(claim, ids, scheduled_ids)
+    outbox_relay.notify()
 
-        if not username:
-            raise HTTPException(status_code=400, detail="Invalid token")
+    logging.info(f"✅ В outbox добавлено задач: {sum(i is not None for i in ids)}, "
+                 f"отложено: {sum(i is not None for i in scheduled_ids)}")
+    return {"ids": ids, "scheduled_ids": scheduled_ids}
 
-        user = db.query(User).filter(User.username == username).first()
 
-        if not user:
-            raise HTTPException(status_code=404, detail="User not found")
+@router.get("/{notification_id}/progress", response_model=DeliveryProgress, summary="Прогресс рассылки",
+            dependencies=[Depends(get_current_user)])
+async def delivery_progress(notification_id: int, db: AsyncSession = Depends(get_read_db)):
+    """
+    **Прогресс рассылки уведомления**
+    - Рассылка делится на части по диапазонам id пользователей, части обрабатываются воркерами параллельно.
+    - Возвращает число частей всего и готовых, созданных связей и оценку оставшегося времени.
+    - Читается из реплики: прогресс может отставать на время репликации.
+    """
+    progress = await get_delivery_progress(db, notification_id)
+    if not progress.shards_total:
+        raise HTTPException(status_code=404, detail="Delivery not planned yet")
+    return progress
 
-        # Получаем уведомления для пользователя из промежуточной таблицы
-        notifications = db.query(Notification).join(
-            user_notifications, user_notifications.c.notification_id == Notification.id
-        ).filter(user_notifications.c.user_id == user.id).all()
 
-        if not notifications:
-            raise HTTPException(status_code=404, detail="No notifications found for this user")
+@router.get("/notifications", response_model=NotificationPage, summary="Уведомления пользователя (постранично)")
+async def list_user_notifications(
+    limit: int = Query(20, ge=1, le=100, description="Размер страницы"),
+    before_id: int | None = Query(None, description="Курсор: уведомления старше этого id (next_before_id)"),
+    after_created_at: datetime | None = Query(None, description="Только уведомления, созданные после этого времени"),
+    unread_only: bool = Query(False, description="Только непрочитанные"),
+    user: CurrentUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_user_read_db),
+):
+    """
+    **Лента уведомлений пользователя**
+    - Возвращает страницу от новых к старым и курсор next_before_id для следующей страницы.
+    - Каждая страница — диапазонное чтение индекса, стоимость не зависит от длины истории.
+    - Последние уведомления отдаются из кеша входящих в Redis, при промахе — из реплики
+      (после своих изменений, например отметки о прочтении, — из основной БД).
+    """
+    return await get_cached_notifications_page(db, user.id, limit, before_id, after_created_at, unread_only)
 
-        return notifications
 
-    except jwt.ExpiredSignatureError:
-        raise HTTPException(status_code=401, detail="Token has expired")
-    except jwt.JWTError:
-        raise HTTPException(status_code=401, detail="Invalid token")
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+async def notification_events(user_id: int, subscribed: bool = True):
+    """События SSE подписчика: уведомления, heartbeat-комментарии и reset при переполнении очереди."""
+    subscriber = push_hub.subscribe(user_id, subscribed)
+    try:
+        # Клиент переподключается через 5 с, если соединение оборвалось
+        yield "retry: 5000\n\n"
+        while not subscriber.overflowed:
+            try:
+                event = await asyncio.wait_for(subscriber.queue.get(), settings.PUSH_HEARTBEAT_INTERVAL)
+            except asyncio.TimeoutError:
+                yield ": ping\n\n"
+                continue
+            if not subscriber.subscribed:
+                # Подписку отключили, пока событие ждало в очереди
+                continue
+            yield f"event: notification\nid: {event['id']}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+        # Клиент не успевал читать: пропущенное он дочитывает через /notifications
+        yield "event: reset\ndata: {}\n\n"
+    finally:
+        push_hub.unsubscribe(subscriber)
 
 
-@router.post("/toggle-notifications")
-async def toggle_notifications(
-        token: str = Depends(oauth2_scheme),
-        db: Session = Depends(get_db)
+@router.post("/stream/token", summary="Токен для потока уведомлений")
+async def create_stream_token(user: CurrentUser = Depends(get_current_user)):
+    """
+    **Токен потока уведомлений**
+    - Для клиентов без заголовков (EventSource в браузере): GET /stream?token=<stream_token>.
+    - Действует STREAM_TOKEN_TTL секунд и только для /stream: URL с токеном попадает в логи сервера и прокси,
+      поэтому токен входа в нём не принимается.
+    - Проверяется при открытии потока; для переподключения после истечения нужен новый токен.
+    """
+    stream_token = create_access_token({"sub": user.username, "scope": STREAM_TOKEN_SCOPE},
+                                       expires_delta=timedelta(seconds=settings.STREAM_TOKEN_TTL))
+    return {"stream_token": stream_token, "expires_in": settings.STREAM_TOKEN_TTL}
+
+
+@router.get("/stream", summary="Поток новых уведомлений (SSE)")
+async def stream_notifications(user: CurrentUser = Depends(get_stream_user)):
+    """
+    **Поток новых уведомлений (Server-Sent Events)**
+    - Токен входа передаётся в заголовке Authorization; EventSource в браузере передаёт параметром token
+      короткий токен из POST /stream/token.
+    - Отправляет событие notification сразу после fan-out, без опроса /notifications.
+    - Раз в PUSH_HEARTBEAT_INTERVAL секунд отправляет комментарий-heartbeat, чтобы прокси не закрывали соединение.
+    - Если клиент не успевает читать и его очередь переполнилась, поток закрывается событием reset.
+    """
+    if not push_hub.has_capacity:
+        raise HTTPException(status_code=503, detail="Too many open streams", headers={"Retry-After": "5"})
+    events = notification_events(user.id, user.receive_notifications is not False)
+    return StreamingResponse(events, media_type="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",
+    })
+
+
+@router.post("/notifications/{notification_id}/read", summary="Отметить уведомление прочитанным")
+async def read_notification(
+    notification_id: int,
+    user: CurrentUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
 ):
-    payload = jwt.decode(token, settings.SECRET_KEY, algorithms=["HS256"])
-    username = payload.get("sub")
+    if not await mark_notification_read(db, user.id, notification_id):
+        raise HTTPException(status_code=404, detail="Unread notification not found")
+    await recent_writes.mark(user.username)
+    return {"notification_id": notification_id, "read": True}
 
-    if not username:
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
 
-    db_user = db.query(User).filter(User.username == username).first()
+@router.post("/notifications", response_model=list[NotificationOut], deprecated=True)
+async def get_user_notifications(
+    user: CurrentUser = Depends(get_current_user),  # Пользователь из JWT-токена (с кешем)
+    db: AsyncSession = Depends(get_user_read_db),  # Сессия чтения (реплика)
+):
+    # Уведомления из промежуточной таблицы вместе с общими рассылками (fan-out при чтении)
+    notifications = await get_all_notifications(db, user.id)
+
+    if not notifications:
+        raise HTTPException(status_code=404, detail="No notifications found for this user")
+
+    return notifications
 
-    if db_user is None:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
 
-    db_user.receive_notifications = not db_user.receive_notifications
-    db.commit()
-    db.refresh(db_user)
-    logging.info(f"✅ Переключатель сработал на {db_user.receive_notifications} для пользователя {username}!")
-    return {"receive_notifications": db_user.receive_notifications}
\ No newline at end of file
+@router.post("/toggle-notifications")
+async def toggle_notifications(
+        user: CurrentUser = Depends(get_current_user),
+        db: AsyncSession = Depends(get_async_db)
+):
+    # Переключаем флаг одним UPDATE ... RETURNING, не полагаясь на закешированное значение
+    result = await db.execute(
+        update(User).where(User.id == user.id)
+        .values(receive_notifications=not_(User.receive_notifications))
+        .returning(User.receive_notifications)
+    )
+    receive_notifications = result.scalar_one()
+    # Период подписки определяет, какие общие рассылки пользователь видит в ленте
+    await record_subscription(db, user.id, receive_notifications)
+    await db.commit()
+    # Потоки и user_cache этого узла — сразу, остальных узлов — через канал push
+    push_hub.update_subscription(user.id, user.username, receive_notifications)
+    await publish_subscription(user.id, user.username, receive_notifications)
+    # Видимость общих рассылок в кеше входящих зависит от подписки
+    await inbox_cache.invalidate(user.id)
+    await recent_writes.mark(user.username)
+
+    aggregated_log.event("✅ Переключено подписок на уведомления")
+    return {"receive_notifications": receive_notifications}
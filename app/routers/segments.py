@@ -0,0 +1,68 @@
+import logging
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.auth import get_current_user
+from app.models.base import get_async_db
+from app.crud.segment import get_segment_by_name, create_segment, add_segment_members, remove_segment_members, \
+    add_user_tags, remove_user_tags, get_missing_user_ids
+from app.schemas.segment import SegmentCreate, SegmentMembers, SegmentOut, UserTagsUpdate
+
+# Сегменты и теги определяют получателей рассылок: менять их может только авторизованный пользователь
+router = APIRouter(dependencies=[Depends(get_current_user)])
+logging.basicConfig(level=logging.INFO)
+
+@router.post("/", response_model=SegmentOut, summary="Создание сегмента аудитории")
+async def create(segment: SegmentCreate, db: AsyncSession = Depends(get_async_db)):
+    """
+    **Создание сегмента**
+    - Именованный список пользователей для адресной рассылки (`audience.segment`).
+    - ❌ Ошибка 400, если сегмент с таким именем уже есть.
+    - ❌ Ошибка 422, если среди user_ids есть несуществующие пользователи.
+    """
+    if await get_segment_by_name(db, segment.name):
+        raise HTTPException(status_code=400, detail="Segment already exists")
+    await ensure_users_exist(segment.user_ids, db)
+
+    db_segment = await create_segment(db, segment.name, segment.user_ids)
+    logging.info(f"✅ Создан сегмент {segment.name} ({len(segment.user_ids)} пользователей)")
+    return db_segment
+
+async def ensure_users_exist(user_ids: list[int], db: AsyncSession):
+    missing = await get_missing_user_ids(db, user_ids) if user_ids else []
+    if missing:
+        raise HTTPException(status_code=422, detail=f"Users not found: {missing}")
+
+async def get_segment_or_404(name: str, db: AsyncSession):
+    db_segment = await get_segment_by_name(db, name)
+    if db_segment is None:
+        raise HTTPException(status_code=404, detail="Segment not found")
+    return db_segment
+
+@router.post("/{name}/members", summary="Добавление пользователей в сегмент")
+async def add_members(name: str, members: SegmentMembers, db: AsyncSession = Depends(get_async_db)):
+    db_segment = await get_segment_or_404(name, db)
+    await ensure_users_exist(members.user_ids, db)
+    if members.user_ids:
+        await add_segment_members(db, db_segment.id, members.user_ids)
+    return {"segment": name, "added": len(set(members.user_ids))}
+
+@router.delete("/{name}/members", summary="Удаление пользователей из сегмента")
+async def remove_members(name: str, members: SegmentMembers, db: AsyncSession = Depends(get_async_db)):
+    db_segment = await get_segment_or_404(name, db)
+    if members.user_ids:
+        await remove_segment_members(db, db_segment.id, members.user_ids)
+    return {"segment": name, "removed": len(set(members.user_ids))}
+
+@router.post("/tags", summary="Назначение тегов пользователям")
+async def add_tags(update: UserTagsUpdate, db: AsyncSession = Depends(get_async_db)):
+    """Теги используются в `audience.tags`: получатели — подписчики хотя бы с одним из тегов."""
+    await ensure_users_exist(update.user_ids, db)
+    if update.user_ids and update.tags:
+        await add_user_tags(db, update.user_ids, update.tags)
+    return {"user_ids": update.user_ids, "tags": update.tags}
+
+@router.delete("/tags", summary="Снятие тегов с пользователей")
+async def remove_tags(update: UserTagsUpdate, db: AsyncSession = Depends(get_async_db)):
+    if update.user_ids and update.tags:
+        await remove_user_tags(db, update.user_ids, update.tags)
+    return {"user_ids": update.user_ids, "tags": update.tags}
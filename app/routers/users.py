@@ -1,9 +1,17 @@
 import logging
 from fastapi import APIRouter, Depends, HTTPException, Form
-from sqlalchemy.orm import Session
-from app.models.base import get_db
-from app.crud.user import create_user, get_user_by_username
-from app.schemas.user import UserCreate, UserOut
+from sqlalchemy import update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.auth import get_current_user
+from app.core.read_your_writes import recent_writes
+from app.core.webhooks import UnsafeWebhookURL, check_webhook_url
+from app.models import User
+from app.models.base import get_async_db, get_read_db
+from app.crud.user import create_user, get_user_id
+from app.schemas.user import EMAIL_PATTERN, UserCreate, UserOut, WebhookUpdate, EmailUpdate, CurrentUser
+from app.core.metrics import aggregated_log
+from app.core.rate_limit import rate_limit
 
 router = APIRouter()
 logging.basicConfig(level=logging.INFO)
@@ -12,6 +20,7 @@ logging.basicConfig(level=logging.INFO)
     "/register",
     response_model=UserOut,
     summary="Регистрация нового пользователя",
+    dependencies=[Depends(rate_limit("register"))],
     description="""
     Создает нового пользователя в системе.  
     Если пользователь с таким именем уже существует, возвращает ошибку.  
@@ -19,30 +28,89 @@ logging.basicConfig(level=logging.INFO)
     """,
     responses={
         201: {"description": "Пользователь успешно зарегистрирован"},
-        400: {"description": "Пользователь уже существует"}
+        400: {"description": "Пользователь уже существует"},
+        429: {"description": "Слишком много регистраций с этого адреса"},
     },
 )
 async def register(
         username: str = Form(..., description="Имя пользователя"),
         password: str = Form(..., description="Пароль"),
-        db: Session = Depends(get_db)
+        email: str | None = Form(None, description="Адрес для уведомлений по email (необязательно)",
+                                 pattern=EMAIL_PATTERN, max_length=254),
+        db: AsyncSession = Depends(get_read_db)
 ):
     """
     **Регистрация пользователя**
     - 🔑 Создаёт нового пользователя.
-    - ❌ Возвращает ошибку, если пользователь уже зарегистрирован.
+    - ❌ Возвращает ошибку, если пользователь уже зарегистрирован или email занят.
     - 🔒 Пароль хранится в зашифрованном виде.
+    - ✉️ email (необязательно) — адрес канала `email`; его можно задать и позже через PUT /users/email.
+    - Проверка имени читает кеш и реплику, сам пользователь создаётся в основной БД.
     """
 
-    logging.info(f"✅ Попытка регистрации пользователя: {username}")
-
-    if get_user_by_username(db, username):
-        logging.warning(f"❌ Регистрация не удалась: пользователь {username} уже существует")
+    if await get_user_id(db, username):
+        aggregated_log.event("❌ Отказано в регистрации: пользователь уже существует", logging.WARNING)
         raise HTTPException(status_code=400, detail="User already exists")
 
     # 🔥 Создаем объект UserCreate перед передачей в create_user
-    user_data = UserCreate(username=username, password=password)
-    new_user = create_user(db, user_data)
-    logging.info(f"✅ Пользователь {username} успешно зарегистрирован")
+    user_data = UserCreate(username=username, password=password, email=email)
+    try:
+        new_user = await create_user(db, user_data)
+    except IntegrityError:
+        # Реплика могла ещё не получить пользователя, созданного только что: дубль (имени или email)
+        # отсекает уникальный индекс
+        await db.rollback()
+        aggregated_log.event("❌ Отказано в регистрации: пользователь уже существует", logging.WARNING)
+        raise HTTPException(status_code=400, detail="User or email already exists")
+    await recent_writes.mark(username)
+    aggregated_log.event("✅ Зарегистрировано пользователей")
 
     return new_user
+
+
+@router.put("/webhook", summary="Адрес webhook для уведомлений")
+async def set_webhook(
+        webhook: WebhookUpdate,
+        user: CurrentUser = Depends(get_current_user),
+        db: AsyncSession = Depends(get_async_db),
+):
+    """
+    **Адрес webhook пользователя**
+    - Уведомления с каналом `webhook` отправляются POST-запросом с JSON на этот адрес.
+    - `null` отключает доставку через webhook.
+    - ❌ Ошибка 400, если адрес ведёт во внутреннюю сеть (loopback, частные и link-local адреса) или не разрешается.
+    """
+    webhook_url = str(webhook.webhook_url) if webhook.webhook_url else None
+    if webhook_url:
+        try:
+            await check_webhook_url(webhook_url)
+        except UnsafeWebhookURL as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        except OSError:
+            raise HTTPException(status_code=400, detail="Webhook host cannot be resolved")
+    await db.execute(update(User).where(User.id == user.id).values(webhook_url=webhook_url))
+    await db.commit()
+    await recent_writes.mark(user.username)
+    return {"webhook_url": webhook_url}
+
+
+@router.put("/email", summary="Адрес email для уведомлений")
+async def set_email(
+        update_email: EmailUpdate,
+        user: CurrentUser = Depends(get_current_user),
+        db: AsyncSession = Depends(get_async_db),
+):
+    """
+    **Адрес email пользователя**
+    - Уведомления с каналом `email` отправляются письмом на этот адрес.
+    - `null` отключает доставку по email.
+    - ❌ Ошибка 400, если адрес уже указан у другого пользователя.
+    """
+    try:
+        await db.execute(update(User).where(User.id == user.id).values(email=update_email.email))
+        await db.commit()
+    except IntegrityError:
+        await db.rollback()
+        raise HTTPException(status_code=400, detail="Email already in use")
+    await recent_writes.mark(user.username)
+    return {"email": update_email.email}
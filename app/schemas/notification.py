@@ -1,16 +1,77 @@
-from datetime import datetime
+from datetime import datetime, timezone
+from typing import Literal
 
-from pydantic import BaseModel
+from pydantic import BaseModel, Field, field_validator, model_validator
+
+# Полосы приоритета рассылки: у каждой свои очереди, high воркер опрашивает первой
+Priority = Literal["high", "normal", "low"]
+
+class Audience(BaseModel):
+    """Получатели уведомления; заданные условия объединяются через И, подписка учитывается всегда."""
+    user_ids: list[int] | None = Field(None, max_length=10000, description="Конкретные пользователи")
+    segment: str | None = Field(None, description="Имя сегмента")
+    tags: list[str] | None = Field(None, description="Пользователи хотя бы с одним из тегов")
+
+    @model_validator(mode="after")
+    def check_not_empty(self):
+        if self.user_ids is None and self.segment is None and self.tags is None:
+            raise ValueError("audience must set user_ids, segment or tags")
+        return self
 
 class NotificationCreate(BaseModel):
     title: str
     message: str
+    audience: Audience | None = None  # None — все подписчики
+    # Внешние каналы доставки в дополнение к ленте в приложении
+    channels: list[Literal["email", "webhook"]] = Field(default_factory=list)
+    # broadcast — всем подписчикам без создания связи на каждого (fan-out при чтении), только без audience
+    delivery: Literal["fanout", "broadcast"] = "fanout"
+    # high — срочные (коды входа, предупреждения безопасности): обрабатываются раньше накопившихся рассылок
+    priority: Priority = "normal"
+    # Отложенная отправка: до этого момента уведомление хранится в scheduled_notifications; None или прошлое — сразу
+    send_at: datetime | None = None
+
+    @field_validator("send_at")
+    @classmethod
+    def send_at_to_utc(cls, value: datetime | None):
+        # В БД время хранится в UTC без часового пояса; время без пояса считается UTC
+        if value is not None and value.tzinfo is not None:
+            value = value.astimezone(timezone.utc).replace(tzinfo=None)
+        return value
+
+    @model_validator(mode="after")
+    def check_broadcast_audience(self):
+        if self.delivery == "broadcast" and self.audience is not None:
+            raise ValueError("broadcast delivery is for all subscribers and cannot have an audience")
+        return self
+
+class NotificationBatchOut(BaseModel):
+    # В порядке входного списка: id созданного уведомления или, для отложенных, id записи в scheduled_notifications
+    ids: list[int | None]
+    scheduled_ids: list[int | None]
+    # Повтор запроса с тем же Idempotency-Key: уведомления не создавались заново
+    duplicate: bool = False
 
 class NotificationOut(BaseModel):
     id: int
     title: str
     message: str
     created_at: datetime
+    read_at: datetime | None = None
 
     class Config:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
+
+class NotificationPage(BaseModel):
+    items: list[NotificationOut]
+    # Курсор следующей (более старой) страницы: передайте его как before_id; None — страниц больше нет
+    next_before_id: int | None = None
+
+class DeliveryProgress(BaseModel):
+    notification_id: int
+    shards_total: int
+    shards_done: int
+    users_linked: int
+    started_at: datetime | None = None
+    finished_at: datetime | None = None
+    eta_seconds: float | None = None  # Оценка по средней скорости уже обработанных частей
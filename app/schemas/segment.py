@@ -0,0 +1,19 @@
+from pydantic import BaseModel
+
+class SegmentCreate(BaseModel):
+    name: str
+    user_ids: list[int] = []
+
+class SegmentMembers(BaseModel):
+    user_ids: list[int]
+
+class UserTagsUpdate(BaseModel):
+    user_ids: list[int]
+    tags: list[str]
+
+class SegmentOut(BaseModel):
+    id: int
+    name: str
+
+    class Config:
+        from_attributes = True
@@ -1,8 +1,12 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field, HttpUrl
+
+# Адрес для канала email: без пробелов и переводов строк (он попадает в заголовок письма)
+EMAIL_PATTERN = r"^[^@\s]+@[^@\s]+\.[^@\s]+$"
 
 class UserCreate(BaseModel):
     username: str
     password: str
+    email: str | None = Field(None, pattern=EMAIL_PATTERN, max_length=254)
 
 class UserOut(BaseModel):
     id: int
@@ -10,3 +14,21 @@ class UserOut(BaseModel):
 
     class Config:
         from_attributes = True
+
+
+class WebhookUpdate(BaseModel):
+    webhook_url: HttpUrl | None = None  # None — отключить доставку через webhook
+
+
+class EmailUpdate(BaseModel):
+    email: str | None = Field(None, pattern=EMAIL_PATTERN, max_length=254)  # None — отключить доставку по email
+
+
+class CurrentUser(BaseModel):
+    id: int
+    username: str
+    email: str | None = None
+    receive_notifications: bool | None = None
+
+    class Config:
+        from_attributes = True
@@ -0,0 +1,135 @@
+"""
+Бенчмарк каналов доставки на локальных заглушках: SMTP-сервер aiosmtpd и HTTP-сервер для webhook.
+
+Запуск: `python benchmarks/bench_delivery.py --recipients 2000 --concurrency 1 10 100`
+concurrency=1 соответствует последовательной отправке в цикле; с ростом concurrency пропускная
+способность упирается в лимиты канала, а не в задержку одной отправки (--latency-ms у заглушек).
+--fail-rate — доля ответов 503 от webhook-заглушки: такие получатели возвращаются для повторной попытки.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+from datetime import datetime
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# Settings требует переменные окружения — для бенчмарка подставляем заглушки
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+os.environ.setdefault("POSTGRES_PASSWORD", "")
+os.environ.setdefault("POSTGRES_PORT", "5432")
+os.environ.setdefault("SECRET_KEY", "bench")
+os.environ.setdefault("ALGORITHM", "HS256")
+os.environ.setdefault("SMTP_HOST", "127.0.0.1")
+os.environ.setdefault("SMTP_PORT", "8025")
+# Заглушка webhook слушает 127.0.0.1
+os.environ.setdefault("WEBHOOK_ALLOW_PRIVATE_ADDRESSES", "true")
+
+
+class WebhookStub:
+    """HTTP/1.1 с keep-alive: отвечает 200 (или 503 с вероятностью fail_rate) после latency секунд."""
+
+    def __init__(self, latency: float, fail_rate: float):
+        self._latency = latency
+        self._fail_rate = fail_rate
+        self.connections = 0
+        self.requests = 0
+
+    async def handle(self, reader, writer):
+        self.connections += 1
+        try:
+            while True:
+                headers = await reader.readuntil(b"\r\n\r\n")
+                length = 0
+                for line in headers.split(b"\r\n"):
+                    if line.lower().startswith(b"content-length:"):
+                        length = int(line.split(b":", 1)[1])
+                await reader.readexactly(length)
+                self.requests += 1
+                await asyncio.sleep(self._latency)
+                status = b"503 Service Unavailable" if random.random() < self._fail_rate else b"200 OK"
+                writer.write(b"HTTP/1.1 " + status + b"\r\nContent-Length: 0\r\n\r\n")
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+
+class SMTPStub:
+    """Обработчик aiosmtpd: принимает письма после latency секунд."""
+
+    def __init__(self, latency: float):
+        self._latency = latency
+        self.messages = 0
+
+    async def handle_DATA(self, server, session, envelope):
+        await asyncio.sleep(self._latency)
+        self.messages += 1
+        return "250 OK"
+
+
+async def run_channel(channel, recipients, notification) -> dict:
+    await channel.start()
+    try:
+        started = time.perf_counter()
+        retry = await channel.deliver_many(recipients, notification)
+        elapsed = time.perf_counter() - started
+    finally:
+        await channel.close()
+    return {"seconds": round(elapsed, 4), "sent": len(recipients) - len(retry), "retry": len(retry),
+            "per_second": round(len(recipients) / elapsed, 1)}
+
+
+async def main_async(args):
+    from aiosmtpd.controller import Controller
+    from app.core.config import settings
+    from workers.channels import SMTPChannel, WebhookChannel
+
+    smtp_stub = SMTPStub(args.latency_ms / 1000)
+    controller = Controller(smtp_stub, hostname=settings.SMTP_HOST, port=settings.SMTP_PORT)
+    controller.start()
+    webhook_stub = WebhookStub(args.latency_ms / 1000, args.fail_rate)
+    server = await asyncio.start_server(webhook_stub.handle, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+
+    notification = SimpleNamespace(id=1, title="bench", message="bench", created_at=datetime.utcnow())
+    recipients = [SimpleNamespace(id=i, email=f"user{i}@example.com", webhook_url=f"http://127.0.0.1:{port}/hook")
+                  for i in range(args.recipients)]
+
+    try:
+        for concurrency in args.concurrency:
+            for channel_class in (SMTPChannel, WebhookChannel):
+                webhook_stub.connections = 0
+                result = await run_channel(channel_class(concurrency, args.rate), recipients, notification)
+                if channel_class is WebhookChannel:
+                    result["connections"] = webhook_stub.connections
+                print(json.dumps({
+                    "benchmark": "delivery",
+                    "channel": channel_class.name,
+                    "recipients": args.recipients,
+                    "concurrency": concurrency,
+                    "latency_ms": args.latency_ms,
+                    **result,
+                }), flush=True)
+    finally:
+        server.close()
+        controller.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--recipients", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 10, 100])
+    parser.add_argument("--rate", type=float, default=0, help="лимит отправок в секунду, 0 — без лимита")
+    parser.add_argument("--latency-ms", type=float, default=5, help="задержка ответа заглушек")
+    parser.add_argument("--fail-rate", type=float, default=0)
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+Бенчмарк fan-out: старый цикл INSERT+COMMIT на каждого подписчика против workers.fanout.
+
+Запуск: `python benchmarks/bench_fanout.py --sizes 10000 100000 1000000`
+По умолчанию используется временная SQLite-база. С --database-url можно указать
+отдельную (!) Postgres-базу — таблицы в ней пересоздаются на каждом прогоне.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# Settings требует переменные окружения — для бенчмарка подставляем заглушки
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+os.environ.setdefault("POSTGRES_PASSWORD", "")
+os.environ.setdefault("POSTGRES_PORT", "5432")
+os.environ.setdefault("SECRET_KEY", "bench")
+os.environ.setdefault("ALGORITHM", "HS256")
+
+from sqlalchemy import create_engine, insert, delete
+from sqlalchemy.orm import sessionmaker
+
+from app.models.base import Base
+from app.models.user import User
+from app.models.notification import Notification, user_notifications
+from workers.fanout import fan_out
+
+
+def legacy_fan_out(db, notification_id):
+    # Копия прежнего цикла из process_notification
+    users = db.query(User).filter(User.receive_notifications == True).all()
+    for user in users:
+        db.execute(user_notifications.insert().values(user_id=user.id, notification_id=notification_id))
+        db.commit()
+    return len(users)
+
+
+def seed(engine, users_count):
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+    with engine.begin() as conn:
+        for start in range(0, users_count, 50_000):
+            conn.execute(insert(User), [
+                {"username": f"user{i}", "email": f"user{i}@example.com", "receive_notifications": True}
+                for i in range(start, min(start + 50_000, users_count))
+            ])
+        notification_id = conn.execute(
+            insert(Notification).values(title="bench", message="bench").returning(Notification.id)
+        ).scalar_one()
+    return notification_id
+
+
+def measure(session_factory, engine, notification_id, fn):
+    with engine.begin() as conn:
+        conn.execute(delete(user_notifications))
+    db = session_factory()
+    try:
+        started = time.perf_counter()
+        linked = fn(db, notification_id)
+        return time.perf_counter() - started, linked
+    finally:
+        db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--batch-size", type=int, default=10_000)
+    parser.add_argument("--legacy-max", type=int, default=100_000,
+                        help="не запускать старый цикл на выборках больше этого размера")
+    parser.add_argument("--database-url")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        url = args.database_url or f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+        engine = create_engine(url)
+        session_factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+        variants = {
+            "legacy_loop": legacy_fan_out,
+            "insert_select": lambda db, nid: fan_out(db, nid, batch_size=0),
+            f"batches_{args.batch_size}": lambda db, nid: fan_out(db, nid, batch_size=args.batch_size),
+        }
+
+        for users_count in args.sizes:
+            notification_id = seed(engine, users_count)
+            for name, fn in variants.items():
+                if name == "legacy_loop" and users_count > args.legacy_max:
+                    continue
+                seconds, linked = measure(session_factory, engine, notification_id, fn)
+                print(json.dumps({
+                    "benchmark": "fanout",
+                    "variant": name,
+                    "users": users_count,
+                    "linked": linked,
+                    "seconds": round(seconds, 4),
+                    "rows_per_second": round(linked / seconds) if seconds else None,
+                }), flush=True)
+
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+Время запуска API: импорт main, старт lifespan и первый ответ — каждый прогон в новом интерпретаторе.
+Redis и RabbitMQ не нужны: их недоступность не должна задерживать старт.
+
+Запуск:
+    python benchmarks/bench_startup.py                       # 10 прогонов
+    python benchmarks/bench_startup.py --runs 20 --output results.jsonl
+
+Результат — строка JSON с коммитом, медианами и максимумами фаз (мс) и самыми тяжёлыми модулями
+по python -X importtime; результаты двух коммитов сравниваются по полю benchmark.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+
+from benchmarks.suite import git_commit
+
+# Выполняется в дочернем процессе: печатает длительности фаз в секундах одной строкой JSON
+PROBE = """
+import asyncio, json, time
+started = time.perf_counter()
+import main
+imported = time.perf_counter()
+
+async def ready():
+    import httpx
+    async with main.app.router.lifespan_context(main.app):
+        lifespan = time.perf_counter()
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            response = await client.get("/metrics")
+            response.raise_for_status()
+        return lifespan, time.perf_counter()
+
+lifespan, first_response = asyncio.run(ready())
+print(json.dumps({"import": imported - started, "lifespan": lifespan - imported,
+                  "first_response": first_response - lifespan, "ready": first_response - started}))
+"""
+
+
+def child_env(tmp: str) -> dict:
+    env = dict(os.environ)
+    # Settings требует переменные окружения — подставляем заглушки; адреса Redis и RabbitMQ заведомо недоступны
+    env.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(tmp, 'startup.db')}")
+    env.setdefault("POSTGRES_PASSWORD", "")
+    env.setdefault("POSTGRES_PORT", "5432")
+    env.setdefault("SECRET_KEY", "bench")
+    env.setdefault("ALGORITHM", "HS256")
+    env.setdefault("REDIS_HOST", "127.0.0.1")
+    env.setdefault("REDIS_PORT", "1")
+    env.setdefault("RABBITMQ_HOST", "127.0.0.1")
+    env.setdefault("RABBITMQ_PORT", "1")
+    return env
+
+
+def run_probe(env: dict) -> dict:
+    output = subprocess.run([sys.executable, "-c", PROBE], cwd=ROOT, env=env, capture_output=True,
+                            text=True, check=True, timeout=120).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def heaviest_imports(env: dict, top: int) -> list[dict]:
+    """Модули с наибольшим собственным временем импорта (self, мс) по выводу -X importtime."""
+    stderr = subprocess.run([sys.executable, "-X", "importtime", "-c", "import main"], cwd=ROOT, env=env,
+                            capture_output=True, text=True, check=True, timeout=120).stderr
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        own, cumulative, name = line.removeprefix("import time:").split("|")
+        modules.append({"module": name.strip(), "self_ms": int(own) / 1000, "cumulative_ms": int(cumulative) / 1000})
+    return sorted(modules, key=lambda module: module["self_ms"], reverse=True)[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--top", type=int, default=10, help="сколько самых тяжёлых модулей показать")
+    parser.add_argument("--output", help="дописать результат в файл (JSON lines)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        env = child_env(tmp)
+        runs = [run_probe(env) for _ in range(args.runs)]
+        result = {"commit": git_commit(), "python": platform.python_version(), "benchmark": "startup",
+                  "runs": args.runs}
+        for phase in runs[0]:
+            values = [run[phase] * 1000 for run in runs]
+            result[f"{phase}_ms_p50"] = round(statistics.median(values), 1)
+            result[f"{phase}_ms_max"] = round(max(values), 1)
+        result["heaviest_imports"] = heaviest_imports(env, args.top)
+
+    line = json.dumps(result, ensure_ascii=False)
+    print(line)
+    if args.output:
+        with open(args.output, "a") as output:
+            output.write(line + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Нагрузочный тест API: N параллельных клиентов, итог — запросы в секунду и перцентили задержки.
+
+Запуск против работающего сервера (`uvicorn main:app`):
+    python benchmarks/load_test.py --url http://localhost:8000/api/v1 --scenario notifications -c 50 -n 2000
+
+Чтобы увидеть разницу между синхронной и асинхронной работой с БД, запустите сервер
+на нужном коммите и сравните строки результата (JSON) между прогонами.
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+import uuid
+
+import httpx
+
+PASSWORD = "load-test-password"
+
+
+async def register(client, username):
+    await client.post("/users/register", data={"username": username, "password": PASSWORD})
+
+
+async def login(client, username):
+    response = await client.post("/auth/token", json={"username": username, "password": PASSWORD})
+    response.raise_for_status()
+    return response.json()["access_token"]
+
+
+async def prepare(client, scenario):
+    """Создаёт пользователя и возвращает функцию одного запроса для сценария."""
+    username = f"load_{uuid.uuid4().hex[:12]}"
+    await register(client, username)
+
+    if scenario == "register":
+        return lambda: client.post("/users/register",
+                                   data={"username": f"load_{uuid.uuid4().hex}", "password": PASSWORD})
+    if scenario == "login":
+        return lambda: client.post("/auth/token", json={"username": username, "password": PASSWORD})
+    if scenario == "send":
+        return lambda: client.post("/notification/send_notifications", json={"title": "load", "message": "test"})
+
+    headers = {"Authorization": f"Bearer {await login(client, username)}"}
+    if scenario == "notifications":
+        return lambda: client.post("/notification/notifications", headers=headers)
+    if scenario == "toggle":
+        return lambda: client.post("/notification/toggle-notifications", headers=headers)
+    raise ValueError(f"Неизвестный сценарий: {scenario}")
+
+
+async def run(url, scenario, concurrency, total):
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=60) as client:
+        request = await prepare(client, scenario)
+        latencies, errors = [], 0
+        remaining = iter(range(total))
+
+        async def worker():
+            nonlocal errors
+            for _ in remaining:
+                started = time.perf_counter()
+                try:
+                    response = await request()
+                    if response.status_code >= 500:
+                        errors += 1
+                except httpx.HTTPError:
+                    errors += 1
+                latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "benchmark": "load_test",
+        "scenario": scenario,
+        "concurrency": concurrency,
+        "requests": total,
+        "errors": errors,
+        "seconds": round(elapsed, 3),
+        "rps": round(total / elapsed, 1),
+        "p50_ms": round(statistics.median(latencies) * 1000, 2),
+        "p95_ms": round(latencies[int(len(latencies) * 0.95) - 1] * 1000, 2),
+        "p99_ms": round(latencies[int(len(latencies) * 0.99) - 1] * 1000, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:8000/api/v1")
+    parser.add_argument("--scenario", default="notifications",
+                        choices=["register", "login", "send", "notifications", "toggle"])
+    parser.add_argument("-c", "--concurrency", type=int, default=50)
+    parser.add_argument("-n", "--requests", type=int, default=2000)
+    args = parser.parse_args()
+
+    print(json.dumps(asyncio.run(run(args.url, args.scenario, args.concurrency, args.requests))))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""
+Локальные замены внешних сервисов для бенчмарков: fakeredis вместо Redis и очередь в памяти вместо RabbitMQ.
+install_fakeredis() нужно вызвать до создания клиентов Redis (до старта приложения и первого обращения воркера).
+"""
+import itertools
+import time
+from collections import defaultdict, deque
+from types import SimpleNamespace
+
+from app.core.envelope import pack_tasks
+
+
+def install_fakeredis():
+    """Подменяет клиенты redis (синхронный и асинхронный) на fakeredis с общим сервером в памяти."""
+    import fakeredis
+    import fakeredis.aioredis
+    import redis
+    import redis.asyncio
+
+    server = fakeredis.FakeServer()
+
+    def pool_options(kwargs):
+        # Параметры пула переносим в клиент fakeredis, адрес и таймауты ему не нужны
+        pool = kwargs.pop("connection_pool", None)
+        options = {"decode_responses": pool.connection_kwargs.get("decode_responses", False)} if pool else {}
+        return {**options, **kwargs, "server": server}
+
+    class FakeRedis(fakeredis.FakeRedis):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **pool_options(kwargs))
+
+    class FakeAsyncRedis(fakeredis.aioredis.FakeRedis):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **pool_options(kwargs))
+
+    redis.Redis = FakeRedis
+    redis.asyncio.Redis = FakeAsyncRedis
+    return server
+
+
+class InMemoryBroker:
+    """Очереди RabbitMQ в памяти: публикация, доставка в зарегистрированные callback-и, ack/nack."""
+
+    def __init__(self):
+        self.queues: dict[str, deque] = defaultdict(deque)
+        self.acked = 0
+        self.dead_lettered = 0
+        self.tags = itertools.count(1)
+
+    def publish(self, routing_key: str, body: bytes, content_type: str | None = None):
+        self.queues[routing_key].append((body, content_type, time.time(), False))
+
+    def channel(self) -> "InMemoryChannel":
+        return InMemoryChannel(self)
+
+    def drain(self, callbacks: dict) -> int:
+        """Доставляет сообщения в callback-и (queue -> callback), пока все очереди не опустеют."""
+        channel = self.channel()
+        delivered = 0
+        while any(self.queues[queue] for queue in callbacks):
+            for queue, callback in callbacks.items():
+                while self.queues[queue]:
+                    callback(channel, *channel.basic_get(queue))
+                    delivered += 1
+        return delivered
+
+
+class InMemoryChannel:
+    """Подмножество pika.channel.Channel, которое использует воркер."""
+
+    def __init__(self, broker: InMemoryBroker):
+        self._broker = broker
+        self.pending: dict[int, tuple] = {}
+        self._prefetch = 0
+        self._consumers: list[tuple] = []
+
+    def basic_qos(self, prefetch_count=0):
+        self._prefetch = prefetch_count
+
+    def basic_consume(self, queue, on_message_callback):
+        self._consumers.append((queue, on_message_callback))
+
+    def deliver(self) -> int:
+        """Доставка подписчикам, как у брокера: пока у подписки меньше prefetch неподтверждённых сообщений."""
+        delivered = 0
+        for queue, callback in self._consumers:
+            while self._broker.queues[queue] and (
+                    not self._prefetch
+                    or sum(pending[0] == queue for pending in self.pending.values()) < self._prefetch):
+                callback(self, *self.basic_get(queue))
+                delivered += 1
+        return delivered
+
+    def basic_get(self, queue):
+        if not self._broker.queues[queue]:
+            return None, None, None
+        body, content_type, timestamp, redelivered = self._broker.queues[queue].popleft()
+        method = SimpleNamespace(delivery_tag=next(self._broker.tags), routing_key=queue, redelivered=redelivered)
+        self.pending[method.delivery_tag] = (queue, body, content_type, timestamp)
+        return method, SimpleNamespace(content_type=content_type, timestamp=int(timestamp)), body
+
+    def basic_publish(self, exchange, routing_key, body, properties=None):
+        self._broker.publish(routing_key, body.encode() if isinstance(body, str) else body,
+                             properties.content_type if properties else None)
+
+    def basic_ack(self, delivery_tag):
+        self.pending.pop(delivery_tag)
+        self._broker.acked += 1
+
+    def basic_nack(self, delivery_tag, requeue=True):
+        queue, body, content_type, timestamp = self.pending.pop(delivery_tag)
+        if requeue:
+            self._broker.queues[queue].append((body, content_type, timestamp, True))
+        else:
+            self._broker.dead_lettered += 1
+
+
+class InMemoryPublisher:
+    """Замена NotificationPublisher из API: publish кладёт пачку в InMemoryBroker теми же конвертами."""
+
+    ready = True
+
+    def __init__(self, broker: InMemoryBroker, queue_name: str, envelope_format: str = "msgpack", max_tasks: int = 1):
+        self._broker = broker
+        self._queue_name = queue_name
+        self._envelope_format = envelope_format
+        self._max_tasks = max_tasks
+
+    async def publish(self, messages: list[dict], routing_key: str | None = None):
+        for body, content_type in pack_tasks(messages, self._max_tasks, self._envelope_format):
+            self._broker.publish(routing_key or self._queue_name, body, content_type)
@@ -0,0 +1,410 @@
+"""
+Набор бенчмарков горячих путей без внешних сервисов: SQLite (или отдельная Postgres-база),
+fakeredis вместо Redis и очередь в памяти вместо RabbitMQ.
+
+Запуск:
+    pip install -r requirements.txt -r benchmarks/requirements.txt
+    python benchmarks/suite.py                                  # все сценарии, размеры по умолчанию
+    python benchmarks/suite.py --scenarios fanout read --sizes 1000 100000 --output results.jsonl
+
+Каждая строка результата — JSON с коммитом, сценарием, размером данных, пропускной способностью
+и перцентилями задержки; результаты двух коммитов сравниваются построчно по (scenario, size).
+С --database-url можно указать отдельную (!) базу — таблицы в ней пересоздаются на каждом прогоне.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+
+PASSWORD = "bench-password"
+
+# Размеры по умолчанию: для register/login/send — число запросов,
+# для fanout — число подписчиков, для read — длина истории пользователя.
+# *_broadcast — те же сценарии для общих рассылок (fan-out при чтении): записи при рассылке против стоимости чтения;
+# priority — длина очереди обычных задач перед срочной, schedule — число наступивших отложенных уведомлений,
+# envelope — число задач планирования в воркере
+DEFAULT_SIZES = {
+    "register": [50, 200],
+    "login": [50, 200],
+    "send": [100, 1_000],
+    "fanout": [1_000, 10_000, 100_000],
+    "read": [100, 1_000, 10_000],
+    "fanout_broadcast": [1_000, 10_000, 100_000],
+    "read_broadcast": [100, 1_000, 10_000],
+    "priority": [500, 2_000],
+    "schedule": [1_000, 10_000],
+    "envelope": [1_000, 10_000],
+}
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def summarize(latencies: list[float], elapsed: float, ops: int) -> dict:
+    latencies = sorted(latencies)
+    result = {"ops": ops, "seconds": round(elapsed, 4), "ops_per_second": round(ops / elapsed, 1) if elapsed else None}
+    if latencies:
+        result.update(
+            p50_ms=round(statistics.median(latencies) * 1000, 3),
+            p95_ms=round(latencies[max(int(len(latencies) * 0.95) - 1, 0)] * 1000, 3),
+            p99_ms=round(latencies[max(int(len(latencies) * 0.99) - 1, 0)] * 1000, 3),
+        )
+    return result
+
+
+class Suite:
+    def __init__(self, concurrency: int):
+        # Импорт только после настройки окружения и подмены Redis в main()
+        import main
+        from app.core import auth
+        from app.core.redis import redis_pool
+        from app.core.config import settings
+        from app.core.outbox import OutboxRelay
+        from app.core.security import hash_password
+        from app.models.base import Base, get_engine, get_async_engine
+        from benchmarks.shims import InMemoryBroker, InMemoryPublisher
+
+        self.app = main.app
+        self.settings = settings
+        self.Base = Base
+        self.engine = get_engine()
+        self.async_engine = get_async_engine()
+        self.caches = [auth.token_cache, auth.user_cache]
+        self.redis_pool = redis_pool
+        self.concurrency = concurrency
+        self.password_hash = hash_password(PASSWORD)
+
+        self.broker = InMemoryBroker()
+        publisher = InMemoryPublisher(self.broker, settings.NOTIFICATION_QUEUE, settings.NOTIFICATION_ENVELOPE_FORMAT,
+                                      settings.NOTIFICATION_ENVELOPE_MAX_TASKS)
+        self.relay = OutboxRelay(publisher,
+                                 batch_size=settings.OUTBOX_BATCH_SIZE, poll_interval=settings.OUTBOX_POLL_INTERVAL)
+
+    async def reset(self):
+        """Чистая схема, пустые кеши и очереди перед каждым прогоном."""
+        await self.async_engine.dispose()
+        self.Base.metadata.drop_all(self.engine)
+        self.Base.metadata.create_all(self.engine)
+        for cache in self.caches:
+            cache.clear()
+        self.redis_pool.sync_client.flushall()
+        self.broker.queues.clear()
+
+    def client(self):
+        import httpx
+        return httpx.AsyncClient(transport=httpx.ASGITransport(app=self.app), base_url="http://bench/api/v1")
+
+    async def run_requests(self, requests: list) -> dict:
+        """Выполняет запросы с ограничением параллельности и считает задержки."""
+        latencies, errors = [], 0
+        pending = iter(requests)
+
+        async def worker():
+            nonlocal errors
+            for request in pending:
+                started = time.perf_counter()
+                response = await request()
+                latencies.append(time.perf_counter() - started)
+                if response.status_code >= 400:
+                    errors += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(self.concurrency)))
+        return {**summarize(latencies, time.perf_counter() - started, len(requests)), "errors": errors}
+
+    def seed_users(self, count: int, subscribed: bool = True) -> None:
+        from sqlalchemy import insert
+        from app.models.user import User
+
+        with self.engine.begin() as conn:
+            for start in range(0, count, 50_000):
+                conn.execute(insert(User), [
+                    {"username": f"user{i}", "email": f"user{i}@example.com",
+                     "hashed_password": self.password_hash, "receive_notifications": subscribed}
+                    for i in range(start, min(start + 50_000, count))
+                ])
+
+    async def token(self, client, username: str) -> str:
+        response = await client.post("/auth/token", json={"username": username, "password": PASSWORD})
+        return response.json()["access_token"]
+
+    # --- Сценарии ---
+
+    async def register(self, size: int) -> dict:
+        async with self.client() as client:
+            return await self.run_requests([
+                lambda i=i: client.post("/users/register", data={"username": f"new{i}", "password": PASSWORD})
+                for i in range(size)
+            ])
+
+    async def login(self, size: int) -> dict:
+        self.seed_users(size)
+        async with self.client() as client:
+            return await self.run_requests([
+                lambda i=i: client.post("/auth/token", json={"username": f"user{i}", "password": PASSWORD})
+                for i in range(size)
+            ])
+
+    async def send(self, size: int) -> dict:
+        async with self.client() as client:
+            result = await self.run_requests([
+                lambda: client.post("/notification/send_notifications", json={"title": "bench", "message": "bench"})
+                for _ in range(size)
+            ])
+
+        # Пересылка outbox в очередь — отдельной метрикой
+        started = time.perf_counter()
+        while await self.relay.relay_batch():
+            pass
+        result["relay_seconds"] = round(time.perf_counter() - started, 4)
+        result.update(self.published(self.settings.NOTIFICATION_QUEUE))
+        return result
+
+    def published(self, queue: str) -> dict:
+        """Сообщений в очереди и задач в них (в конверте их может быть несколько)."""
+        from app.core.envelope import decode_tasks
+
+        messages = self.broker.queues[queue]
+        return {"messages": len(messages),
+                "published": sum(len(decode_tasks(body, content_type)) for body, content_type, *_ in messages)}
+
+    async def fanout(self, size: int, delivery: str = "fanout") -> dict:
+        from sqlalchemy import insert, select, func
+        from app.models.notification import Notification, user_notifications
+        from workers.notification_worker import callback, shard_callback
+
+        self.seed_users(size)
+        with self.engine.begin() as conn:
+            notification_id = conn.execute(
+                insert(Notification).values(title="bench", message="bench", delivery=delivery)
+                .returning(Notification.id)
+            ).scalar_one()
+        self.broker.publish(self.settings.NOTIFICATION_QUEUE, json.dumps({"notification_id": notification_id}).encode())
+
+        # Полный путь воркера: разбор сообщения, планирование частей, fan-out, ack
+        started = time.perf_counter()
+        delivered = self.broker.drain({self.settings.NOTIFICATION_QUEUE: callback,
+                                       self.settings.NOTIFICATION_SHARD_QUEUE: shard_callback})
+        elapsed = time.perf_counter() - started
+
+        with self.engine.connect() as conn:
+            linked = conn.execute(select(func.count()).select_from(user_notifications)).scalar_one()
+        return {**summarize([], elapsed, size), "messages": delivered, "rows_written": linked,
+                "recipients_per_second": round(size / elapsed)}
+
+    async def fanout_broadcast(self, size: int) -> dict:
+        return await self.fanout(size, delivery="broadcast")
+
+    async def read(self, size: int, delivery: str = "fanout") -> dict:
+        from datetime import datetime
+        from sqlalchemy import insert
+        from app.models.notification import Notification, user_notifications
+        from app.models.user import SubscriptionPeriod
+
+        self.seed_users(1)
+        with self.engine.begin() as conn:
+            conn.execute(insert(SubscriptionPeriod).values(user_id=1, started_at=datetime(2000, 1, 1)))
+            for start in range(0, size, 50_000):
+                ids = conn.execute(
+                    insert(Notification).returning(Notification.id),
+                    [{"title": f"bench {i}", "message": "bench", "delivery": delivery}
+                     for i in range(start, min(start + 50_000, size))],
+                ).scalars().all()
+                # Общие рассылки не связываются с получателями — лента собирается при чтении
+                if delivery == "fanout":
+                    conn.execute(insert(user_notifications), [{"user_id": 1, "notification_id": i} for i in ids])
+
+        requests_count = 500
+        async with self.client() as client:
+            headers = {"Authorization": f"Bearer {await self.token(client, 'user0')}"}
+            # Курсоры равномерно по истории: первые страницы попадают в кеш входящих, глубокие идут в БД
+            cursors = [None] + [size - size * i // requests_count for i in range(1, requests_count)]
+            return await self.run_requests([
+                lambda cursor=cursor: client.get("/notification/notifications", headers=headers,
+                                                 params={"limit": 20, **({"before_id": cursor} if cursor else {})})
+                for cursor in cursors
+            ])
+
+    async def read_broadcast(self, size: int) -> dict:
+        return await self.read(size, delivery="broadcast")
+
+    async def priority(self, size: int) -> dict:
+        """Срочное уведомление приходит, когда в полосах normal и low ещё половина из size задач."""
+        from sqlalchemy import insert
+        from app.core.rabbitmq import lane_queue
+        from app.models.notification import Notification
+        from workers.notification_worker import LaneBuffer, LaneSelector, subscribe_lanes
+
+        self.seed_users(10)
+        with self.engine.begin() as conn:
+            rows = [{"title": f"bench {i}", "message": "bench", "priority": "low" if i % 5 == 0 else "normal"}
+                    for i in range(size)] + [{"title": "urgent", "message": "bench", "priority": "high"}]
+            ids = conn.execute(insert(Notification).returning(Notification.id, sort_by_parameter_order=True),
+                               rows).scalars().all()
+
+        def publish(notification_id, row):
+            self.broker.publish(lane_queue(self.settings.NOTIFICATION_QUEUE, row["priority"]),
+                                json.dumps({"notification_id": notification_id}).encode())
+
+        for notification_id, row in zip(ids[:-1], rows[:-1]):
+            publish(notification_id, row)
+        buffer = LaneBuffer(LaneSelector(self.settings.NOTIFICATION_PRIORITY_WEIGHTS))
+        channels = subscribe_lanes(self.broker.channel, buffer, self.settings.WORKER_PREFETCH)
+
+        def process_next():
+            # Как цикл воркера: сначала принять доставленное брокером, затем обработать одно сообщение
+            for channel in channels:
+                channel.deliver()
+            return buffer.process_next()
+
+        started = time.perf_counter()
+        processed = [process_next() for _ in range(size // 2)]
+        backlog = sum(len(queue) for queue in self.broker.queues.values()) + len(buffer)
+
+        publish(ids[-1], rows[-1])
+        arrived, processed_after = time.perf_counter(), 0
+        while process_next() != "high":
+            processed_after += 1
+        urgent_latency = time.perf_counter() - arrived
+
+        while process_next():
+            pass
+        elapsed = time.perf_counter() - started
+        # Без полос срочная задача ждала бы весь backlog; low получает свою долю, пока normal не пуста
+        return {**summarize([], elapsed, size + 1), "backlog_at_urgent": backlog,
+                "processed_before_urgent": processed_after, "urgent_latency_ms": round(urgent_latency * 1000, 3),
+                "low_share": round(processed.count("low") / (size // 2), 3)}
+
+    async def schedule(self, size: int) -> dict:
+        from datetime import datetime, timedelta
+        from sqlalchemy import insert
+        from app.core.scheduler import NotificationScheduler
+        from app.models.notification import ScheduledNotification
+
+        self.seed_users(1)
+        send_at = datetime.utcnow() - timedelta(seconds=1)
+        with self.engine.begin() as conn:
+            conn.execute(insert(ScheduledNotification), [
+                {"send_at": send_at, "payload": {"title": f"bench {i}", "message": "bench"}} for i in range(size)
+            ])
+
+        scheduler = NotificationScheduler(self.relay, batch_size=self.settings.SCHEDULER_BATCH_SIZE,
+                                          poll_interval=self.settings.SCHEDULER_POLL_INTERVAL)
+        started = time.perf_counter()
+        while await scheduler.dispatch_batch():
+            pass
+        elapsed = time.perf_counter() - started
+        while await self.relay.relay_batch():
+            pass
+        return {**summarize([], elapsed, size), **self.published(self.settings.NOTIFICATION_QUEUE)}
+
+    async def envelope(self, size: int) -> dict:
+        """
+        Задачи планирования в воркере (без подписчиков — только разбор сообщения и поиск уведомления):
+        прежний JSON по задаче с чтением notifications против конвертов msgpack со снимком уведомления.
+        """
+        from sqlalchemy import select
+        from app.crud.notification import add_notifications
+        from app.models.base import AsyncSessionLocal
+        from app.models.outbox import OutboxMessage
+        from app.schemas.notification import NotificationCreate
+        from benchmarks.shims import InMemoryPublisher
+        from workers.notification_worker import callback
+
+        async with AsyncSessionLocal() as db:
+            await add_notifications(db, [NotificationCreate(title=f"bench {i}", message="bench") for i in range(size)])
+            await db.commit()
+        with self.engine.connect() as conn:
+            tasks = conn.execute(select(OutboxMessage.payload).order_by(OutboxMessage.id)).scalars().all()
+
+        queue = self.settings.NOTIFICATION_QUEUE
+        variants = {
+            "json": (InMemoryPublisher(self.broker, queue, "json"),
+                     [{"notification_id": t["notification_id"], "title": t["title"], "message": t["message"]}
+                      for t in tasks]),
+            "msgpack": (InMemoryPublisher(self.broker, queue, "msgpack", self.settings.NOTIFICATION_ENVELOPE_MAX_TASKS),
+                        tasks),
+        }
+        result = {}
+        for name, (publisher, messages) in variants.items():
+            await publisher.publish(messages)
+            result[f"{name}_bytes"] = sum(len(body) for body, *_ in self.broker.queues[queue])
+            result[f"{name}_messages"] = len(self.broker.queues[queue])
+            started = time.perf_counter()
+            self.broker.drain({queue: callback})
+            elapsed = time.perf_counter() - started
+            result[f"{name}_tasks_per_second"] = round(size / elapsed)
+        return {**summarize([], elapsed, size), **result}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", nargs="+", choices=list(DEFAULT_SIZES), default=list(DEFAULT_SIZES))
+    parser.add_argument("--sizes", type=int, nargs="+", help="размеры для всех выбранных сценариев")
+    parser.add_argument("-c", "--concurrency", type=int, default=16)
+    parser.add_argument("--bcrypt-rounds", type=int, help="стоимость bcrypt (по умолчанию — из настроек)")
+    parser.add_argument("--database-url")
+    parser.add_argument("--output", help="дописать результаты в файл (JSON lines)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # Settings требует переменные окружения — для бенчмарка подставляем заглушки
+        os.environ["DATABASE_URL"] = args.database_url or f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+        os.environ.setdefault("POSTGRES_PASSWORD", "")
+        os.environ.setdefault("POSTGRES_PORT", "5432")
+        os.environ.setdefault("SECRET_KEY", "bench")
+        os.environ.setdefault("ALGORITHM", "HS256")
+        # Сценарии намеренно превышают лимиты запросов одного клиента
+        os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
+        if args.bcrypt_rounds:
+            os.environ["BCRYPT_ROUNDS"] = str(args.bcrypt_rounds)
+
+        from benchmarks.shims import install_fakeredis
+        install_fakeredis()
+
+        # Строка лога httpx на каждый запрос искажает замеры
+        logging.getLogger("httpx").setLevel(logging.WARNING)
+        suite = Suite(args.concurrency)
+        meta = {"commit": git_commit(), "python": platform.python_version(),
+                "database": suite.engine.dialect.name, "concurrency": args.concurrency}
+        output = open(args.output, "a") if args.output else None
+
+        async def run_all():
+            # ASGITransport не запускает lifespan приложения — пул Redis поднимаем сами
+            await suite.redis_pool.start()
+            for scenario in args.scenarios:
+                for size in args.sizes or DEFAULT_SIZES[scenario]:
+                    await suite.reset()
+                    result = await getattr(suite, scenario)(size)
+                    line = json.dumps({**meta, "benchmark": "suite", "scenario": scenario, "size": size, **result})
+                    print(line, flush=True)
+                    if output:
+                        output.write(line + "\n")
+            await suite.redis_pool.close()
+            await suite.async_engine.dispose()
+
+        try:
+            asyncio.run(run_all())
+        finally:
+            if output:
+                output.close()
+            suite.engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,53 @@
+import logging
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
-from fastapi.responses import RedirectResponse
+from fastapi.responses import RedirectResponse, Response
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
 
-import logging
-import redis
 from starlette.middleware.cors import CORSMiddleware
 
-from app.models.base import Base, engine
-from app.routers import auth, users, notification
+from app.models.base import create_sqlite_schema, dispose_engines
+from app.routers import auth, users, notification, segments
 
 from app.core.config import settings
+from app.core.rabbitmq import notification_publisher
+from app.core.outbox import outbox_relay
+from app.core.scheduler import notification_scheduler
+from app.core.push import push_hub
+from app.core.redis import redis_pool
+from app.core.metrics import MetricsMiddleware
+from app.core.auth import RedactTokenFilter
 
 
-app = FastAPI(title="Auth API", root_path="/api/v1")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Одно соединение с RabbitMQ на процесс: открываем при старте, закрываем при остановке.
+    # Задачи публикует relay из outbox; его можно выключить, если пересылкой занят отдельный процесс.
+    # push_hub слушает канал Redis и раздаёт новые уведомления и смены подписки подключённым к этому узлу клиентам.
+    # Планировщик создаёт отложенные уведомления в срок; процессы API делят записи через SKIP LOCKED.
+    # Ни один шаг не ждёт внешних сервисов: подключения устанавливаются в фоне или при первом запросе,
+    # движки БД создаются при первом обращении. Схемой БД управляет Alembic (alembic upgrade head),
+    # кроме локальной SQLite: её таблицы создаются по моделям при старте.
+    if create_sqlite_schema():
+        logging.info("🗄️ Схема SQLite создана по моделям")
+    await redis_pool.start()
+    await push_hub.start()
+    await notification_publisher.start()
+    if settings.OUTBOX_RELAY_ENABLED:
+        await outbox_relay.start()
+    if settings.SCHEDULER_ENABLED:
+        await notification_scheduler.start()
+    yield
+    await notification_scheduler.stop()
+    await outbox_relay.stop()
+    await notification_publisher.stop()
+    await push_hub.stop()
+    await redis_pool.close()
+    await dispose_engines()
+
+
+app = FastAPI(title="Auth API", root_path="/api/v1", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -20,16 +56,24 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(MetricsMiddleware)
 
-Base.metadata.create_all(bind=engine)
+# Access-лог uvicorn пишет полный URL запроса: значение ?token= потока в него не попадает
+logging.getLogger("uvicorn.access").addFilter(RedactTokenFilter())
 
 app.include_router(auth.router, prefix="/auth")
 app.include_router(users.router, prefix="/users")
 app.include_router(notification.router, prefix="/notification")
+app.include_router(segments.router, prefix="/segments")
 
 @app.get("/", include_in_schema=False)
 async def redirect_to_docs():
     return RedirectResponse(url="/docs")
 
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Метрики процесса в формате Prometheus."""
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
 # Запуск: `uvicorn main:app --reload`
-# RabbitMQ: python workers/notification_worker.py
\ No newline at end of file
+# RabbitMQ: python workers/notification_worker.py --processes 4
\ No newline at end of file
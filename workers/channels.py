@@ -0,0 +1,226 @@
+import asyncio
+import logging
+import time
+from email.message import EmailMessage
+
+import aiosmtplib
+import httpx
+
+from app.core.config import settings
+from app.core.metrics import DELIVERY_ATTEMPTS, DELIVERY_LATENCY, aggregated_log
+from app.core.webhooks import UnsafeWebhookURL, check_webhook_url
+
+
+class DeliveryError(Exception):
+    """Ошибка отправки; retryable=False — повтор не поможет (например, 4xx от webhook)."""
+
+    def __init__(self, message: str, retryable: bool = True):
+        super().__init__(message)
+        self.retryable = retryable
+
+
+class RateLimiter:
+    """Token bucket в памяти процесса: не больше rate отправок в секунду (rate <= 0 — без лимита)."""
+
+    def __init__(self, rate: float):
+        self._rate = rate
+        self._tokens = max(rate, 1.0)
+        self._updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        if self._rate <= 0:
+            return
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self._tokens + (now - self._updated_at) * self._rate, max(self._rate, 1.0))
+                self._updated_at = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self._rate)
+
+
+class DeliveryChannel:
+    """
+    Канал доставки: не больше concurrency отправок одновременно и не больше rate в секунду.
+    deliver_many отправляет пачку параллельно и возвращает получателей, которым стоит повторить отправку.
+    """
+
+    name: str
+
+    def __init__(self, concurrency: int, rate: float):
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._rate_limiter = RateLimiter(rate)
+
+    async def start(self):
+        pass
+
+    async def close(self):
+        pass
+
+    def accepts(self, recipient) -> bool:
+        """Есть ли у получателя адрес для этого канала."""
+        return True
+
+    async def send(self, recipient, notification):
+        raise NotImplementedError
+
+    async def _deliver(self, recipient, notification) -> bool:
+        """True — отправить ещё раз позже."""
+        async with self._semaphore:
+            await self._rate_limiter.acquire()
+            started = time.perf_counter()
+            try:
+                await self.send(recipient, notification)
+            except DeliveryError as e:
+                DELIVERY_ATTEMPTS.labels(self.name, "retry" if e.retryable else "failed").inc()
+                return e.retryable
+            except Exception as e:
+                # Ошибка одного получателя не должна вернуть в очередь всю задачу: остальным пришёл бы дубль.
+                # Повтор непредвиденной ошибки (например, некорректных данных) не поможет
+                DELIVERY_ATTEMPTS.labels(self.name, "failed").inc()
+                aggregated_log.event(f"❌ Непредвиденных ошибок доставки ({self.name}, {type(e).__name__})", logging.ERROR)
+                return False
+            finally:
+                DELIVERY_LATENCY.labels(self.name).observe(time.perf_counter() - started)
+        DELIVERY_ATTEMPTS.labels(self.name, "sent").inc()
+        return False
+
+    async def deliver_many(self, recipients: list, notification) -> list:
+        recipients = [recipient for recipient in recipients if self.accepts(recipient)]
+        retry = await asyncio.gather(*(self._deliver(recipient, notification) for recipient in recipients))
+        return [recipient for recipient, again in zip(recipients, retry) if again]
+
+
+class SMTPChannel(DeliveryChannel):
+    """Письма через SMTP: пул из concurrency сессий, каждая переиспользуется для многих писем."""
+
+    name = "email"
+
+    def __init__(self, concurrency: int, rate: float):
+        super().__init__(concurrency, rate)
+        self._sessions: asyncio.Queue[aiosmtplib.SMTP] = asyncio.Queue()
+        for _ in range(concurrency):
+            self._sessions.put_nowait(aiosmtplib.SMTP(
+                hostname=settings.SMTP_HOST,
+                port=settings.SMTP_PORT,
+                username=settings.SMTP_USER or None,
+                password=settings.SMTP_PASSWORD or None,
+                start_tls=settings.SMTP_USE_TLS,
+                timeout=settings.SMTP_TIMEOUT,
+            ))
+
+    async def close(self):
+        while not self._sessions.empty():
+            session = self._sessions.get_nowait()
+            if session.is_connected:
+                try:
+                    await session.quit()
+                except aiosmtplib.SMTPException:
+                    session.close()
+
+    def accepts(self, recipient) -> bool:
+        return bool(recipient.email)
+
+    async def send(self, recipient, notification):
+        message = EmailMessage()
+        message["From"] = settings.SMTP_FROM
+        message["To"] = recipient.email
+        # Перевод строки в заголовке письма недопустим: многострочный title складывается в одну строку
+        message["Subject"] = " ".join(notification.title.split())
+        message.set_content(notification.message)
+
+        # Семафор канала гарантирует, что свободная сессия в очереди есть
+        session = self._sessions.get_nowait()
+        try:
+            # Соединение открывается при первом письме и остаётся открытым для следующих
+            if not session.is_connected:
+                await session.connect()
+            await session.send_message(message)
+        except aiosmtplib.SMTPRecipientsRefused as e:
+            raise DeliveryError(str(e), retryable=False)
+        except (aiosmtplib.SMTPException, OSError) as e:
+            session.close()
+            raise DeliveryError(str(e))
+        finally:
+            self._sessions.put_nowait(session)
+
+
+class PinnedAddressTransport(httpx.AsyncBaseTransport):
+    """
+    Транспорт webhook: проверяет адрес хоста (check_webhook_url) и подключается именно к нему.
+    Без этого httpx разрешил бы имя ещё раз при подключении, и DNS мог бы к тому времени вернуть
+    внутренний адрес (DNS rebinding). Заголовок Host и SNI остаются по исходному имени.
+    """
+
+    def __init__(self, **kwargs):
+        self._transport = httpx.AsyncHTTPTransport(**kwargs)
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        address = await check_webhook_url(str(request.url))
+        if address is not None and address != request.url.host:
+            request = httpx.Request(
+                request.method, request.url.copy_with(host=address), headers=request.headers,
+                stream=request.stream, extensions={**request.extensions, "sni_hostname": request.url.host},
+            )
+        return await self._transport.handle_async_request(request)
+
+    async def aclose(self):
+        await self._transport.aclose()
+
+
+class WebhookChannel(DeliveryChannel):
+    """
+    POST с JSON на webhook_url пользователя через общий пул keep-alive соединений.
+    Перед каждой отправкой адрес проверяется ещё раз, и запрос идёт на проверенный IP (PinnedAddressTransport);
+    редиректы не выполняются.
+    """
+
+    name = "webhook"
+
+    def __init__(self, concurrency: int, rate: float):
+        super().__init__(concurrency, rate)
+        self._client: httpx.AsyncClient | None = None
+        self._concurrency = concurrency
+
+    async def start(self):
+        limits = httpx.Limits(max_connections=self._concurrency, max_keepalive_connections=self._concurrency)
+        self._client = httpx.AsyncClient(
+            timeout=settings.WEBHOOK_TIMEOUT,
+            # Редирект мог бы увести запрос на внутренний адрес в обход check_webhook_url
+            follow_redirects=False,
+            transport=PinnedAddressTransport(limits=limits),
+        )
+
+    async def close(self):
+        if self._client:
+            await self._client.aclose()
+
+    def accepts(self, recipient) -> bool:
+        return bool(recipient.webhook_url)
+
+    async def send(self, recipient, notification):
+        try:
+            response = await self._client.post(recipient.webhook_url, json={
+                "id": notification.id,
+                "title": notification.title,
+                "message": notification.message,
+                "created_at": notification.created_at.isoformat(),
+            })
+        except UnsafeWebhookURL as e:
+            raise DeliveryError(str(e), retryable=False)
+        except (httpx.HTTPError, OSError) as e:
+            raise DeliveryError(str(e))
+        if response.status_code >= 500 or response.status_code == 429:
+            raise DeliveryError(f"HTTP {response.status_code}")
+        if response.status_code >= 400:
+            raise DeliveryError(f"HTTP {response.status_code}", retryable=False)
+
+
+def create_channels() -> dict[str, DeliveryChannel]:
+    return {
+        SMTPChannel.name: SMTPChannel(settings.SMTP_CONCURRENCY, settings.SMTP_RATE_LIMIT),
+        WebhookChannel.name: WebhookChannel(settings.WEBHOOK_CONCURRENCY, settings.WEBHOOK_RATE_LIMIT),
+    }
@@ -0,0 +1,165 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import argparse
+import asyncio
+import json
+import logging
+import signal
+import time
+
+import aio_pika
+from prometheus_client import start_http_server
+from sqlalchemy import select
+
+from app.core.config import settings
+from app.core.metrics import CONSUMER_LAG, aggregated_log
+from app.core.rabbitmq import NOTIFICATION_QUEUE_ARGUMENTS
+from app.models.base import AsyncSessionLocal, dispose_engines
+from app.models.notification import Notification
+from app.models.user import User
+from workers.channels import DeliveryChannel, create_channels
+
+
+def retry_queue_name(delay: int) -> str:
+    return f"{settings.NOTIFICATION_DELIVERY_QUEUE}.retry.{delay}"
+
+
+async def declare_delivery_queues(channel: aio_pika.abc.AbstractChannel) -> aio_pika.abc.AbstractQueue:
+    await channel.declare_queue(settings.NOTIFICATION_DEAD_LETTER_QUEUE, durable=True)
+    queue = await channel.declare_queue(settings.NOTIFICATION_DELIVERY_QUEUE, durable=True,
+                                        arguments=NOTIFICATION_QUEUE_ARGUMENTS)
+    # Отложенный повтор: у очереди нет потребителей, по истечении TTL сообщение возвращается в основную
+    for delay in settings.DELIVERY_RETRY_DELAYS:
+        await channel.declare_queue(retry_queue_name(delay), durable=True, arguments={
+            "x-message-ttl": delay * 1000,
+            "x-dead-letter-exchange": "",
+            "x-dead-letter-routing-key": settings.NOTIFICATION_DELIVERY_QUEUE,
+        })
+    return queue
+
+
+class DeliveryWorker:
+    """
+    Потребитель задач доставки: {"notification_id", "channel", "user_ids", "attempt"}.
+    Задачи обрабатываются параллельно (до prefetch), отправки ограничены лимитами канала.
+    Получатели с временной ошибкой уходят в отложенную очередь следующей попытки, после последней — в DLQ.
+    """
+
+    def __init__(self, channel: aio_pika.abc.AbstractChannel, channels: dict[str, DeliveryChannel]):
+        self._channel = channel
+        self._channels = channels
+        self._active = 0
+
+    async def drain(self):
+        """Дожидается задач, которые уже в работе (после отмены подписки)."""
+        while self._active:
+            await asyncio.sleep(0.1)
+
+    async def handle(self, message: aio_pika.abc.AbstractIncomingMessage):
+        self._active += 1
+        try:
+            await self._handle(message)
+        finally:
+            self._active -= 1
+
+    async def _handle(self, message: aio_pika.abc.AbstractIncomingMessage):
+        try:
+            task = json.loads(message.body)
+            delivery_channel = self._channels[task["channel"]]
+            user_ids = task["user_ids"]
+        except (ValueError, TypeError, KeyError):
+            logging.error(f"❌ Некорректная задача доставки, отправлена в {settings.NOTIFICATION_DEAD_LETTER_QUEUE}: "
+                          f"{message.body!r}")
+            await message.reject(requeue=False)
+            return
+
+        if message.timestamp:
+            CONSUMER_LAG.labels(settings.NOTIFICATION_DELIVERY_QUEUE) \
+                .observe(max(time.time() - message.timestamp.timestamp(), 0))
+
+        try:
+            async with AsyncSessionLocal() as db:
+                notification = await db.get(Notification, task["notification_id"])
+                # Подписка проверяется на момент отправки: отписавшиеся после fan-out писем не получат
+                recipients = (await db.execute(
+                    select(User.id, User.email, User.webhook_url)
+                    .where(User.id.in_(user_ids), User.receive_notifications == True)
+                )).all()
+
+            if notification is not None:
+                retry = await delivery_channel.deliver_many(recipients, notification)
+                if retry:
+                    await self._schedule_retry(task, [recipient.id for recipient in retry])
+        except Exception as e:
+            logging.error(f"❌ Ошибка при доставке уведомления {task['notification_id']}: {e}")
+            await message.nack(requeue=not message.redelivered)
+        else:
+            await message.ack()
+            aggregated_log.event(f"📤 Обработано задач доставки ({delivery_channel.name})")
+
+    async def _schedule_retry(self, task: dict, user_ids: list[int]):
+        attempt = task.get("attempt", 0)
+        delays = settings.DELIVERY_RETRY_DELAYS
+        if attempt < len(delays):
+            routing_key = retry_queue_name(delays[attempt])
+        else:
+            routing_key = settings.NOTIFICATION_DEAD_LETTER_QUEUE
+            logging.error(f"❌ Уведомление {task['notification_id']} ({task['channel']}) не доставлено "
+                          f"{len(user_ids)} получателям после {attempt + 1} попыток")
+
+        await self._channel.default_exchange.publish(
+            aio_pika.Message(body=json.dumps({**task, "user_ids": user_ids, "attempt": attempt + 1}).encode(),
+                             delivery_mode=aio_pika.DeliveryMode.PERSISTENT, timestamp=time.time()),
+            routing_key=routing_key,
+        )
+
+
+async def consume(prefetch: int):
+    connection = await aio_pika.connect_robust(settings.RABBITMQ_URL)
+    # Подтверждения брокера: задача подтверждается только после того, как повтор точно поставлен в очередь
+    channel = await connection.channel(publisher_confirms=True)
+    await channel.set_qos(prefetch_count=prefetch)
+    queue = await declare_delivery_queues(channel)
+
+    channels = create_channels()
+    for delivery_channel in channels.values():
+        await delivery_channel.start()
+
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(signum, stopping.set)
+
+    worker = DeliveryWorker(channel, channels)
+    consumer_tag = await queue.consume(worker.handle)
+    logging.info("🎧 Ожидание задач доставки...")
+    await stopping.wait()
+
+    logging.info("🛑 Остановка доставки...")
+    await queue.cancel(consumer_tag)
+    await worker.drain()
+    for delivery_channel in channels.values():
+        await delivery_channel.close()
+    await connection.close()
+    await dispose_engines()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Воркер доставки уведомлений по email и webhook")
+    parser.add_argument("--prefetch", type=int, default=settings.DELIVERY_PREFETCH,
+                        help="задач доставки в работе одновременно")
+    parser.add_argument("--metrics-port", type=int, default=settings.DELIVERY_METRICS_PORT,
+                        help="порт метрик Prometheus, 0 — без метрик")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(process)d - %(levelname)s - %(message)s", force=True)
+    if args.metrics_port:
+        start_http_server(args.metrics_port)
+
+    asyncio.run(consume(args.prefetch))
+
+
+if __name__ == "__main__":
+    main()
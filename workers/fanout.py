@@ -0,0 +1,106 @@
+from sqlalchemy import select, literal, exists, and_
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models.base import insert_ignore
+from app.models.user import User
+from app.models.notification import user_notifications
+from app.models.segment import Segment, segment_members, user_tags
+
+
+def _insert_ignore(db: Session):
+    """INSERT в user_notifications, который пропускает уже существующие связи."""
+    return insert_ignore(user_notifications, db.get_bind().dialect.name)
+
+
+def subscribers_query(user_id_range: tuple[int, int] | None = None, audience: dict | None = None):
+    """
+    id подписанных пользователей из аудитории уведомления (None — все подписчики);
+    user_id_range — диапазон id [start, end] включительно.
+    Каждое условие аудитории — полусоединение по индексу, выбираются только id.
+    """
+    query = select(User.id).where(User.receive_notifications == True)
+    if user_id_range is not None:
+        query = query.where(User.id.between(*user_id_range))
+
+    audience = audience or {}
+    if audience.get("user_ids") is not None:
+        query = query.where(User.id.in_(audience["user_ids"]))
+    if audience.get("segment") is not None:
+        query = query.where(User.id.in_(
+            select(segment_members.c.user_id)
+            .join(Segment, Segment.id == segment_members.c.segment_id)
+            .where(Segment.name == audience["segment"])
+        ))
+    if audience.get("tags") is not None:
+        query = query.where(User.id.in_(select(user_tags.c.user_id).where(user_tags.c.tag.in_(audience["tags"]))))
+    return query
+
+
+def iter_subscriber_ids(db: Session, user_id_range: tuple[int, int] | None = None, audience: dict | None = None,
+                        batch_size: int = 1000):
+    """Потоково отдаёт id получателей (серверный курсор), не загружая их все в память."""
+    result = db.execute(
+        subscribers_query(user_id_range, audience).execution_options(yield_per=batch_size, stream_results=True)
+    )
+    for partition in result.scalars().partitions():
+        yield from partition
+
+
+def _subscriber_ids(notification_id: int, user_id_range: tuple[int, int] | None = None, audience: dict | None = None):
+    # Подписчики, у которых ещё нет связи с уведомлением (повторная доставка ничего не дублирует)
+    already_linked = exists().where(and_(
+        user_notifications.c.user_id == User.id,
+        user_notifications.c.notification_id == notification_id,
+    ))
+    return subscribers_query(user_id_range, audience).where(~already_linked)
+
+
+def fan_out_insert_select(db: Session, notification_id: int, user_id_range: tuple[int, int] | None = None,
+                          commit: bool = True, audience: dict | None = None) -> int:
+    """Создаёт все связи одним INSERT ... SELECT на стороне БД и одним коммитом."""
+    subscribers = _subscriber_ids(notification_id, user_id_range, audience).add_columns(literal(notification_id))
+    stmt = _insert_ignore(db).from_select(["user_id", "notification_id"], subscribers)
+    result = db.execute(stmt)
+    if commit:
+        db.commit()
+    return max(result.rowcount, 0)
+
+
+def fan_out_in_batches(db: Session, notification_id: int, batch_size: int,
+                       user_id_range: tuple[int, int] | None = None, audience: dict | None = None) -> int:
+    """Создаёт связи пачками по batch_size пользователей, один коммит на пачку."""
+    stmt = _insert_ignore(db)
+    last_id = user_id_range[0] - 1 if user_id_range else 0
+    inserted = 0
+
+    while True:
+        # Keyset-пагинация по users.id: каждая пачка — диапазонное чтение по первичному ключу
+        user_ids = db.execute(
+            _subscriber_ids(notification_id, user_id_range, audience)
+            .where(User.id > last_id).order_by(User.id).limit(batch_size)
+        ).scalars().all()
+        if not user_ids:
+            break
+
+        db.execute(stmt, [{"user_id": user_id, "notification_id": notification_id} for user_id in user_ids])
+        db.commit()
+
+        inserted += len(user_ids)
+        last_id = user_ids[-1]
+
+    return inserted
+
+
+def fan_out(db: Session, notification_id: int, batch_size: int | None = None,
+            user_id_range: tuple[int, int] | None = None, audience: dict | None = None) -> int:
+    """
+    Привязывает уведомление к подписчикам из аудитории (и диапазона id) и возвращает число созданных связей.
+    batch_size <= 0 — один INSERT ... SELECT, иначе пачки с коммитом на каждую.
+    """
+    if batch_size is None:
+        batch_size = settings.FANOUT_BATCH_SIZE
+
+    if batch_size <= 0:
+        return fan_out_insert_select(db, notification_id, user_id_range, audience=audience)
+    return fan_out_in_batches(db, notification_id, batch_size, user_id_range, audience)
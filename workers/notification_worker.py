@@ -2,65 +2,402 @@ import sys
 import os
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
+import argparse
 import json
+import multiprocessing
+import signal
+import time
+from collections import defaultdict, deque
+from datetime import datetime
 import pika
 import logging
-from app.models.user import User
-from app.models.notification import Notification, user_notifications
+from prometheus_client import start_http_server
+from app.core.config import settings
+from app.core.envelope import SNAPSHOT_FIELDS, EnvelopeError, decode_tasks, encode_tasks, has_snapshot
+from app.core.metrics import CONSUMER_LAG, FANOUT_ROWS, FANOUT_LATENCY, RABBITMQ_PUBLISH_LATENCY, aggregated_log
+from app.models.notification import Notification, NotificationShard
 from sqlalchemy.orm import Session
 from app.models.base import get_db, SessionLocal
+from app.core.inbox_cache import inbox_cache
+from app.core.push import publish_notification, publish_broadcast
+from app.core.rabbitmq import NOTIFICATION_QUEUE_ARGUMENTS, NOTIFICATION_PRIORITIES, lane_queue
+from workers.fanout import iter_subscriber_ids
+from workers.sharding import plan_shards, process_shard, mark_shard_done
 
-def process_notification(message, db: Session):
-    # Получаем уведомление из базы по ID
-    notification = db.query(Notification).filter(Notification.id == message['notification_id']).first()
+def load_notification(message: dict, db: Session) -> Notification | None:
+    """
+    Уведомление задачи: из снимка в сообщении — без запроса к БД (уведомление после создания не меняется),
+    из notifications — для задач прежних издателей без снимка.
+    Объект из снимка не добавляется в сессию и нужен только для чтения.
+    """
+    if not has_snapshot(message):
+        return db.get(Notification, message["notification_id"])
+    return Notification(
+        id=message["notification_id"], title=message["title"], message=message["message"],
+        created_at=datetime.fromisoformat(message["created_at"]), audience=message["audience"],
+        channels=message["channels"], delivery=message["delivery"], priority=message["priority"],
+    )
+
+
+def process_notification(message, db: Session) -> list[tuple[str, dict]]:
+    """
+    Планирует рассылку: делит подписчиков на части по диапазонам users.id.
+    Единственную часть обрабатывает сразу, иначе возвращает подзадачи (очередь, сообщение) для очереди частей
+    той же полосы приоритета.
+    """
+    notification = load_notification(message, db)
 
     if not notification:
         logging.error(f"❌ Уведомление с ID {message['notification_id']} не найдено")
-        return
+        return []
+
+    shards = plan_shards(db, notification.id, settings.FANOUT_SHARD_SIZE, notification.audience)
+
+    if not shards:
+        logging.info("⚠️ Нет подписанных пользователей в аудитории уведомления.")
+        return []
+
+    if len(shards) == 1:
+        return handle_shard(db, notification, shards[0])
+
+    logging.info(f"🧩 Уведомление {notification.id} разбито на {len(shards)} частей")
+    # Снимок уведомления переходит в задачи частей: их обработчик тоже не читает notifications
+    shard_queue = lane_queue(settings.NOTIFICATION_SHARD_QUEUE, notification.priority)
+    snapshot = {field: message.get(field) for field in SNAPSHOT_FIELDS} if has_snapshot(message) else {}
+    return [(shard_queue, {**snapshot, "notification_id": notification.id, "shard_no": shard.shard_no})
+            for shard in shards]
+
+
+def process_shard_message(message, db: Session) -> list[tuple[str, dict]]:
+    notification = load_notification(message, db)
+    shard = db.get(NotificationShard, (message["notification_id"], message["shard_no"]))
+
+    if not notification or not shard:
+        logging.error(f"❌ Часть {message.get('shard_no')} уведомления {message['notification_id']} не найдена")
+        return []
+
+    return handle_shard(db, notification, shard)
+
+
+def handle_shard(db: Session, notification: Notification, shard: NotificationShard) -> list[tuple[str, dict]]:
+    """
+    Обрабатывает часть и возвращает её задачи доставки. Отметка delivery_published ставится в сессии
+    без коммита: make_callback фиксирует её только после публикации задач, поэтому повторная доставка
+    сообщения после сбоя не публикует задачи (и не рассылает письма и webhook) второй раз.
+    """
+    if shard.delivery_published:
+        logging.info(f"⏭️ Задачи части {shard.shard_no} уведомления {notification.id} уже опубликованы")
+        return []
+
+    if shard.done_at is None:
+        tasks = deliver_shard(db, notification, shard)
+    else:
+        # Часть уже обработана, но её задачи не опубликованы (сбой до публикации): повторяем только задачи доставки
+        tasks = delivery_tasks(db, notification, shard)
+
+    if notification.delivery == "broadcast" and shard.shard_no == 0:
+        # Общая рассылка объявляется один раз, вместе с задачами первой части: в кеш входящих — одна запись,
+        # push — одно сообщение. Остальные части нужны только для задач доставки по внешним каналам
+        inbox_cache.add_broadcast(notification)
+        publish_broadcast(notification)
+
+    shard.delivery_published = True
+    return tasks
+
+
+def delivery_tasks(db: Session, notification: Notification, shard: NotificationShard,
+                   user_ids: list[int] | None = None) -> list[tuple[str, dict]]:
+    """Задачи доставки по внешним каналам уведомления: по DELIVERY_BATCH_SIZE получателей части в каждой."""
+    if not notification.channels:
+        return []
+
+    tasks = []
+    if user_ids is None:
+        user_ids = list(iter_subscriber_ids(db, (shard.start_user_id, shard.end_user_id), notification.audience))
+    for start in range(0, len(user_ids), settings.DELIVERY_BATCH_SIZE):
+        batch = user_ids[start:start + settings.DELIVERY_BATCH_SIZE]
+        tasks.extend(
+            (settings.NOTIFICATION_DELIVERY_QUEUE,
+             {"notification_id": notification.id, "channel": channel, "user_ids": batch, "attempt": 0})
+            for channel in notification.channels
+        )
+    return tasks
+
+
+def deliver_shard(db: Session, notification: Notification, shard: NotificationShard) -> list[tuple[str, dict]]:
+    broadcast = notification.delivery == "broadcast"
+    started = time.perf_counter()
+    if broadcast:
+        # Fan-out при чтении: связи не создаются, часть нужна только для задач доставки по внешним каналам
+        linked = 0
+        mark_shard_done(db, shard)
+    else:
+        # Привязываем уведомление к получателям диапазона одним набором запросов на стороне БД
+        linked = process_shard(db, shard, notification.audience)
+    elapsed = time.perf_counter() - started
+    FANOUT_ROWS.inc(linked)
+    FANOUT_LATENCY.observe(elapsed)
+
+    # Получатели части читаются один раз: для кеша входящих, push подключённым клиентам и задач доставки
+    user_ids = []
+    if notification.channels or (not broadcast and (inbox_cache.enabled or settings.PUSH_ENABLED)):
+        user_id_range = (shard.start_user_id, shard.end_user_id)
+        user_ids = list(iter_subscriber_ids(db, user_id_range, notification.audience))
+
+    if not broadcast:
+        # Дописываем уведомление в закешированные входящие подписчиков (write-through)
+        if inbox_cache.enabled:
+            inbox_cache.push(notification, user_ids)
+        publish_notification(notification, user_ids)
+
+    logging.info(f"✅ Уведомление {notification.id}, часть {shard.shard_no} "
+                 f"(users.id {shard.start_user_id}–{shard.end_user_id}): добавлено {linked} пользователям "
+                 f"за {elapsed:.2f} с ({linked / elapsed if elapsed else 0:.0f} строк/с)")
+
+    return delivery_tasks(db, notification, shard, user_ids)
+
+
+def make_callback(handler):
+    """
+    Обёртка обработчика сообщений: разбор конверта задач, публикация подзадач, ack после успешного коммита.
+    Задачи конверта обрабатываются по очереди, каждая в своей сессии. Если упала только часть задач конверта,
+    они публикуются заново отдельными сообщениями, а конверт подтверждается — обработанные задачи не повторяются.
+    """
+
+    def publish(ch, routing_key: str, body: bytes, content_type: str | None = None):
+        with RABBITMQ_PUBLISH_LATENCY.labels(routing_key).time():
+            ch.basic_publish(exchange="", routing_key=routing_key, body=body,
+                             properties=pika.BasicProperties(delivery_mode=pika.DeliveryMode.Persistent,
+                                                             content_type=content_type,
+                                                             timestamp=int(time.time())))
+
+    def callback(ch, method, properties, body):
+        try:
+            tasks = decode_tasks(body, properties.content_type)
+        except EnvelopeError as e:
+            # Сообщение, которое никогда не удастся обработать, сразу уходит в dead-letter очередь
+            logging.error(f"❌ Некорректное сообщение ({e}), отправлено в {settings.NOTIFICATION_DEAD_LETTER_QUEUE}: "
+                          f"{body[:200]!r}")
+            ch.basic_nack(delivery_tag=method.delivery_tag, requeue=False)
+            return
+
+        # Задержка в очереди — по времени публикации, которое проставляет издатель
+        if properties.timestamp:
+            CONSUMER_LAG.labels(method.routing_key).observe(max(time.time() - properties.timestamp, 0))
+
+        failed = []
+        for task in tasks:
+            aggregated_log.event("📩 Получено задач для обработки")
+            # Создаём сессию для работы с базой данных
+            db = SessionLocal()
+            try:
+                for routing_key, subtask in handler(task, db):
+                    publish(ch, routing_key, json.dumps(subtask).encode())
+                # Изменения, которые обработчик оставил без коммита, фиксируются только после публикации подзадач
+                db.commit()
+            except Exception as e:
+                logging.error(f"❌ Ошибка при обработке уведомления {task['notification_id']}: {e}")
+                failed.append(task)
+            finally:
+                db.close()  # Закрываем сессию после обработки
+
+        if not failed:
+            # Подтверждаем только после успешного коммита: при падении воркера сообщение вернётся в очередь
+            ch.basic_ack(delivery_tag=method.delivery_tag)
+        elif len(tasks) == 1:
+            # Первая ошибка — возвращаем в очередь, повторная — в dead-letter очередь
+            ch.basic_nack(delivery_tag=method.delivery_tag, requeue=not method.redelivered)
+        else:
+            for task in failed:
+                publish(ch, method.routing_key, *encode_tasks([task]))
+            ch.basic_ack(delivery_tag=method.delivery_tag)
+
+    return callback
+
+
+callback = make_callback(process_notification)
+shard_callback = make_callback(process_shard_message)
+
+
+def declare_notification_queues(channel):
+    channel.queue_declare(queue=settings.NOTIFICATION_DEAD_LETTER_QUEUE, durable=True)
+    for priority in NOTIFICATION_PRIORITIES:
+        for queue in (settings.NOTIFICATION_QUEUE, settings.NOTIFICATION_SHARD_QUEUE):
+            channel.queue_declare(queue=lane_queue(queue, priority), durable=True,
+                                  arguments=NOTIFICATION_QUEUE_ARGUMENTS)
+    channel.queue_declare(queue=settings.NOTIFICATION_DELIVERY_QUEUE, durable=True,
+                          arguments=NOTIFICATION_QUEUE_ARGUMENTS)
+
+
+def notification_lanes() -> dict[str, list[tuple[str, callable]]]:
+    """Очереди каждой полосы приоритета с обработчиками: сначала планирование, затем части рассылки."""
+    return {
+        priority: [(lane_queue(settings.NOTIFICATION_QUEUE, priority), callback),
+                   (lane_queue(settings.NOTIFICATION_SHARD_QUEUE, priority), shard_callback)]
+        for priority in NOTIFICATION_PRIORITIES
+    }
+
+
+class LaneSelector:
+    """
+    Порядок полос приоритета перед каждым сообщением.
+    - high всегда первая: срочное уведомление ждёт не дольше обработки одного текущего сообщения
+      процессом, сколько бы рассылок ни накопилось в других полосах.
+    - Остальные полосы чередуются взвешенным round robin (smooth WRR): пока сообщения есть в обеих,
+      на weights["normal"] сообщений normal приходится weights["low"] сообщений low — low не голодает.
+    - Если выбранная полоса пуста, сообщение берётся из следующей.
+    """
+
+    def __init__(self, weights: dict[str, int]):
+        self._weights = weights
+        self._current = dict.fromkeys(weights, 0)
+
+    def order(self) -> list[str]:
+        total = sum(self._weights.values())
+        for priority, weight in self._weights.items():
+            self._current[priority] += weight
+        chosen = max(self._current, key=self._current.get)
+        self._current[chosen] -= total
+        rest = sorted((priority for priority in self._weights if priority != chosen), key=self._weights.get,
+                      reverse=True)
+        return ["high", chosen, *rest]
+
+
+class LaneBuffer:
+    """
+    Сообщения, которые брокер уже доставил подпискам полос, но процесс ещё не обработал.
+    - Каждая полоса — отдельный канал с подписками (basic_consume) и своим prefetch: брокер сам присылает
+      сообщения, пустые очереди не опрашиваются. Callback подписки только кладёт сообщение в буфер полосы.
+    - process_next обрабатывает одно сообщение, выбирая полосу по LaneSelector: в буфере не больше prefetch
+      сообщений на очередь, поэтому срочное не ждёт, пока обработаются доставленные раньше него обычные.
+    """
+
+    def __init__(self, selector: LaneSelector):
+        self._selector = selector
+        self._lanes: dict[str, deque] = defaultdict(deque)
+
+    def __len__(self) -> int:
+        return sum(len(lane) for lane in self._lanes.values())
+
+    def subscriber(self, priority: str, handler):
+        def on_message(ch, method, properties, body):
+            self._lanes[priority].append((handler, ch, method, properties, body))
+        return on_message
+
+    def process_next(self) -> str | None:
+        """Обрабатывает одно сообщение; возвращает его полосу или None, если буфер пуст."""
+        if not len(self):
+            return None
+        for priority in self._selector.order():
+            if self._lanes[priority]:
+                handler, ch, method, properties, body = self._lanes[priority].popleft()
+                handler(ch, method, properties, body)
+                return priority
+        return None
+
+
+def subscribe_lanes(open_channel, buffer: LaneBuffer, prefetch: int) -> list:
+    """Открывает по каналу на полосу с prefetch неподтверждённых сообщений на очередь и подписывает их на очереди."""
+    channels = []
+    for priority, queues in notification_lanes().items():
+        lane_channel = open_channel()
+        lane_channel.basic_qos(prefetch_count=prefetch)
+        for queue, handler in queues:
+            lane_channel.basic_consume(queue=queue, on_message_callback=buffer.subscriber(priority, handler))
+        channels.append(lane_channel)
+    return channels
+
+
+def consume(prefetch: int, metrics_port: int = 0):
+    """Один процесс-потребитель очередей задач (планирование) и частей рассылки всех полос приоритета."""
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(process)d - %(levelname)s - %(message)s", force=True)
+
+    # У каждого процесса свои метрики и свой порт
+    if metrics_port:
+        start_http_server(metrics_port)
+        logging.info(f"📈 Метрики Prometheus на порту {metrics_port}")
+
+    # Подключение к RabbitMQ
+    connection = pika.BlockingConnection(pika.ConnectionParameters(
+        host=settings.RABBITMQ_HOST,
+        port=settings.RABBITMQ_PORT,
+        credentials=pika.PlainCredentials(settings.RABBITMQ_USER, settings.RABBITMQ_PASSWORD),
+    ))
+    channel = connection.channel()
+
+    # Декларация очередей (те же параметры, что и у издателя в API)
+    declare_notification_queues(channel)
+
+    buffer = LaneBuffer(LaneSelector(settings.NOTIFICATION_PRIORITY_WEIGHTS))
+    subscribe_lanes(connection.channel, buffer, prefetch)
+    stopping = False
+
+    # SIGTERM/SIGINT: дорабатываем текущее сообщение и выходим
+    def shutdown(signum, frame):
+        nonlocal stopping
+        logging.info("🛑 Остановка потребителя...")
+        stopping = True
+
+    signal.signal(signal.SIGTERM, shutdown)
+    signal.signal(signal.SIGINT, shutdown)
 
-    # Получаем пользователей, которые подписаны на уведомления
-    users = db.query(User).filter(User.receive_notifications == True).all()
+    logging.info("🎧 Ожидание уведомлений для обработки...")
+    while not stopping:
+        # Принимаем доставленные сообщения перед выбором следующего: так срочное обгоняет буфер обычных.
+        # Если буфер пуст, ждём доставки до секунды (ожидание без запросов к брокеру, затем проверка остановки)
+        connection.process_data_events(time_limit=0 if len(buffer) else 1)
+        buffer.process_next()
+    # Необработанные сообщения из буфера брокер вернёт в очереди при закрытии соединения
+    connection.close()
 
-    if not users:
-        logging.info("⚠️ Нет пользователей с активными уведомлениями.")
-        return
 
-    # Отправка уведомлений пользователям
-    for user in users:
-        logging.info(
-            f"📩 Отправляем уведомление пользователю {user.username} ({user.email}): {notification.title} - {notification.message}")
+def main():
+    parser = argparse.ArgumentParser(description="Воркер рассылки уведомлений")
+    parser.add_argument("-p", "--processes", type=int, default=settings.WORKER_PROCESSES,
+                        help="число процессов-потребителей")
+    parser.add_argument("--prefetch", type=int, default=settings.WORKER_PREFETCH,
+                        help="неподтверждённых сообщений на очередь в процессе")
+    parser.add_argument("--metrics-port", type=int, default=settings.WORKER_METRICS_PORT,
+                        help="порт метрик первого процесса (у i-го — порт + i), 0 — без метрик")
+    args = parser.parse_args()
 
-        # Добавляем связь между пользователем и уведомлением
-        user_notification = user_notifications.insert().values(user_id=user.id, notification_id=notification.id)
-        db.execute(user_notification)
-        db.commit()
-        logging.info(f"✅ Связь пользователя {user.username} с уведомлением добавлена в таблицу")
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(process)d - %(levelname)s - %(message)s", force=True)
 
+    context = multiprocessing.get_context("spawn")
+    processes: list = []
+    stopping = False
 
-def callback(ch, method, properties, body):
-    message = json.loads(body)
-    logging.info(f"📩 Получено уведомление для обработки: {message}")
+    def start_process(index: int):
+        metrics_port = args.metrics_port + index if args.metrics_port else 0
+        process = context.Process(target=consume, args=(args.prefetch, metrics_port), daemon=False)
+        process.start()
+        return process
 
-    # Создаём сессию для работы с базой данных
-    db = SessionLocal()
+    def shutdown(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for process in processes:
+            if process.is_alive():
+                os.kill(process.pid, signal.SIGTERM)
 
-    try:
-        process_notification(message, db)
-    except Exception as e:
-        logging.error(f"❌ Ошибка при обработке уведомления: {e}")
-    finally:
-        db.close()  # Закрываем сессию после обработки
+    signal.signal(signal.SIGTERM, shutdown)
+    signal.signal(signal.SIGINT, shutdown)
 
+    processes.extend(start_process(index) for index in range(args.processes))
+    logging.info(f"🚀 Запущено потребителей: {args.processes}, prefetch={args.prefetch}")
 
-# Подключение к RabbitMQ
-connection = pika.BlockingConnection(pika.ConnectionParameters(host="localhost"))
-channel = connection.channel()
+    # Перезапускаем упавшие процессы, пока не пришёл сигнал остановки
+    while not stopping:
+        for i, process in enumerate(processes):
+            if not process.is_alive() and not stopping:
+                logging.error(f"⚠️ Потребитель {process.pid} завершился с кодом {process.exitcode}, перезапуск")
+                processes[i] = start_process(i)
+        time.sleep(1)
 
-# Декларация очереди
-channel.queue_declare(queue="notification_tasks")
+    for process in processes:
+        process.join()
+    logging.info("✅ Все потребители остановлены")
 
-# Подписка на очередь
-channel.basic_consume(queue="notification_tasks", on_message_callback=callback, auto_ack=True)
 
-logging.info("🎧 Ожидание уведомлений для обработки...")
-channel.start_consuming()
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+from sqlalchemy import select, update, func
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models import User
+from app.models.notification import NotificationShard
+from workers.fanout import fan_out_insert_select, fan_out_in_batches, subscribers_query
+
+
+def plan_shards(db: Session, notification_id: int, shard_size: int, audience: dict | None = None) -> list[NotificationShard]:
+    """
+    Разбивает рассылку на диапазоны users.id по shard_size и возвращает части, задачи которых ещё не опубликованы.
+    Диапазон берётся по id получателей из аудитории, поэтому узкий сегмент даёт мало частей.
+    Для явного списка user_ids (не больше 10000) части режут сам список получателей по shard_size id:
+    разреженные id вроде [1, 10_000_000] не порождают тысячи пустых диапазонов.
+    План сохраняется в notification_shards, поэтому повторная доставка задачи не создаёт его заново.
+    """
+    shards = db.execute(
+        select(NotificationShard)
+        .where(NotificationShard.notification_id == notification_id)
+        .order_by(NotificationShard.shard_no)
+    ).scalars().all()
+
+    if not shards:
+        if audience and audience.get("user_ids") is not None:
+            ranges = explicit_ranges(db, shard_size, audience)
+        else:
+            ranges = id_ranges(db, shard_size, audience)
+        if not ranges:
+            return []
+
+        shards = [
+            NotificationShard(notification_id=notification_id, shard_no=shard_no, start_user_id=start,
+                              end_user_id=end, linked=0)
+            for shard_no, (start, end) in enumerate(ranges)
+        ]
+        db.add_all(shards)
+        db.commit()
+
+    return [shard for shard in shards if not shard.delivery_published]
+
+
+def id_ranges(db: Session, shard_size: int, audience: dict | None) -> list[tuple[int, int]]:
+    # min/max id получателей — чтения индексов (частичный индекс подписчиков, сегмента или тегов)
+    recipients = subscribers_query(audience=audience).subquery()
+    min_id, max_id = db.execute(select(func.min(recipients.c.id), func.max(recipients.c.id))).one()
+    if min_id is None:
+        return []
+
+    step = shard_size if shard_size > 0 else max_id - min_id + 1
+    return [(start, min(start + step - 1, max_id)) for start in range(min_id, max_id + 1, step)]
+
+
+def explicit_ranges(db: Session, shard_size: int, audience: dict) -> list[tuple[int, int]]:
+    # Получателей не больше длины списка: их id читаются целиком и режутся на части по shard_size
+    user_ids = db.execute(subscribers_query(audience=audience).order_by(User.id)).scalars().all()
+    step = shard_size if shard_size > 0 else max(len(user_ids), 1)
+    return [(chunk[0], chunk[-1]) for chunk in (user_ids[i:i + step] for i in range(0, len(user_ids), step))]
+
+
+def process_shard(db: Session, shard: NotificationShard, audience: dict | None = None) -> int:
+    """Создаёт связи для диапазона пользователей части и отмечает её выполненной."""
+    user_id_range = (shard.start_user_id, shard.end_user_id)
+    if settings.FANOUT_BATCH_SIZE > 0:
+        linked = fan_out_in_batches(db, shard.notification_id, settings.FANOUT_BATCH_SIZE, user_id_range, audience)
+    else:
+        # Связи и отметка о выполнении попадают в один коммит
+        linked = fan_out_insert_select(db, shard.notification_id, user_id_range, commit=False, audience=audience)
+
+    mark_shard_done(db, shard, linked)
+    return linked
+
+
+def mark_shard_done(db: Session, shard: NotificationShard, linked: int = 0):
+    db.execute(
+        update(NotificationShard)
+        .where(NotificationShard.notification_id == shard.notification_id,
+               NotificationShard.shard_no == shard.shard_no,
+               NotificationShard.done_at.is_(None))
+        .values(linked=linked, done_at=func.now())
+    )
+    db.commit()